@@ -0,0 +1,201 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+
+class ActivityLogWriter:
+    """Bounded in-process queue that bulk-inserts ActivityLog rows from a background thread.
+
+    Rows are flushed when a batch fills up or when the oldest queued row has
+    waited flush_interval seconds, so readers see entries within that delay.
+    A batch that fails to insert is retried with backoff; if it still fails,
+    its rows are inserted one at a time so a single bad row or a short outage
+    does not lose the rest of the batch.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval=1.0, retries=4, retry_backoff=0.5):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue = None
+        self._thread = None
+        self._app = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'enqueued': 0,
+            'written': 0,
+            'failed': 0,
+            'retries': 0,
+            'row_fallbacks': 0,
+            'overflow': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the flusher thread and register the flush-on-shutdown hook"""
+        if self.running:
+            return
+        self._app = app
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, row):
+        """Queue an ActivityLog row (a dict of column values).
+
+        Returns False when the writer is not running or the queue is full; the
+        caller is then expected to write the row itself.
+        """
+        if not self.running or self._stopping.is_set():
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._metrics['overflow'] += 1
+            return False
+        with self._lock:
+            self._metrics['enqueued'] += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        if not self.running:
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def stop(self, timeout=10.0):
+        """Drain the queue and stop the flusher thread"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            elif self._stopping.is_set():
+                return
+
+    def _collect_batch(self):
+        """Wait for the first row, then gather more until the batch is full or the interval elapses"""
+        try:
+            first = self._queue.get(timeout=0.1 if self._stopping.is_set() else self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = 0 if self._stopping.is_set() else deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows):
+        """Insert rows in one transaction; raises if the transaction fails"""
+        from app import db
+        from models import ActivityLog
+
+        with self._app.app_context():
+            try:
+                db.session.execute(db.insert(ActivityLog), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        written, failed = self._write_with_retries(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            m = self._metrics
+            m['written'] += written
+            m['failed'] += failed
+            m['batches'] += 1
+            m['last_batch_size'] = len(batch)
+            m['max_batch_size'] = max(m['max_batch_size'], len(batch))
+            m['last_flush_ms'] = round(elapsed_ms, 2)
+            m['max_flush_ms'] = round(max(m['max_flush_ms'], elapsed_ms), 2)
+            m['total_flush_ms'] += elapsed_ms
+
+    def _write_with_retries(self, batch):
+        """Insert a batch, retrying with backoff and then row by row; returns (written, failed)"""
+        for attempt in range(self.retries + 1):
+            try:
+                self._insert(batch)
+                return len(batch), 0
+            except Exception as e:
+                if attempt == self.retries:
+                    logging.error("Failed to write %d activity log rows after %d attempts, writing them one by one: %s",
+                                  len(batch), attempt + 1, e)
+                    break
+                wait = min(10.0, self.retry_backoff * 2 ** attempt)
+                logging.warning("Failed to write %d activity log rows, retrying in %.1fs: %s", len(batch), wait, e)
+                with self._lock:
+                    self._metrics['retries'] += 1
+                time.sleep(wait)
+
+        with self._lock:
+            self._metrics['row_fallbacks'] += 1
+        written = failed = 0
+        for row in batch:
+            try:
+                self._insert([row])
+                written += 1
+            except Exception as e:
+                # Logged in full so the audit entry can still be recovered from the application log
+                logging.error("Dropped activity log row %r: %s", row, e)
+                failed += 1
+        return written, failed
+
+    def stats(self):
+        """Backpressure metrics for the metrics endpoint"""
+        with self._lock:
+            m = dict(self._metrics)
+        batches = m.pop('batches')
+        total_flush_ms = m.pop('total_flush_ms')
+        m.update({
+            'running': self.running,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'max_queue': self.max_queue,
+            'batch_size': self.batch_size,
+            'flush_interval_seconds': self.flush_interval,
+            'batches': batches,
+            'avg_batch_size': round((m['written'] + m['failed']) / batches, 2) if batches else 0.0,
+            'avg_flush_ms': round(total_flush_ms / batches, 2) if batches else 0.0,
+        })
+        return m
+
+
+# Global writer instance
+activity_writer = ActivityLogWriter()
@@ -4,6 +4,7 @@ from flask_login import current_user
 from app import app, db
 from auth import require_super_admin, require_admin
 from models import AdminUser
+from session_users import session_user_cache
 import logging
 
 @app.route('/admin/manage_admins')
@@ -94,6 +95,7 @@ def update_admin(admin_id):
         admin_user.active = active
         
         db.session.commit()
+        session_user_cache.invalidate(admin_user.id)
         flash(f'User "{admin_user.username}" updated successfully', 'success')
         logging.info(f"Admin user updated: {admin_user.username} by {current_user.username}")
         
@@ -124,8 +126,10 @@ def delete_admin(admin_id):
     
     try:
         username = admin_user.username
+        admin_id = admin_user.id
         db.session.delete(admin_user)
         db.session.commit()
+        session_user_cache.invalidate(admin_id)
         flash(f'User "{username}" deleted successfully', 'success')
         logging.info(f"Admin user deleted: {username} by {current_user.username}")
         
@@ -150,6 +154,7 @@ def reset_admin_password(admin_id):
     try:
         admin_user.set_password(new_password)
         db.session.commit()
+        session_user_cache.invalidate(admin_user.id)
         flash(f'Password reset for "{admin_user.username}"', 'success')
         logging.info(f"Password reset for admin user: {admin_user.username} by {current_user.username}")
         
@@ -1,12 +1,13 @@
+from startup import startup_timer, ensure_schema  # first, so the import phase is timed
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 import os
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
+from log_pipeline import log_pipeline, parse_logger_settings
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+startup_timer.mark('imports')
 
 class Base(DeclarativeBase):
     pass
@@ -26,6 +27,112 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
 }
 
+# CSV imports are inserted and committed in chunks of this many rows
+app.config["IMPORT_CHUNK_SIZE"] = int(os.environ.get("IMPORT_CHUNK_SIZE", 500))
+
+# Parsed uploads kept between /admin/analyze_csv and /admin/import_csv
+app.config["IMPORT_SESSION_TTL"] = int(os.environ.get("IMPORT_SESSION_TTL", 900))
+app.config["IMPORT_SESSION_MAX_ROWS"] = int(os.environ.get("IMPORT_SESSION_MAX_ROWS", 200000))
+
+# Imports run as background jobs: uploads are spooled to IMPORT_JOB_FOLDER and processed
+# in checkpointed chunks; a job whose worker stops heartbeating is resumed by another
+app.config["IMPORT_JOBS_ENABLED"] = os.environ.get("IMPORT_JOBS_ENABLED", "true").lower() == "true"
+app.config["IMPORT_JOB_FOLDER"] = os.environ.get("IMPORT_JOB_FOLDER", "import_jobs")
+app.config["IMPORT_JOB_POLL_INTERVAL"] = float(os.environ.get("IMPORT_JOB_POLL_INTERVAL", 5.0))
+app.config["IMPORT_JOB_STALE_SECONDS"] = int(os.environ.get("IMPORT_JOB_STALE_SECONDS", 120))
+
+# Uploaded pictures get their gate size during the request; this many workers write the thumbnails
+app.config["PICTURE_WORKERS"] = int(os.environ.get("PICTURE_WORKERS", 2))
+
+# QR images for imports are rendered in a process pool (QR_WORKERS defaults to the CPU count)
+app.config["QR_WORKERS"] = int(os.environ["QR_WORKERS"]) if os.environ.get("QR_WORKERS") else None
+app.config["QR_PARALLEL_THRESHOLD"] = int(os.environ.get("QR_PARALLEL_THRESHOLD", 32))
+
+# QR images are rendered on demand by /qr/<badge>; set QR_PREGENERATE to also write PNGs on add/import
+app.config["QR_PREGENERATE"] = os.environ.get("QR_PREGENERATE", "false").lower() in ("1", "true", "yes")
+app.config["QR_CACHE_FOLDER"] = os.environ.get("QR_CACHE_FOLDER", "static/qr_cache")
+app.config["QR_CACHE_ENTRIES"] = int(os.environ.get("QR_CACHE_ENTRIES", 512))
+app.config["QR_CACHE_FILES"] = int(os.environ.get("QR_CACHE_FILES", 10000))
+app.config["QR_CACHE_CONTROL"] = os.environ.get("QR_CACHE_CONTROL", "private, max-age=86400, immutable")
+
+# Badge roster cache used by the scan path
+app.config["ROSTER_CACHE_SIZE"] = int(os.environ.get("ROSTER_CACHE_SIZE", 10000))
+app.config["ROSTER_CACHE_TTL"] = int(os.environ.get("ROSTER_CACHE_TTL", 30))
+
+# Logged-in admin identity and role, cached per worker instead of loaded on every request
+app.config["SESSION_USER_CACHE_SIZE"] = int(os.environ.get("SESSION_USER_CACHE_SIZE", 1000))
+app.config["SESSION_USER_CACHE_TTL"] = int(os.environ.get("SESSION_USER_CACHE_TTL", 30))
+
+# Dashboard statistics cache
+app.config["STATS_CACHE_TTL"] = float(os.environ.get("STATS_CACHE_TTL", 5))
+
+# How often the on-site roll-call mirror behind /api/presence reloads to pick up other workers' scans;
+# /admin/muster always reads the on-site rows from the database
+app.config["PRESENCE_RESYNC_INTERVAL"] = float(os.environ.get("PRESENCE_RESYNC_INTERVAL", 30))
+
+# Live dashboard feed (Server-Sent Events); streams end after LIVE_FEED_STREAM_SECONDS and the browser reconnects
+app.config["LIVE_FEED_BUFFER_SIZE"] = int(os.environ.get("LIVE_FEED_BUFFER_SIZE", 500))
+app.config["LIVE_FEED_STREAM_SECONDS"] = int(os.environ.get("LIVE_FEED_STREAM_SECONDS", 55))
+# Each stream holds a worker thread, so keep this below gunicorn's --threads to leave room for scans;
+# dashboards over the cap get a 503 and try again after LIVE_FEED_BUSY_RETRY_SECONDS
+app.config["LIVE_FEED_MAX_STREAMS"] = int(os.environ.get("LIVE_FEED_MAX_STREAMS", 4))
+app.config["LIVE_FEED_BUSY_RETRY_SECONDS"] = int(os.environ.get("LIVE_FEED_BUSY_RETRY_SECONDS", 15))
+
+# Opt-in batched activity log writer; FLUSH_INTERVAL bounds how late entries show up in reports
+app.config["ACTIVITY_LOG_ASYNC"] = os.environ.get("ACTIVITY_LOG_ASYNC", "false").lower() == "true"
+app.config["ACTIVITY_LOG_QUEUE_SIZE"] = int(os.environ.get("ACTIVITY_LOG_QUEUE_SIZE", 10000))
+app.config["ACTIVITY_LOG_BATCH_SIZE"] = int(os.environ.get("ACTIVITY_LOG_BATCH_SIZE", 200))
+app.config["ACTIVITY_LOG_FLUSH_INTERVAL"] = float(os.environ.get("ACTIVITY_LOG_FLUSH_INTERVAL", 1.0))
+
+# activity_logs is range-partitioned by timestamp on PostgreSQL (migration 007). Each worker's
+# maintenance thread keeps ACTIVITY_PARTITION_PREMAKE partitions ahead of today and detaches
+# partitions older than ACTIVITY_LOG_RETENTION_MONTHS (0 keeps all history)
+app.config["ACTIVITY_PARTITION_MONTHS"] = int(os.environ.get("ACTIVITY_PARTITION_MONTHS", 1))
+app.config["ACTIVITY_PARTITION_PREMAKE"] = int(os.environ.get("ACTIVITY_PARTITION_PREMAKE", 3))
+app.config["ACTIVITY_LOG_RETENTION_MONTHS"] = int(os.environ.get("ACTIVITY_LOG_RETENTION_MONTHS", 0))
+app.config["ACTIVITY_PARTITION_MAINTENANCE"] = os.environ.get("ACTIVITY_PARTITION_MAINTENANCE", "true").lower() == "true"
+app.config["ACTIVITY_PARTITION_INTERVAL"] = int(os.environ.get("ACTIVITY_PARTITION_INTERVAL", 21600))
+
+# Hourly/daily traffic rollups behind /admin/traffic, refreshed from activity_logs every
+# TRAFFIC_ROLLUP_INTERVAL seconds; each refresh recounts from TRAFFIC_ROLLUP_LAG seconds
+# before the previous one to pick up late-committed scans
+app.config["TRAFFIC_ROLLUP_ENABLED"] = os.environ.get("TRAFFIC_ROLLUP_ENABLED", "true").lower() == "true"
+app.config["TRAFFIC_ROLLUP_INTERVAL"] = int(os.environ.get("TRAFFIC_ROLLUP_INTERVAL", 60))
+app.config["TRAFFIC_ROLLUP_LAG"] = int(os.environ.get("TRAFFIC_ROLLUP_LAG", 300))
+
+# Admin user list pagination
+app.config["USERS_PAGE_SIZE"] = int(os.environ.get("USERS_PAGE_SIZE", 50))
+app.config["USERS_MAX_PAGE_SIZE"] = int(os.environ.get("USERS_MAX_PAGE_SIZE", 500))
+
+# In-memory typeahead index over users, rebuilt periodically to pick up other workers' changes
+app.config["USER_INDEX_ENABLED"] = os.environ.get("USER_INDEX_ENABLED", "true").lower() == "true"
+app.config["USER_INDEX_REBUILD_INTERVAL"] = int(os.environ.get("USER_INDEX_REBUILD_INTERVAL", 300))
+
+# Reports pagination
+app.config["REPORTS_PAGE_SIZE"] = int(os.environ.get("REPORTS_PAGE_SIZE", 50))
+app.config["REPORTS_MAX_PAGE_SIZE"] = int(os.environ.get("REPORTS_MAX_PAGE_SIZE", 500))
+app.config["REPORTS_EXPORT_CHUNK_SIZE"] = int(os.environ.get("REPORTS_EXPORT_CHUNK_SIZE", 1000))
+app.config["REPORTS_EXPORT_GZIP"] = os.environ.get("REPORTS_EXPORT_GZIP", "false").lower() == "true"
+
+# Logging goes through a queue to a background writer; LOG_FORMAT is text or json.
+# LOG_LEVELS sets per-logger levels and LOG_SAMPLE keeps a fraction of a logger's
+# sub-WARNING records, e.g. LOG_SAMPLE="gateguard.scan=0.1" for one scan in ten
+app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO")
+app.config["LOG_FORMAT"] = os.environ.get("LOG_FORMAT", "text").lower()
+app.config["LOG_LEVELS"] = parse_logger_settings(os.environ.get("LOG_LEVELS", "sqlalchemy=WARNING"))
+app.config["LOG_SAMPLE"] = parse_logger_settings(os.environ.get("LOG_SAMPLE", ""), float)
+app.config["LOG_QUEUE_SIZE"] = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+log_pipeline.configure(level=app.config["LOG_LEVEL"], fmt=app.config["LOG_FORMAT"],
+                       levels=app.config["LOG_LEVELS"], sample=app.config["LOG_SAMPLE"],
+                       queue_size=app.config["LOG_QUEUE_SIZE"])
+
+# Startup schema work: "create" runs create_all and the default admin on every start,
+# "version" only when the recorded schema version is behind, "off" skips it entirely
+app.config["SCHEMA_CHECK"] = os.environ.get("SCHEMA_CHECK", "version").lower()
+app.config["TEMPLATE_PRECOMPILE"] = os.environ.get("TEMPLATE_PRECOMPILE", "true").lower() == "true"
+startup_timer.mark('config')
+
 # Initialize the app with the extension
 db.init_app(app)
 
@@ -33,6 +140,15 @@ db.init_app(app)
 with app.app_context():
     import models  # noqa: F401
     import auth  # noqa: F401
-    db.create_all()
-    auth.create_default_admin()
-    logging.info("Database tables created and default admin initialized")
+    startup_timer.mark('models')
+    schema = ensure_schema(db, app.config["SCHEMA_CHECK"], auth.create_default_admin)
+    startup_timer.mark('schema')
+    logging.info("Database schema check (%s): %s", app.config["SCHEMA_CHECK"], schema)
+    from partitions import activity_partitions
+    activity_partitions.configure(months=app.config["ACTIVITY_PARTITION_MONTHS"],
+                                  premake=app.config["ACTIVITY_PARTITION_PREMAKE"],
+                                  retention_months=app.config["ACTIVITY_LOG_RETENTION_MONTHS"],
+                                  interval=app.config["ACTIVITY_PARTITION_INTERVAL"])
+    if schema == 'created':
+        # A freshly created activity_logs has no partitions to insert into yet
+        activity_partitions.maintain(db.engine)
@@ -4,6 +4,7 @@ from functools import wraps
 from datetime import datetime
 from models import AdminUser
 from app import app, db
+from session_users import session_user_cache, SessionUser, SESSION_USER_FIELDS
 import logging
 
 # Configure Flask-Login
@@ -12,9 +13,23 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
+session_user_cache.configure(max_size=app.config.get("SESSION_USER_CACHE_SIZE"),
+                             ttl=app.config.get("SESSION_USER_CACHE_TTL"))
+
 @login_manager.user_loader
 def load_user(user_id):
-    return AdminUser.query.get(int(user_id))
+    try:
+        return session_user_cache.get(int(user_id), _load_session_user)
+    except (TypeError, ValueError):
+        return None
+
+def _load_session_user(user_id):
+    """Identity and role columns of one admin, or None"""
+    row = db.session.execute(
+        db.select(*[getattr(AdminUser, field) for field in SESSION_USER_FIELDS])
+        .where(AdminUser.id == user_id)
+    ).first()
+    return SessionUser(**row._mapping) if row else None
 
 def require_login(f):
     """Decorator to require login for admin routes"""
@@ -117,15 +132,18 @@ def change_password():
         new_password = request.form.get('new_password')
         confirm_password = request.form.get('confirm_password')
         
-        if not current_user.check_password(current_password):
+        # current_user is a cached snapshot; passwords live on the row
+        admin = AdminUser.query.get(current_user.id)
+        if not admin.check_password(current_password):
             flash('Current password is incorrect', 'danger')
         elif new_password != confirm_password:
             flash('New passwords do not match', 'danger')
         elif len(new_password) < 6:
             flash('Password must be at least 6 characters long', 'danger')
         else:
-            current_user.set_password(new_password)
+            admin.set_password(new_password)
             db.session.commit()
+            session_user_cache.invalidate(admin.id)
             flash('Password changed successfully', 'success')
             return redirect(url_for('admin_dashboard'))
     
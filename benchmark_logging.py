@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark for request-path logging: the time a scan request spends in its
+log call with the previous synchronous stderr handler against log_pipeline
+(queue + background writer), in text and JSON mode and with scan sampling.
+
+The output stream stalls for --stall-ms on every --stall-every-th write to
+imitate a slow or back-pressured log pipe. With the synchronous handler that
+stall lands on whichever request thread happens to be writing, so its p99
+follows the log I/O; with the pipeline only the writer thread waits.
+
+Usage: python benchmark_logging.py [--scans N] [--threads T] [--stall-ms MS] [--stall-every K]
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from log_pipeline import LogPipeline, TEXT_FORMAT
+
+
+class SlowStream:
+    """Discarding stream that stalls every few writes"""
+
+    def __init__(self, stall_ms, stall_every):
+        self.stall = stall_ms / 1000
+        self.stall_every = stall_every
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self.writes += 1
+            stalled = self.writes % self.stall_every == 0
+        if stalled:
+            time.sleep(self.stall)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_scans(scans, threads):
+    """Log one scan event per simulated request; returns per-call latencies in ms"""
+    scan_log = logging.getLogger('gateguard.scan')
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(offset, scans, threads):
+            badge = f"QR{i:06d}"
+            started = time.perf_counter()
+            scan_log.info("Access granted: %s - Reason: %s", badge, 'Delivery',
+                          extra={'badge': badge, 'method': 'QR', 'granted': True})
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies
+
+
+def synchronous(stream):
+    """The previous setup: a stream handler on the root logger, written by the caller"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return lambda: None
+
+
+def pipelined(stream, fmt, sample=None):
+    pipeline = LogPipeline()
+    pipeline.configure(level='INFO', fmt=fmt, sample=sample, queue_size=100000, stream=stream)
+    return pipeline.stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scans', type=int, default=20000, help='scan events per variant')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent request threads')
+    parser.add_argument('--stall-ms', type=float, default=5, help='how long a stalled write blocks')
+    parser.add_argument('--stall-every', type=int, default=200, help='stall on every Nth write')
+    args = parser.parse_args()
+
+    print(f"{args.scans} scans on {args.threads} threads; output stalls {args.stall_ms} ms "
+          f"every {args.stall_every} writes")
+    variants = [
+        ('synchronous stderr handler (previous)', lambda stream: synchronous(stream)),
+        ('log_pipeline, text', lambda stream: pipelined(stream, 'text')),
+        ('log_pipeline, json', lambda stream: pipelined(stream, 'json')),
+        ('log_pipeline, json, gateguard.scan=0.1', lambda stream: pipelined(stream, 'json', {'gateguard.scan': 0.1})),
+    ]
+    print(f"{'variant':<42} {'p50 us':>8} {'p99 us':>8} {'max ms':>8} {'total s':>8} {'writes':>7}")
+    for label, setup in variants:
+        stream = SlowStream(args.stall_ms, args.stall_every)
+        stop = setup(stream)
+        started = time.perf_counter()
+        latencies = run_scans(args.scans, args.threads)
+        stop()  # includes draining the queue, so total covers every write
+        elapsed = time.perf_counter() - started
+        print(f"{label:<42} {percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{max(latencies):>8.2f} {elapsed:>8.2f} {stream.writes:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark for picture ingestion: the previous save_picture path (full decode,
+RGB convert, LANCZOS thumbnail) against pictures.render_picture (JPEG draft
+decode, every derived size from one decode), single-threaded and on a
+thread pool.
+
+Each variant runs in a fresh process so its peak RSS can be reported.
+
+Usage: python benchmark_pictures.py [--count N] [--megapixels MP] [--workers W]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from pictures import render_picture
+
+
+def make_photo(megapixels):
+    """A noisy JPEG roughly the size of a phone photo (4:3)"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.effect_noise((width // 8, height // 8), 64).convert('RGB').resize((width, height))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy_save(data, folder, filename):
+    image = Image.open(BytesIO(data))
+    image = image.convert('RGB')
+    image.thumbnail((300, 300), Image.Resampling.LANCZOS)
+    image.save(os.path.join(folder, filename), 'JPEG', quality=85)
+
+
+def run_variant(args):
+    name, data, count, workers = args
+    folder = tempfile.mkdtemp(prefix='bench_pictures_')
+    try:
+        work = legacy_save if name == 'legacy' else render_picture
+        started = time.perf_counter()
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda i: work(data, folder, f"{i}.jpg"), range(count)))
+        else:
+            for i in range(count):
+                work(data, folder, f"{i}.jpg")
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return elapsed, peak_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=20, help='pictures per variant')
+    parser.add_argument('--megapixels', type=float, default=12, help='size of the test photo')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='threads for the pooled run')
+    args = parser.parse_args()
+
+    data = make_photo(args.megapixels)
+    print(f"Test photo: {args.megapixels} MP JPEG, {len(data) / 1024 / 1024:.1f} MB; {args.count} pictures per run")
+
+    variants = [
+        ('legacy', 'legacy save_picture (300px only)', 1),
+        ('pipeline', 'draft decode, 300px + 100px', 1),
+        ('pipeline', f'draft decode, 300px + 100px, {args.workers} threads', args.workers),
+    ]
+    ctx = multiprocessing.get_context('spawn')
+    print(f"{'variant':<48} {'ms/picture':>10} {'pictures/s':>10} {'peak RSS MB':>12}")
+    for name, label, workers in variants:
+        with ctx.Pool(1) as pool:
+            elapsed, peak_mb = pool.apply(run_variant, ((name, data, args.count, workers),))
+        print(f"{label:<48} {elapsed / args.count * 1000:>10.1f} {args.count / elapsed:>10.1f} {peak_mb:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
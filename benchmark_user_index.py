@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the typeahead index (user_index.UserSearchIndex) under write
+traffic: each round upserts --upserts users, as check-ins, edits and imports
+handled by this worker would, and then runs every query once.
+
+Short prefixes ("jo", "ma", "ac") match tens of thousands of users, so
+they are only fast if the name-ordered holder lists survive the upserts
+between queries. The first run of each query sorts its lists and is
+reported separately; halfway through, the index is rebuilt as the periodic
+refresh does, and the timings after it show whether the lists in use were
+carried over. The target is a p99 under 5 ms at 100k users.
+
+Usage: python benchmark_user_index.py [--users N] [--rounds R] [--upserts U]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from user_index import UserSearchIndex, IndexedUser
+
+FIRST_NAMES = ['John', 'Joan', 'Jose', 'Joseph', 'Maria', 'Mark', 'Martin', 'Mary', 'Ana', 'Andrew',
+               'Pedro', 'Paula', 'Luis', 'Liza', 'Carlos', 'Carmen', 'Ramon', 'Rosa', 'Achmed', 'Grace']
+LAST_NAMES = ['Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia', 'Mendoza', 'Torres', 'Tomas',
+              'Andrada', 'Castillo', 'Flores', 'Villanueva', 'Ramos', 'Aquino', 'Navarro', 'Smith', 'Jones']
+COMPANIES = ['Acme Security', 'Acero Builders', 'Manila Logistics', 'Joma Foods', 'Pacific Marine',
+             'Northgate Services', 'Bayview Catering', None]
+QUERIES = ['jo', 'ma', 'ac', '00', 'john', 'santos', 'mar cru', 'acme', 'ill', 'qr-000123', 'john sm']
+
+
+def make_user(i, rng):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    # Varied suffixes give each common name many distinct tokens, as real rosters have
+    first += rng.choice(['', '', 'a', 'el', 'ito'])
+    return IndexedUser(f"u{i}", f"{first} {last}", f"QR-{i:06d}", f"ID{rng.randrange(10**8):08d}",
+                       rng.choice(COMPANIES), 'allowed')
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000, help='users in the index')
+    parser.add_argument('--rounds', type=int, default=200, help='rounds of upserts followed by every query')
+    parser.add_argument('--upserts', type=int, default=5, help='users upserted before each round of queries')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = UserSearchIndex()
+    started = time.perf_counter()
+    index.build(make_user(i, rng) for i in range(args.users))
+    print(f"Built index of {args.users} users in {time.perf_counter() - started:.2f}s")
+
+    cold = {}
+    timings = {query: [] for query in QUERIES}
+    upsert_ms = []
+    for round_number in range(args.rounds):
+        if round_number == args.rounds // 2:
+            started = time.perf_counter()
+            index.build(make_user(i, rng) for i in range(args.users))
+            print(f"Rebuilt index in {time.perf_counter() - started:.2f}s")
+        for _ in range(args.upserts):
+            started = time.perf_counter()
+            index.upsert(make_user(rng.randrange(args.users), rng))
+            upsert_ms.append((time.perf_counter() - started) * 1000)
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if query in cold:
+                timings[query].append(elapsed_ms)
+            else:
+                cold[query] = elapsed_ms
+
+    print(f"{'query':<12} {'first ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    worst = 0.0
+    for query, samples in timings.items():
+        p99 = percentile(samples, 0.99)
+        worst = max(worst, p99)
+        print(f"{query:<12} {cold[query]:>8.3f} {statistics.median(samples):>8.3f} {p99:>8.3f} "
+              f"{max(samples):>8.3f}")
+    print(f"{'upsert':<12} {'':>8} {statistics.median(upsert_ms):>8.3f} {percentile(upsert_ms, 0.99):>8.3f} "
+          f"{max(upsert_ms):>8.3f}")
+    print(f"Worst query p99 {worst:.2f} ms ({'meets' if worst < 5 else 'misses'} the 5 ms target)")
+    return 0 if worst < 5 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
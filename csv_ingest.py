@@ -0,0 +1,164 @@
+import codecs
+import csv
+
+# Bytes inspected to detect the encoding; the rest of the file is decoded as it streams
+ENCODING_SAMPLE_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+REQUIRED_NAME_FIELDS = ['first_name', 'last_name']
+BARCODE_FIELDS = ['barcode', 'qr_code_id', 'id_number']
+
+
+class CSVFormatError(ValueError):
+    """The upload cannot be read as a roster CSV"""
+
+
+def detect_encoding(sample):
+    """Pick an encoding from a bounded sample: BOM, then UTF-8, then chardet's guess"""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # Not final: the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    import chardet
+    guess = chardet.detect(sample).get('encoding')
+    if guess:
+        try:
+            sample.decode(guess)
+            return guess
+        except (UnicodeDecodeError, LookupError):
+            pass
+    # latin-1 decodes any byte sequence
+    return 'latin-1'
+
+
+def fallback_encodings(encoding):
+    """Encodings to switch to when a byte past the sample does not decode; latin-1 never fails"""
+    return [fallback for fallback in ('cp1252', 'latin-1') if fallback != encoding]
+
+
+def iter_text_lines(csv_file, sample_size=ENCODING_SAMPLE_SIZE, chunk_size=READ_CHUNK_SIZE):
+    """Decode an uploaded file incrementally, yielding lines with their line endings.
+
+    The encoding is detected from the first sample_size bytes; if a later
+    byte does not decode, the rest of the file is read as cp1252 and then
+    latin-1, as spreadsheet exports are often UTF-8 apart from a few names.
+    """
+    sample = csv_file.read(sample_size)
+    encoding = detect_encoding(sample)
+    fallbacks = iter(fallback_encodings(encoding))
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    pending = ''
+    data = sample
+    while True:
+        final = not data
+        while True:
+            try:
+                pending += decoder.decode(data, final=final)
+                break
+            except UnicodeDecodeError as e:
+                # Keep the text that decoded cleanly and read from the bad byte on with the next encoding
+                pending += e.object[:e.start].decode(encoding, errors='replace')
+                data = e.object[e.start:]
+                encoding = next(fallbacks)
+                decoder = codecs.getincrementaldecoder(encoding)()
+        # Split on \n only (like newline='') so quoted fields keep embedded line breaks;
+        # a trailing partial line is held back until more data arrives
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if final:
+            if pending:
+                yield pending
+            return
+        data = csv_file.read(chunk_size)
+
+
+def normalize_user_row(row):
+    """Validate one CSV record and map it to user fields.
+
+    Returns (fields, None) for a usable record or (None, error message).
+    """
+    first_name = (row.get('first_name') or '').strip()
+    last_name = (row.get('last_name') or '').strip()
+    middle_name = (row.get('middle_name') or '').strip()
+
+    if not first_name or not last_name:
+        return None, 'Missing first_name or last_name'
+
+    # Build complete name
+    complete_name = (row.get('complete_name') or '').strip()
+    if not complete_name:
+        middle_part = f" {middle_name}" if middle_name else ""
+        complete_name = f"{first_name}{middle_part} {last_name}"
+
+    # Extract barcode/QR code ID from various possible columns
+    barcode = ''
+    for field in BARCODE_FIELDS:
+        barcode = (row.get(field) or '').strip()
+        if barcode:
+            break
+    if not barcode:
+        return None, 'Missing barcode/QR Code ID'
+
+    status = (row.get('status') or 'Active').strip().lower()
+    status = 'Inactive' if status in ['inactive', 'banned'] else 'Active'
+
+    return {
+        'first_name': first_name,
+        'middle_name': middle_name or None,
+        'last_name': last_name,
+        'complete_name': complete_name,
+        'barcode': barcode,
+        'role': (row.get('role') or '').strip() or None,
+        'company': (row.get('company') or '').strip() or None,
+        'address': (row.get('address') or '').strip() or None,
+        'contact_number': (row.get('contact_number') or '').strip() or None,
+        'id_number': (row.get('id_number') or '').strip() or None,
+        'status': status,
+        'date_registered': (row.get('date_registered') or '').strip() or None,
+    }, None
+
+
+def read_user_csv(csv_file):
+    """Open a roster CSV upload and validate its header.
+
+    Returns a generator of (row number, fields, error) tuples; rows are parsed
+    lazily so memory does not grow with the file. Raises CSVFormatError if the
+    header is missing required columns.
+    """
+    lines = iter_text_lines(csv_file)
+    reader = csv.reader(lines)
+    try:
+        headers = [header.strip().lower() for header in next(reader)]
+    except StopIteration:
+        raise CSVFormatError('CSV file appears to be empty or invalid')
+
+    has_required_names = all(field in headers for field in REQUIRED_NAME_FIELDS)
+    has_barcode = any(field in headers for field in BARCODE_FIELDS)
+    if not has_required_names or not has_barcode:
+        raise CSVFormatError(
+            'CSV must contain "first_name", "last_name", and either "barcode", "id_number", or "qr_code_id"')
+
+    def rows():
+        for row_num, values in enumerate(reader, start=2):  # Start from 2 (after header)
+            if not any(value.strip() for value in values):
+                continue  # skip blank lines
+            fields, error = normalize_user_row(dict(zip(headers, values)))
+            yield row_num, fields, error
+
+    return rows()
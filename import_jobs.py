@@ -0,0 +1,125 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+
+class ImportJobLost(Exception):
+    """Another worker took over the job (our heartbeat went stale)"""
+
+
+class ImportJobRunner:
+    """Background thread that claims queued ImportJobs and runs them.
+
+    Every web worker runs one; a job is claimed with a conditional UPDATE so
+    only one worker processes it. A running job whose heartbeat is older than
+    stale_after seconds is treated as abandoned (its worker crashed) and is
+    claimed again, resuming from its last checkpoint.
+
+    The spooled upload lives in the local IMPORT_JOB_FOLDER, so a job is only
+    claimed by workers on the host that queued it.
+    """
+
+    def __init__(self, poll_interval=5.0, stale_after=120):
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.host = socket.gethostname()
+        self.worker_id = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        if self.running:
+            return
+        self._app = app
+        # A forked worker must not share its parent's identity
+        self.worker_id = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='import-job-runner', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def wake(self):
+        """Look for work now instead of at the next poll"""
+        self._wakeup.set()
+
+    def stop(self, timeout=5.0):
+        if not self.running:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                while not self._stopping.is_set() and self.run_next():
+                    pass
+            except Exception as e:
+                logging.error("Import job runner error: %s", e)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def run_next(self):
+        """Claim and run one job; returns False when there was nothing to do"""
+        from app import db
+        from security_service import security_service
+
+        with self._app.app_context():
+            try:
+                job_id = self.claim_next()
+                if job_id is None:
+                    return False
+                logging.info("Import job %s claimed by %s", job_id, self.worker_id)
+                try:
+                    security_service.run_import_job(job_id, self.worker_id)
+                except ImportJobLost:
+                    logging.warning("Import job %s was taken over by another worker", job_id)
+                return True
+            finally:
+                db.session.remove()
+
+    def claim_next(self):
+        """Atomically take the oldest queued (or abandoned) job spooled on this host"""
+        from app import db
+        from models import ImportJob
+
+        now = datetime.now()
+        claimable = db.and_(
+            # Jobs queued before hosts were recorded may run anywhere, as they always did
+            db.or_(ImportJob.host == self.host, ImportJob.host.is_(None)),
+            db.or_(
+                ImportJob.status == 'queued',
+                db.and_(ImportJob.status == 'running',
+                        ImportJob.heartbeat_at < now - timedelta(seconds=self.stale_after)),
+            ),
+        )
+        job_id = db.session.execute(
+            db.select(ImportJob.id).where(claimable).order_by(ImportJob.created_at).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+
+        result = db.session.execute(
+            db.update(ImportJob)
+            .where(ImportJob.id == job_id, claimable)
+            .values(status='running', worker_id=self.worker_id, heartbeat_at=now,
+                    started_at=db.func.coalesce(ImportJob.started_at, now))
+        )
+        db.session.commit()
+        return job_id if result.rowcount == 1 else None
+
+
+# Global runner instance
+import_job_runner = ImportJobRunner()
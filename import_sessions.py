@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class HashingReader:
+    """File wrapper that hashes the bytes as they are read"""
+
+    def __init__(self, csv_file):
+        self._file = csv_file
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class ImportSessionCache:
+    """Parsed CSV uploads kept between analyze and import, keyed by content hash.
+
+    Entries expire after ttl seconds; the total number of cached rows is capped
+    at max_rows, evicting the oldest sessions first. Uploads larger than the cap
+    are not cached, and their import falls back to re-uploading the file.
+    The cache is per worker process.
+    """
+
+    def __init__(self, ttl=900, max_rows=200000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._sessions = OrderedDict()  # token -> (expires_at, rows)
+        self._row_count = 0
+        self._lock = threading.Lock()
+
+    def configure(self, ttl=None, max_rows=None):
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if max_rows is not None:
+                self.max_rows = max_rows
+
+    def put(self, token, rows):
+        """Cache parsed rows under a token; returns False if the upload is too large"""
+        if len(rows) > self.max_rows:
+            return False
+        with self._lock:
+            self._discard(token)
+            self._sessions[token] = (time.monotonic() + self.ttl, rows)
+            self._row_count += len(rows)
+            self._evict()
+        return True
+
+    def get(self, token):
+        """Parsed rows for a token, or None if unknown or expired"""
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            expires_at, rows = session
+            if expires_at < time.monotonic():
+                self._discard(token)
+                return None
+            return rows
+
+    def pop(self, token):
+        rows = self.get(token)
+        with self._lock:
+            self._discard(token)
+        return rows
+
+    def _discard(self, token):
+        session = self._sessions.pop(token, None)
+        if session is not None:
+            self._row_count -= len(session[1])
+
+    def _evict(self):
+        now = time.monotonic()
+        for token in [t for t, (expires_at, _) in self._sessions.items() if expires_at < now]:
+            self._discard(token)
+        while self._row_count > self.max_rows and self._sessions:
+            self._discard(next(iter(self._sessions)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'rows': self._row_count,
+                'max_rows': self.max_rows,
+                'ttl_seconds': self.ttl,
+            }
+
+
+# Global import session cache
+import_sessions = ImportSessionCache()
@@ -0,0 +1,86 @@
+import threading
+from collections import deque
+
+
+class LiveFeed:
+    """Ring buffer of recent scan events that dashboards follow over Server-Sent Events.
+
+    Events are numbered so a reconnecting client can resume from its last ID.
+    The buffer is per worker process: a dashboard sees the scans handled by the
+    worker it is connected to.
+
+    Each open stream holds a worker thread for its whole lifetime, so at most
+    max_streams are served at once; open_stream() refuses the rest.
+    """
+
+    def __init__(self, capacity=500, max_streams=4):
+        self._events = deque(maxlen=capacity)  # (event id, event type, data)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self.max_streams = max_streams
+        self._streams = 0
+        self._rejected = 0
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def configure(self, capacity, max_streams=None):
+        with self._condition:
+            self._events = deque(self._events, maxlen=capacity)
+            if max_streams is not None:
+                self.max_streams = max_streams
+
+    def open_stream(self):
+        """Claim a stream slot; False when max_streams are already open"""
+        with self._condition:
+            if self._streams >= self.max_streams:
+                self._rejected += 1
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._condition:
+            self._streams -= 1
+
+    def publish(self, event_type, data):
+        """Append an event and wake every waiting stream"""
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, data))
+            self._condition.notify_all()
+            return self._last_id
+
+    def events_after(self, last_id):
+        """Events newer than last_id, or None if some were already dropped from the buffer"""
+        with self._condition:
+            return self._events_after(last_id)
+
+    def wait(self, last_id, timeout):
+        """Block until there are events newer than last_id or the timeout passes"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > last_id, timeout)
+            return self._events_after(last_id)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'open_streams': self._streams,
+                'max_streams': self.max_streams,
+                'rejected_streams': self._rejected,
+                'buffered_events': len(self._events),
+                'last_id': self._last_id,
+            }
+
+    def _events_after(self, last_id):
+        if last_id >= self._last_id:
+            return []
+        if not self._events or self._events[0][0] > last_id + 1:
+            return None
+        return [event for event in self._events if event[0] > last_id]
+
+
+# Global feed instance
+live_feed = LiveFeed()
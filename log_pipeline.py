@@ -0,0 +1,193 @@
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else on a record came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+# Argument types that are safe to format later on the writer thread
+_PLAIN_TYPES = (str, int, float, bool, type(None), date, datetime, Decimal, uuid.UUID)
+
+TEXT_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+
+def parse_logger_settings(text, convert=str):
+    """Parse 'name=value,name=value' (e.g. LOG_LEVELS) into a dict"""
+    settings = {}
+    for item in (text or '').split(','):
+        name, sep, value = item.partition('=')
+        if sep and name.strip():
+            settings[name.strip()] = convert(value.strip())
+    return settings
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; extra= fields become top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the records below WARNING from the given loggers.
+
+    Rates apply to a logger and its children, e.g. {'gateguard.scan': 0.1}
+    keeps every tenth scan event. Sampling is by count rather than at random
+    so the kept share is exact under steady load.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate < 1}
+        self._every = {}     # logger name -> keep one record in this many, or None
+        self._counters = {}  # configured logger name -> record counter
+        self.sampled_out = 0
+
+    def _rule(self, name):
+        if name not in self._every:
+            rule = None
+            for prefix, rate in self.rates.items():
+                if name == prefix or name.startswith(prefix + '.'):
+                    rule = (prefix, max(1, round(1 / rate)) if rate > 0 else 0)
+                    break
+            self._every[name] = rule
+        return self._every[name]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        prefix, every = rule
+        counter = self._counters.get(prefix)
+        if counter is None:
+            counter = self._counters.setdefault(prefix, itertools.count())
+        if every and next(counter) % every == 0:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class _BackgroundHandler(QueueHandler):
+    """QueueHandler that never blocks the logging thread and defers formatting"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Leave msg % args to the writer thread unless an argument could
+        # change (or is not safe to touch) after the call returns
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, dict) else args
+            if not all(isinstance(value, _PLAIN_TYPES) for value in values):
+                record.msg = record.getMessage()
+                record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.enqueued += 1
+
+
+class LogPipeline:
+    """Routes all logging through a bounded queue to one background writer.
+
+    Request threads only filter and enqueue a record; formatting and the
+    write to the stream happen on the listener thread. When the queue is full
+    records are dropped and counted rather than blocking the request.
+    """
+
+    def __init__(self):
+        self._handler = None
+        self._listener = None
+        self._sampler = None
+        self._lock = threading.Lock()
+        self.settings = {}
+
+    @property
+    def running(self):
+        return self._listener is not None
+
+    def configure(self, level='INFO', fmt='text', levels=None, sample=None, queue_size=10000, stream=None):
+        """Install the pipeline as the root handler (replacing any existing one)"""
+        with self._lock:
+            self._stop()
+            formatter = JSONFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+            output = logging.StreamHandler(stream or sys.stderr)
+            output.setFormatter(formatter)
+
+            self._handler = _BackgroundHandler(queue.Queue(maxsize=queue_size))
+            self._sampler = SamplingFilter(sample or {})
+            self._handler.addFilter(self._sampler)
+            self._listener = QueueListener(self._handler.queue, output, respect_handler_level=True)
+
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(self._handler)
+            root.setLevel(level.upper())
+            for name, logger_level in (levels or {}).items():
+                logging.getLogger(name).setLevel(logger_level.upper())
+
+            self._listener.start()
+            self.settings = {'level': level.upper(), 'format': fmt, 'levels': dict(levels or {}),
+                             'sample': dict(sample or {}), 'queue_size': queue_size}
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out everything queued and stop the writer thread"""
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stats(self):
+        """Queue counters for the metrics endpoint"""
+        handler = self._handler
+        if handler is None:
+            return {'running': False}
+        return dict(self.settings,
+                    running=self.running,
+                    queued=handler.queue.qsize(),
+                    enqueued=handler.enqueued,
+                    dropped=handler.dropped,
+                    sampled_out=self._sampler.sampled_out)
+
+
+# Global pipeline
+log_pipeline = LogPipeline()
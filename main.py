@@ -2,6 +2,13 @@ from app import app
 import routes
 import admin_routes
 import replit_auth
+from startup import startup_timer, precompile_templates
+
+startup_timer.mark('routes')
+if app.config["TEMPLATE_PRECOMPILE"]:
+    precompile_templates(app)
+    startup_timer.mark('templates')
+startup_timer.finish()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Versioned database migrations, replacing the old migrate_*.py scripts.
+
+Applied versions are recorded in schema_migrations, so each migration runs
+once. Schema changes are made so scans keep flowing while they run: columns
+are added under a short lock_timeout with retries, foreign keys are added NOT
+VALID and validated separately, backfills update small batches in their own
+transactions with a pause between them, and indexes are built CONCURRENTLY.
+
+Usage: python migrate.py [up|status|check-plans] [--target VERSION]
+                         [--batch-size N] [--pause SECONDS] [--lock-timeout 2s]
+       python migrate.py partitions
+       python migrate.py detach --before YYYY-MM-DD [--drop]
+       python migrate.py rollups [--since YYYY-MM-DD]
+"""
+
+import argparse
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+from app import app, db
+from migration_runner import (
+    Migration, MigrationRunner, MigrationError,
+    AddColumn, AddForeignKey, Backfill, PythonBackfill, CreateIndex, Execute,
+)
+from partitions import activity_partitions, PartitionTable
+from traffic_rollups import traffic_rollups
+
+
+def _backfill_qr_filenames(conn, batch_ids):
+    """Render QR images for a batch of users and store their filenames"""
+    from qr_images import QRImageGenerator
+
+    rows = conn.execute(
+        text("SELECT id, qr_code_id FROM security_users WHERE id IN :ids")
+        .bindparams(bindparam('ids', expanding=True)), {'ids': list(batch_ids)}
+    ).all()
+    filenames, _ = QRImageGenerator('static/qr_codes').generate_batch([qr_code_id for _, qr_code_id in rows])
+    updates = [{'id': user_id, 'filename': filenames[qr_code_id]}
+               for user_id, qr_code_id in rows if filenames.get(qr_code_id)]
+    if updates:
+        conn.execute(text("UPDATE security_users SET qr_code_filename = :filename WHERE id = :id"), updates)
+    return len(updates)
+
+
+# Continues the sequential "no" from the current maximum, in creation order within each batch
+_NUMBER_USERS_SQL = """
+    UPDATE security_users SET no = numbered.n
+    FROM (
+        SELECT id, (SELECT COALESCE(MAX(no), 0) FROM security_users)
+                   + ROW_NUMBER() OVER (ORDER BY created_at, id) AS n
+        FROM security_users WHERE id IN :batch_ids
+    ) AS numbered
+    WHERE security_users.id = numbered.id
+"""
+
+MIGRATIONS = [
+    Migration(1, 'security_users.qr_code_filename', [
+        AddColumn('security_users', 'qr_code_filename', 'VARCHAR'),
+        # /qr/<badge> renders images on demand, so PNGs are only written up front when
+        # the deployment pregenerates them anyway
+        PythonBackfill('qr_code_filename', 'security_users',
+                       "(qr_code_filename IS NULL OR qr_code_filename = '') AND qr_code_id IS NOT NULL",
+                       _backfill_qr_filenames, when=lambda runner: app.config.get("QR_PREGENERATE")),
+    ]),
+    # The old script also rewrote status allowed/banned to Active/Inactive; that step is
+    # dropped because the access check only admits status 'allowed'
+    Migration(2, 'security_users Excel fields', [
+        AddColumn('security_users', 'no', 'INTEGER'),
+        AddColumn('security_users', 'date_registered', 'DATE'),
+        AddColumn('security_users', 'role', 'VARCHAR'),
+        AddColumn('security_users', 'complete_name', 'VARCHAR'),
+        AddColumn('security_users', 'barcode', 'VARCHAR'),
+        Backfill('no', 'security_users', None, "no IS NULL", statement=_NUMBER_USERS_SQL),
+        Backfill('complete_name', 'security_users',
+                 "complete_name = COALESCE(NULLIF(full_name, ''), "
+                 "first_name || COALESCE(' ' || NULLIF(middle_name, ''), '') || ' ' || last_name)",
+                 "complete_name IS NULL AND (NULLIF(full_name, '') IS NOT NULL "
+                 "OR (first_name IS NOT NULL AND last_name IS NOT NULL))"),
+        Backfill('barcode', 'security_users', "barcode = qr_code_id",
+                 "barcode IS NULL AND qr_code_id IS NOT NULL"),
+        Backfill('role from position', 'security_users', "role = position",
+                 "role IS NULL AND position IS NOT NULL",
+                 when=lambda runner: runner.has_column('security_users', 'position')),
+    ]),
+    Migration(3, 'activity_logs visit and operator columns', [
+        AddColumn('activity_logs', 'visit_reason', 'VARCHAR'),
+        AddColumn('activity_logs', 'user_role', 'VARCHAR'),
+        AddColumn('activity_logs', 'operator_id', 'INTEGER'),
+        AddForeignKey('activity_logs', 'operator_id', 'admin_users'),
+        AddColumn('activity_logs', 'operator_name', 'VARCHAR'),
+        AddColumn('activity_logs', 'operator_role', 'VARCHAR'),
+    ]),
+    Migration(4, 'admin_users roles', [
+        AddColumn('admin_users', 'role', "VARCHAR(20) DEFAULT 'guard'"),
+        AddColumn('admin_users', 'created_by', 'INTEGER'),
+        AddForeignKey('admin_users', 'created_by', 'admin_users'),
+        AddColumn('admin_users', 'last_login', 'TIMESTAMP'),
+        Backfill('default super admin', 'admin_users', "role = 'super_admin'",
+                 "username = 'admin' AND role IS NULL"),
+    ]),
+    Migration(5, 'report and roster indexes', [
+        CreateIndex('ix_activity_logs_timestamp', 'activity_logs (timestamp)'),
+        CreateIndex('ix_activity_logs_user_timestamp', 'activity_logs (security_user_id, timestamp)'),
+        CreateIndex('ix_security_users_on_site', 'security_users (company, role) WHERE is_checked_in'),
+        CreateIndex('ix_security_users_qr_code_id', 'security_users (qr_code_id)'),
+        CreateIndex('ix_security_users_created_at', 'security_users (created_at)'),
+        CreateIndex('ix_security_users_full_name', 'security_users (full_name)'),
+    ]),
+    # Substring search indexes; these need PostgreSQL with the pg_trgm extension available
+    Migration(6, 'activity_logs trigram indexes', [
+        Execute("CREATE EXTENSION IF NOT EXISTS pg_trgm", postgresql_only=True),
+        CreateIndex('ix_activity_logs_user_name_trgm', 'activity_logs USING gin (user_name gin_trgm_ops)',
+                    postgresql_only=True),
+        CreateIndex('ix_activity_logs_qr_code_id_trgm', 'activity_logs USING gin (qr_code_id gin_trgm_ops)',
+                    postgresql_only=True),
+    ]),
+    # Monthly (ACTIVITY_PARTITION_MONTHS) range partitions, so date-filtered reports only
+    # read the months they cover and old months can be detached instead of deleted. Scans keep
+    # running during the copy; rows updated or deleted meanwhile are re-synced at the swap
+    Migration(7, 'partition activity_logs by timestamp', [
+        PartitionTable(activity_partitions),
+    ]),
+    # Uploads are spooled to each host's IMPORT_JOB_FOLDER; only that host's workers claim the job
+    Migration(8, 'import_jobs.host', [
+        AddColumn('import_jobs', 'host', 'VARCHAR'),
+    ]),
+]
+
+
+def _plan_nodes(conn, statement):
+    """Every node of the plan of a SQLAlchemy statement"""
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(node.get('Plans', []))
+
+
+def _plan_indexes(conn, statement):
+    """Return the index names used by the plan of a SQLAlchemy statement.
+
+    A scan of a partition's index is reported as the partitioned index it belongs to.
+    """
+    parents = dict(conn.execute(text("""
+        SELECT c.relname, p.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relkind = 'i'
+    """)).all())
+    return {parents.get(node['Index Name'], node['Index Name'])
+            for node in _plan_nodes(conn, statement) if 'Index Name' in node}
+
+
+def _check_partition_pruning(conn, start, end):
+    """A date-range report should only read the partitions overlapping the range"""
+    from security_service import security_service
+
+    if not activity_partitions.is_partitioned(conn):
+        print("  activity_logs is not partitioned; skipping the pruning check")
+        return True
+    expected = {p.name for p in activity_partitions.partitions(conn)
+                if not p.is_default and p.start <= end and p.end > start}
+    statement = security_service.activity_query(None, start, end).statement
+    scanned = {node['Relation Name'] for node in _plan_nodes(conn, statement) if 'Relation Name' in node}
+    extra = scanned - expected
+    if extra:
+        print(f"✗ partition pruning: {start} .. {end} also reads {', '.join(sorted(extra))}")
+        return False
+    print(f"✓ partition pruning: {start} .. {end} reads {', '.join(sorted(scanned)) or 'no partitions'}")
+    return True
+
+
+def check_report_plans(force_index_scan=True):
+    """EXPLAIN the report queries and check they use the expected indexes.
+
+    On small tables the planner rightly prefers a sequential scan, so by default
+    sequential scans are disabled for the check to confirm the indexes are usable.
+    """
+    from security_service import security_service
+    from models import ActivityLog, SecurityUser
+
+    if db.engine.dialect.name != 'postgresql':
+        print("Skipping query plan check (PostgreSQL only)")
+        return True
+
+    week_ago = date.today() - timedelta(days=7)
+    checks = [
+        ('recent activity', ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(10),
+         {'ix_activity_logs_timestamp'}),
+        ('date range report', security_service.activity_query(None, week_ago, date.today())
+         .order_by(ActivityLog.timestamp.desc()), {'ix_activity_logs_timestamp'}),
+        ('user history', ActivityLog.query.filter(ActivityLog.security_user_id == 'x')
+         .order_by(ActivityLog.timestamp.desc()), {'ix_activity_logs_user_timestamp'}),
+        ('substring search', security_service.activity_query('smith'),
+         {'ix_activity_logs_user_name_trgm', 'ix_activity_logs_qr_code_id_trgm'}),
+        ('on-site roll-call', SecurityUser.query.filter(SecurityUser.is_checked_in == True),  # noqa: E712
+         {'ix_security_users_on_site'}),
+        ('import duplicate check', SecurityUser.query.filter(SecurityUser.qr_code_id.in_(['A', 'B'])),
+         {'ix_security_users_qr_code_id'}),
+        ('user list page', SecurityUser.query.order_by(SecurityUser.created_at.desc()).limit(50),
+         {'ix_security_users_created_at'}),
+    ]
+
+    all_ok = True
+    with db.engine.connect() as conn:
+        if force_index_scan:
+            conn.execute(text("SET enable_seqscan = off"))
+        for label, query, expected in checks:
+            used = _plan_indexes(conn, query.statement)
+            missing = expected - used
+            if missing:
+                all_ok = False
+                print(f"✗ {label}: plan does not use {', '.join(sorted(missing))} (uses: {', '.join(sorted(used)) or 'no index'})")
+            else:
+                print(f"✓ {label}: uses {', '.join(sorted(expected))}")
+        all_ok = _check_partition_pruning(conn, week_ago, date.today()) and all_ok
+        conn.rollback()
+    return all_ok
+
+
+def show_partitions():
+    if db.engine.dialect.name != 'postgresql':
+        print("Partitioning is PostgreSQL only")
+        return 0
+    with db.engine.connect() as conn:
+        if not activity_partitions.is_partitioned(conn):
+            print(f"{activity_partitions.table} is not partitioned (run: python migrate.py up)")
+            return 1
+        for partition in activity_partitions.partitions(conn):
+            rows = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+                                {'name': partition.name}).scalar()
+            span = 'DEFAULT' if partition.is_default else f"{partition.start} .. {partition.end}"
+            print(f"{partition.name:<32} {span:<26} ~{max(rows, 0)} rows")
+    return 0
+
+
+def detach_partitions(before, drop):
+    if db.engine.dialect.name != 'postgresql':
+        print("Partitioning is PostgreSQL only")
+        return 0
+    with db.engine.begin() as conn:
+        detached = activity_partitions.detach(conn, before, drop=drop)
+    for name in detached:
+        print(f"✓ {'Dropped' if drop else 'Detached'} {name}")
+    if not detached:
+        print(f"No partitions end on or before {before}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', nargs='?', default='up',
+                        choices=['up', 'status', 'check-plans', 'partitions', 'detach', 'rollups'])
+    parser.add_argument('--target', type=int, help='apply migrations up to this version only')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per backfill transaction')
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between backfill batches')
+    parser.add_argument('--lock-timeout', default='2s', help='longest wait for a table lock before retrying')
+    parser.add_argument('--before', type=date.fromisoformat,
+                        help='detach activity partitions ending on or before this date')
+    parser.add_argument('--drop', action='store_true', help='drop detached partitions instead of keeping them')
+    parser.add_argument('--since', type=date.fromisoformat, help='recompute traffic rollups from this date')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'check-plans':
+            return 0 if check_report_plans() else 1
+        if args.command == 'partitions':
+            return show_partitions()
+        if args.command == 'detach':
+            if args.before is None:
+                parser.error("detach needs --before YYYY-MM-DD")
+            return detach_partitions(args.before, args.drop)
+        if args.command == 'rollups':
+            since = datetime.combine(args.since, datetime.min.time()) if args.since else None
+            hours = traffic_rollups.refresh(rebuild_from=since)
+            print(f"✓ Traffic rollups recomputed for {hours} hours")
+            return 0
+
+        runner = MigrationRunner(db, MIGRATIONS, batch_size=args.batch_size, pause=args.pause,
+                                 lock_timeout=args.lock_timeout)
+        if args.command == 'status':
+            for migration, applied in runner.status():
+                print(f"{'✓' if applied else ' '} {migration.version:03d} {migration.name}")
+            return 0
+
+        print("Starting database migration...")
+        try:
+            runner.run(target=args.target)
+        except MigrationError as e:
+            print(f"✗ {e}")
+            return 1
+        except Exception as e:
+            print(f"✗ Migration failed: {str(e)}")
+            return 1
+        print("✓ Database migration completed successfully!")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+import logging
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.exc import OperationalError
+
+# One schema change: steps run in order and the version is recorded once all of them succeed.
+# Every step is idempotent, so a migration interrupted halfway is simply run again.
+Migration = namedtuple('Migration', ['version', 'name', 'steps'])
+
+# Arbitrary key for the PostgreSQL advisory lock that keeps two runners apart
+_ADVISORY_LOCK_KEY = 741_520_023
+
+
+class MigrationError(Exception):
+    pass
+
+
+def is_lock_timeout(error):
+    # 55P03 lock_not_available, raised when lock_timeout expires
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '55P03'
+
+
+class AddColumn:
+    """ALTER TABLE ... ADD COLUMN, skipped when the column exists.
+
+    Adding a nullable column (or one with a constant default) only touches the
+    catalog, but it still needs a brief exclusive lock; lock_timeout makes it
+    give up and retry instead of queueing scans behind a long transaction.
+    """
+
+    def __init__(self, table, column, definition):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def describe(self):
+        return f"add column {self.table}.{self.column}"
+
+    def run(self, runner):
+        if runner.has_column(self.table, self.column):
+            runner.report(f"✓ Column {self.table}.{self.column} already exists")
+            return
+        runner.execute_ddl(f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}")
+        runner.report(f"✓ Added column {self.table}.{self.column}")
+
+
+class AddForeignKey:
+    """Foreign key added NOT VALID, then validated without blocking writes (PostgreSQL)"""
+
+    def __init__(self, table, column, ref_table, ref_column='id'):
+        self.table = table
+        self.column = column
+        self.ref_table = ref_table
+        self.ref_column = ref_column
+        self.name = f"fk_{table}_{column}"
+
+    def describe(self):
+        return f"foreign key {self.table}.{self.column} -> {self.ref_table}.{self.ref_column}"
+
+    def run(self, runner):
+        if not runner.is_postgresql:
+            runner.report(f"Skipping {self.describe()} (PostgreSQL only)")
+            return
+        existing = inspect(runner.engine).get_foreign_keys(self.table)
+        if any(fk['constrained_columns'] == [self.column] for fk in existing):
+            runner.report(f"✓ Foreign key on {self.table}.{self.column} already exists")
+            return
+        runner.execute_ddl(
+            f"ALTER TABLE {self.table} ADD CONSTRAINT {self.name} FOREIGN KEY ({self.column}) "
+            f"REFERENCES {self.ref_table} ({self.ref_column}) NOT VALID"
+        )
+        # VALIDATE only takes SHARE UPDATE EXCLUSIVE, so inserts and updates carry on
+        runner.execute_ddl(f"ALTER TABLE {self.table} VALIDATE CONSTRAINT {self.name}")
+        runner.report(f"✓ Added {self.describe()}")
+
+
+class Execute:
+    """A single idempotent statement (e.g. CREATE EXTENSION IF NOT EXISTS)"""
+
+    def __init__(self, sql, postgresql_only=False):
+        self.sql = sql
+        self.postgresql_only = postgresql_only
+
+    def describe(self):
+        return self.sql.split('\n')[0][:60]
+
+    def run(self, runner):
+        if self.postgresql_only and not runner.is_postgresql:
+            runner.report(f"Skipping '{self.describe()}' (PostgreSQL only)")
+            return
+        runner.execute_ddl(self.sql)
+        runner.report(f"✓ {self.describe()}")
+
+
+class CreateIndex:
+    """CREATE INDEX CONCURRENTLY, rebuilding an index an interrupted build left invalid"""
+
+    def __init__(self, name, definition, postgresql_only=False):
+        self.name = name
+        self.definition = definition
+        self.postgresql_only = postgresql_only
+
+    def describe(self):
+        return f"index {self.name}"
+
+    def run(self, runner):
+        if not runner.is_postgresql:
+            if self.postgresql_only:
+                runner.report(f"Skipping index {self.name} (PostgreSQL only)")
+                return
+            with runner.engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.definition}"))
+            runner.report(f"✓ {self.name} ready")
+            return
+
+        # CONCURRENTLY cannot run inside a transaction block
+        with runner.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            table = self.definition.split()[0]
+            if runner.is_partitioned(conn, table):
+                self._create_partitioned(runner, conn, table)
+                return
+            invalid = conn.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name AND NOT i.indisvalid
+            """), {'name': self.name}).first()
+            if invalid:
+                runner.report(f"Dropping invalid index {self.name} left by an interrupted build...")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"))
+            if runner.index_exists(conn, self.name):
+                runner.report(f"✓ {self.name} already exists")
+                return
+            runner.report(f"Creating index {self.name} concurrently...")
+            started = time.monotonic()
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.definition}"))
+            runner.report(f"✓ {self.name} ready ({time.monotonic() - started:.1f}s)")
+
+    def _create_partitioned(self, runner, conn, table):
+        """Partitioned tables cannot index CONCURRENTLY: create the parent index ON ONLY the
+        table, build each partition's index concurrently and attach it. The parent index
+        becomes valid once every partition has one."""
+        if runner.index_exists(conn, self.name, valid=True):
+            runner.report(f"✓ {self.name} already exists")
+            return
+        started = time.monotonic()
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {self.name} ON ONLY {self.definition}"))
+        partitions = conn.execute(text("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname
+        """), {'table': table}).scalars().all()
+        runner.report(f"Creating index {self.name} concurrently on {len(partitions)} partitions...")
+        for partition in partitions:
+            name = f"{self.name}_{partition[len(table) + 1:]}"
+            if not runner.index_exists(conn, name, valid=True):
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON {partition}{self.definition[len(table):]}"))
+            conn.execute(text(f"ALTER INDEX {self.name} ATTACH PARTITION {name}"))
+        runner.report(f"✓ {self.name} ready ({time.monotonic() - started:.1f}s)")
+
+
+class Backfill:
+    """Batched UPDATE of the rows matching a predicate.
+
+    Rows are walked in primary-key order, one short transaction per batch, so
+    row locks are held for milliseconds and a batch that finds nothing left to
+    change still moves on. set_sql is the SET clause of the generated UPDATE.
+    """
+
+    def __init__(self, name, table, set_sql, where_sql, key='id', when=None, statement=None):
+        self.name = name
+        self.table = table
+        self.set_sql = set_sql
+        self.where_sql = where_sql
+        self.key = key
+        self.when = when
+        self.statement = statement  # full UPDATE using :batch_ids, for updates a SET clause cannot express
+
+    def describe(self):
+        return f"backfill {self.name}"
+
+    def pending_count(self, conn):
+        return conn.execute(text(f"SELECT COUNT(*) FROM {self.table} WHERE {self.where_sql}")).scalar()
+
+    def next_batch(self, conn, after, size):
+        where, params = self.where_sql, {'size': size}
+        if after is not None:
+            where, params['after'] = f"({where}) AND {self.key} > :after", after
+        return conn.execute(
+            text(f"SELECT {self.key} FROM {self.table} WHERE {where} ORDER BY {self.key} LIMIT :size"), params
+        ).scalars().all()
+
+    def apply(self, conn, batch_ids):
+        statement = self.statement or f"UPDATE {self.table} SET {self.set_sql} WHERE {self.key} IN :batch_ids"
+        return conn.execute(text(statement).bindparams(bindparam('batch_ids', expanding=True)),
+                            {'batch_ids': list(batch_ids)}).rowcount
+
+    def run(self, runner):
+        if self.when is not None and not self.when(runner):
+            runner.report(f"Skipping backfill {self.name} (not applicable)")
+            return
+        runner.backfill(self)
+
+
+class PythonBackfill(Backfill):
+    """Backfill whose new values are computed in Python: apply(conn, batch_ids) does the update"""
+
+    def __init__(self, name, table, where_sql, apply, key='id', when=None):
+        super().__init__(name, table, None, where_sql, key=key, when=when)
+        self._apply = apply
+
+    def apply(self, conn, batch_ids):
+        return self._apply(conn, batch_ids)
+
+
+class MigrationRunner:
+    """Applies pending migrations in version order and records them in schema_migrations.
+
+    Backfills run in batches of batch_size rows with pause seconds between
+    them; a batch slower than max_batch_seconds halves the batch size so the
+    runner backs off when the gates are busy. Statements that need a table
+    lock wait at most lock_timeout before retrying.
+    """
+
+    def __init__(self, db, migrations, batch_size=1000, pause=0.05, max_batch_seconds=1.0,
+                 lock_timeout='2s', lock_retries=10, out=print):
+        self.db = db
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batch_seconds = max_batch_seconds
+        self.lock_timeout = lock_timeout
+        self.lock_retries = lock_retries
+        self.out = out
+
+    @property
+    def engine(self):
+        return self.db.engine
+
+    @property
+    def is_postgresql(self):
+        return self.engine.dialect.name == 'postgresql'
+
+    def report(self, message):
+        self.out(message)
+        logging.debug("migrate: %s", message)
+
+    def has_column(self, table, column):
+        return any(c['name'] == column for c in inspect(self.engine).get_columns(table))
+
+    def index_exists(self, conn, name, valid=False):
+        return conn.execute(text(f"""
+            SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = :name {'AND i.indisvalid' if valid else ''}
+        """), {'name': name}).first() is not None
+
+    def is_partitioned(self, conn, table):
+        return conn.execute(text("SELECT 1 FROM pg_class WHERE relname = :table AND relkind = 'p'"),
+                            {'table': table}).first() is not None
+
+    def applied_versions(self):
+        from models import SchemaMigration
+
+        SchemaMigration.__table__.create(self.engine, checkfirst=True)
+        with self.engine.connect() as conn:
+            return set(conn.execute(self.db.select(SchemaMigration.version)).scalars())
+
+    def status(self):
+        """[(migration, applied)] for every known migration"""
+        applied = self.applied_versions()
+        return [(migration, migration.version in applied) for migration in self.migrations]
+
+    def execute_ddl(self, *statements):
+        """Run statements in one transaction, retrying when they cannot get their locks in time"""
+        for attempt in range(1, self.lock_retries + 1):
+            try:
+                with self.engine.begin() as conn:
+                    if self.is_postgresql:
+                        conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+                    for sql in statements:
+                        conn.execute(text(sql) if isinstance(sql, str) else sql)
+                return
+            except OperationalError as e:
+                if not is_lock_timeout(e) or attempt == self.lock_retries:
+                    raise
+                wait = min(30, 2 ** attempt * 0.1)
+                self.report(f"  lock not available, retrying in {wait:.1f}s ({attempt}/{self.lock_retries})")
+                time.sleep(wait)
+
+    def backfill(self, step):
+        with self.engine.connect() as conn:
+            total = step.pending_count(conn)
+        if not total:
+            self.report(f"✓ Backfill {step.name}: nothing to do")
+            return
+
+        self.report(f"Backfilling {step.name}: {total} rows in batches of up to {self.batch_size}...")
+        size = self.batch_size
+        after = None
+        done = 0
+        started = time.monotonic()
+        last_report = started
+        while True:
+            batch_started = time.monotonic()
+            with self.engine.begin() as conn:
+                if self.is_postgresql:
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+                batch_ids = step.next_batch(conn, after, size)
+                if not batch_ids:
+                    break
+                step.apply(conn, batch_ids)
+            after = batch_ids[-1]
+            done += len(batch_ids)
+
+            elapsed = time.monotonic() - batch_started
+            if elapsed > self.max_batch_seconds and size > 10:
+                size = max(10, size // 2)
+            now = time.monotonic()
+            if now - last_report >= 5:
+                rate = done / (now - started)
+                self.report(f"  {step.name}: {done}/{total} rows ({min(100, done * 100 // total)}%), "
+                            f"{rate:.0f} rows/s, batch size {size}")
+                last_report = now
+            if self.pause:
+                time.sleep(self.pause)
+        self.report(f"✓ Backfilled {step.name}: {done} rows in {time.monotonic() - started:.1f}s")
+
+    def run(self, target=None):
+        """Apply every pending migration up to target (default: all); returns the versions applied"""
+        with self._exclusive():
+            applied = self.applied_versions()
+            pending = [m for m in self.migrations
+                       if m.version not in applied and (target is None or m.version <= target)]
+            if not pending:
+                self.report("✓ Database is up to date")
+                return []
+
+            done = []
+            for migration in pending:
+                self.report(f"Applying {migration.version:03d} {migration.name}...")
+                started = time.monotonic()
+                for step in migration.steps:
+                    step.run(self)
+                self._record(migration, time.monotonic() - started)
+                self.report(f"✓ {migration.version:03d} {migration.name} applied "
+                            f"({time.monotonic() - started:.1f}s)")
+                done.append(migration.version)
+            return done
+
+    def _record(self, migration, seconds):
+        from models import SchemaMigration
+
+        with self.engine.begin() as conn:
+            conn.execute(self.db.insert(SchemaMigration).values(
+                version=migration.version, name=migration.name,
+                applied_at=datetime.now(), duration_ms=int(seconds * 1000)
+            ))
+
+    @contextmanager
+    def _exclusive(self):
+        """Session-level advisory lock so only one runner migrates at a time"""
+        if not self.is_postgresql:
+            yield
+            return
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': _ADVISORY_LOCK_KEY}).scalar():
+                raise MigrationError("Another migration runner is active")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': _ADVISORY_LOCK_KEY})
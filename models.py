@@ -4,8 +4,31 @@ from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+class AdminRoles:
+    """Role checks shared by AdminUser and the cached SessionUser (see session_users.py)"""
+    
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}".strip()
+    
+    def can_manage_users(self):
+        """Check if user can manage other users"""
+        return self.role in ['super_admin', 'admin']
+    
+    def can_create_admins(self):
+        """Check if user can create admin accounts"""
+        return self.role == 'super_admin'
+    
+    def can_access_dashboard(self):
+        """Check if user can access admin dashboard"""
+        return self.role in ['super_admin', 'admin']
+    
+    def can_scan_only(self):
+        """Check if user can only scan QR codes"""
+        return self.role == 'guard'
+
 # Admin User Model with role management
-class AdminUser(UserMixin, db.Model):
+class AdminUser(AdminRoles, UserMixin, db.Model):
     __tablename__ = 'admin_users'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -27,26 +50,6 @@ class AdminUser(UserMixin, db.Model):
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
-    
-    @property
-    def full_name(self):
-        return f"{self.first_name} {self.last_name}".strip()
-    
-    def can_manage_users(self):
-        """Check if user can manage other users"""
-        return self.role in ['super_admin', 'admin']
-    
-    def can_create_admins(self):
-        """Check if user can create admin accounts"""
-        return self.role == 'super_admin'
-    
-    def can_access_dashboard(self):
-        """Check if user can access admin dashboard"""
-        return self.role in ['super_admin', 'admin']
-    
-    def can_scan_only(self):
-        """Check if user can only scan QR codes"""
-        return self.role == 'guard'
 
 # Security Access Control Models
 class SecurityUser(db.Model):
@@ -75,10 +78,20 @@ class SecurityUser(db.Model):
     # System fields
     picture_filename = db.Column(db.String, nullable=True)
     qr_code_filename = db.Column(db.String, nullable=True)
-    biometric_template = db.Column(db.Text, nullable=True)  # For future face recognition
+    biometric_template = db.deferred(db.Column(db.Text, nullable=True))  # For future face recognition; loaded on access
     is_checked_in = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # Partial index covering only people on site, for roll-call; qr_code_id is looked up on every scan
+    # and import; created_at and full_name order the admin user list
+    __table_args__ = (
+        db.Index('ix_security_users_on_site', 'company', 'role',
+                 postgresql_where=db.text('is_checked_in'), sqlite_where=db.text('is_checked_in')),
+        db.Index('ix_security_users_qr_code_id', 'qr_code_id'),
+        db.Index('ix_security_users_created_at', 'created_at'),
+        db.Index('ix_security_users_full_name', 'full_name'),
+    )
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_logs'
@@ -94,7 +107,98 @@ class ActivityLog(db.Model):
     operator_id = db.Column(db.Integer, db.ForeignKey('admin_users.id'), nullable=True)  # Who processed the access
     operator_name = db.Column(db.String, nullable=True)  # Name of operator
     operator_role = db.Column(db.String, nullable=True)  # Role of operator
-    timestamp = db.Column(db.DateTime, default=datetime.now)
+    # Partition key, so part of the primary key (PostgreSQL requires it)
+    timestamp = db.Column(db.DateTime, primary_key=True, default=datetime.now)
     
     security_user = db.relationship('SecurityUser', backref='activity_logs')
+    
+    # Report indexes; the trigram indexes for substring search are PostgreSQL-only
+    # and are created by migration 006 (migrate.py). On PostgreSQL the table is
+    # range-partitioned by timestamp; partitions are created by partitions.py
+    __table_args__ = (
+        db.Index('ix_activity_logs_timestamp', 'timestamp'),
+        db.Index('ix_activity_logs_user_timestamp', 'security_user_id', 'timestamp'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
     operator = db.relationship('AdminUser', backref='processed_activities')
+
+class UserCounters(db.Model):
+    """Single-row dashboard counters, kept in step with security_users by SecurityService"""
+    __tablename__ = 'user_counters'
+    id = db.Column(db.Integer, primary_key=True)  # Always 1
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    allowed_users = db.Column(db.Integer, nullable=False, default=0)
+    banned_users = db.Column(db.Integer, nullable=False, default=0)
+    checked_in_users = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ImportJob(db.Model):
+    """Background CSV import, processed in checkpointed chunks by ImportJobRunner"""
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    status = db.Column(db.String, nullable=False, default='queued')  # queued, running, completed, failed
+    filename = db.Column(db.String, nullable=True)  # Original upload name
+    source_path = db.Column(db.String, nullable=False)  # Spooled upload (.csv) or analyzed rows (.jsonl)
+    total_rows = db.Column(db.Integer, nullable=True)  # Known up front for analyzed uploads
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)  # Checkpoint: source rows consumed
+    imported_count = db.Column(db.Integer, nullable=False, default=0)
+    duplicate_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=True)  # JSON list of the first row errors
+    message = db.Column(db.String, nullable=True)
+    host = db.Column(db.String, nullable=True)  # Host whose IMPORT_JOB_FOLDER holds source_path
+    worker_id = db.Column(db.String, nullable=True)  # Current claim holder
+    created_by = db.Column(db.Integer, db.ForeignKey('admin_users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class SchemaVersion(db.Model):
+    """Single row recording which schema version create_all last brought the database to (see startup.py)"""
+    __tablename__ = 'schema_version'
+    id = db.Column(db.Integer, primary_key=True)  # Always 1
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+class SchemaMigration(db.Model):
+    """Versions applied by migrate.py (see migration_runner.py)"""
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
+    duration_ms = db.Column(db.Integer, nullable=True)
+
+class TrafficCounts:
+    """Dimensions and counters shared by the traffic rollup tables (see traffic_rollups.py).
+
+    Unknown dimensions are stored as '' rather than NULL so they can be part of the key.
+    """
+    company = db.Column(db.String, nullable=False, default='')
+    role = db.Column(db.String, nullable=False, default='')  # ActivityLog.user_role
+    operator = db.Column(db.String, nullable=False, default='')  # ActivityLog.operator_name
+    check_ins = db.Column(db.Integer, nullable=False, default=0)
+    check_outs = db.Column(db.Integer, nullable=False, default=0)
+    denials = db.Column(db.Integer, nullable=False, default=0)
+
+class TrafficHourly(TrafficCounts, db.Model):
+    """Scan counts per hour, company, role and operator"""
+    __tablename__ = 'traffic_hourly'
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the hour
+    
+    # Bucket first, so a date range reads one contiguous stretch of the key
+    __table_args__ = (db.PrimaryKeyConstraint('bucket', 'company', 'role', 'operator'),)
+
+class TrafficDaily(TrafficCounts, db.Model):
+    """Scan counts per day, company, role and operator, summed from traffic_hourly"""
+    __tablename__ = 'traffic_daily'
+    bucket = db.Column(db.Date, nullable=False)
+    
+    __table_args__ = (db.PrimaryKeyConstraint('bucket', 'company', 'role', 'operator'),)
+
+class TrafficRollupState(db.Model):
+    """Single-row watermark: activity before rolled_up_through is reflected in the rollup tables"""
+    __tablename__ = 'traffic_rollup_state'
+    id = db.Column(db.Integer, primary_key=True)  # Always 1
+    rolled_up_through = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
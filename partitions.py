@@ -0,0 +1,440 @@
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from migration_runner import Backfill, is_lock_timeout
+
+# One range partition; start/end are None for the DEFAULT partition
+Partition = namedtuple('Partition', ['name', 'start', 'end', 'is_default'])
+
+# Partition lengths that divide the year, so boundaries line up with January every year
+PARTITION_MONTHS = (1, 2, 3, 4, 6, 12)
+
+# Arbitrary key for the advisory lock that keeps workers from maintaining partitions at once
+_ADVISORY_LOCK_KEY = 741_520_024
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def add_months(day, months):
+    """First day of the month `months` after day's month"""
+    year, month = divmod(day.month - 1 + months, 12)
+    return date(day.year + year, month + 1, 1)
+
+
+def range_start(day, months):
+    """Start of the partition range containing day"""
+    return date(day.year, (day.month - 1) // months * months + 1, 1)
+
+
+class PartitionManager:
+    """Keeps a table range-partitioned by a timestamp column supplied with partitions.
+
+    Partitions cover `months` calendar months each and are named
+    <table>_pYYYY_MM after their first month. maintain() creates the current
+    range and `premake` ranges ahead of it, and detaches partitions that ended
+    more than retention_months ago (0 keeps everything). Detaching is a
+    catalog change, so dropping a month of history costs the same however many
+    rows it holds; the detached table is left in place to archive or drop.
+    A DEFAULT partition catches rows outside every range, so an insert never
+    fails because maintenance fell behind.
+    """
+
+    def __init__(self, table, column, months=1, premake=3, retention_months=0, interval=21600,
+                 lock_timeout='2s', lock_retries=5):
+        self.table = table
+        self.column = column
+        self.months = months
+        self.premake = premake
+        self.retention_months = retention_months
+        self.interval = interval
+        self.lock_timeout = lock_timeout
+        self.lock_retries = lock_retries
+        self._app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._last_run = None  # (finished monotonic, summary)
+        self._metrics = {'runs': 0, 'created': 0, 'detached': 0, 'errors': 0, 'last_error': None}
+
+    def configure(self, months=None, premake=None, retention_months=None, interval=None):
+        if months is not None:
+            if months not in PARTITION_MONTHS:
+                raise ValueError(f"Partition length must be one of {PARTITION_MONTHS} months, got {months}")
+            self.months = months
+        if premake is not None:
+            self.premake = premake
+        if retention_months is not None:
+            self.retention_months = retention_months
+        if interval is not None:
+            self.interval = interval
+
+    def partition_name(self, start):
+        return f"{self.table}_p{start:%Y_%m}"
+
+    @property
+    def default_name(self):
+        return f"{self.table}_default"
+
+    def is_partitioned(self, conn, table=None):
+        return conn.execute(text("""
+            SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = :table AND pg_table_is_visible(c.oid)
+        """), {'table': table or self.table}).first() is not None
+
+    def partitions(self, conn, parent=None):
+        """Attached partitions of the table, oldest first, with the DEFAULT partition last"""
+        rows = conn.execute(text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :table AND pg_table_is_visible(p.oid)
+        """), {'table': parent or self.table}).all()
+        found = []
+        for name, bound in rows:
+            match = _BOUND_RE.search(bound or '')
+            if match:
+                start, end = (datetime.fromisoformat(value).date() for value in match.groups())
+                found.append(Partition(name, start, end, False))
+            else:
+                found.append(Partition(name, None, None, bound == 'DEFAULT'))
+        return sorted(found, key=lambda p: (p.start is None, p.start or date.min))
+
+    def ranges(self, first, last):
+        """(start, end) of every partition range from the one holding first to the one holding last"""
+        start = range_start(first, self.months)
+        while start <= last:
+            end = add_months(start, self.months)
+            yield start, end
+            start = end
+
+    def ensure(self, conn, today=None, first=None, parent=None):
+        """Create missing partitions from first (default: today) through premake ranges ahead.
+
+        Returns the names created. Runs in the caller's transaction; parent
+        names the partitioned table when it is not yet called self.table.
+        Rows that landed in the DEFAULT partition for a range being created
+        (maintenance was down, or a clock ran ahead) are moved into it.
+        """
+        today = today or date.today()
+        parent = parent or self.table
+        existing = self.partitions(conn, parent)
+        covered = [(p.start, p.end) for p in existing if not p.is_default and p.start]
+        default = next((p.name for p in existing if p.is_default), None)
+        last = add_months(range_start(today, self.months), self.months * self.premake)
+
+        created = []
+        for start, end in self.ranges(min(first or today, today), last):
+            if any(s < end and start < e for s, e in covered):
+                continue
+            name = self.partition_name(start)
+            bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            if default and self._default_holds(conn, default, start, end):
+                moved = self._split_default(conn, parent, default, name, bounds, start, end)
+                logging.warning("Moved %d rows of %s from %s into new partition %s", moved, parent, default, name)
+            else:
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} FOR VALUES {bounds}"))
+            created.append(name)
+        if not default:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {self.default_name} PARTITION OF {parent} DEFAULT"))
+            created.append(self.default_name)
+        return created
+
+    def _default_holds(self, conn, default, start, end):
+        return conn.execute(text(
+            f"SELECT 1 FROM {default} WHERE {self.column} >= :start AND {self.column} < :end LIMIT 1"
+        ), {'start': start, 'end': end}).first() is not None
+
+    def _split_default(self, conn, parent, default, name, bounds, start, end):
+        """Create a partition for rows already in the DEFAULT partition; returns how many moved.
+
+        PostgreSQL refuses to create a partition whose range the DEFAULT
+        partition already holds rows for, so the DEFAULT partition is
+        detached while its rows move, all in the caller's transaction.
+        """
+        conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {default}"))
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES {bounds}"))
+        moved = conn.execute(text(
+            f"WITH moved AS (DELETE FROM {default} WHERE {self.column} >= :start AND {self.column} < :end "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ), {'start': start, 'end': end}).rowcount
+        conn.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT"))
+        return moved
+
+    def detach(self, conn, before, drop=False):
+        """Detach (and optionally drop) every partition whose range ends on or before `before`.
+
+        DETACH only changes the catalog, so it takes the same few milliseconds
+        for a month of rows as for an empty partition; it does need a brief
+        exclusive lock on the table, bounded by lock_timeout.
+        """
+        conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+        detached = []
+        for partition in self.partitions(conn):
+            if partition.is_default or partition.end is None or partition.end > before:
+                continue
+            conn.execute(text(f"ALTER TABLE {self.table} DETACH PARTITION {partition.name}"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {partition.name}"))
+            detached.append(partition.name)
+        return detached
+
+    def maintain(self, engine, today=None):
+        """Create upcoming partitions and detach expired ones; returns a summary dict.
+
+        Safe to call from every worker: one holds a transaction-level advisory
+        lock and the others skip the run. The DDL waits at most lock_timeout
+        for its locks and the run is retried with backoff when it times out.
+        """
+        summary = {'partitioned': False, 'created': [], 'detached': []}
+        if engine.dialect.name != 'postgresql':
+            return summary
+        today = today or date.today()
+        for attempt in range(1, self.lock_retries + 1):
+            # A timed-out attempt rolled back whatever it had created
+            summary['created'], summary['detached'] = [], []
+            try:
+                with engine.begin() as conn:
+                    if not self.is_partitioned(conn):
+                        return summary
+                    summary['partitioned'] = True
+                    if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                                        {'key': _ADVISORY_LOCK_KEY}).scalar():
+                        summary['skipped'] = True
+                        return summary
+                    # CREATE TABLE ... PARTITION OF locks the parent too; waiting behind a long
+                    # report would queue every scan's insert behind this transaction
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+                    summary['created'] = self.ensure(conn, today)
+                    if self.retention_months:
+                        cutoff = add_months(range_start(today, self.months), -self.retention_months)
+                        summary['detached'] = self.detach(conn, cutoff)
+                break
+            except OperationalError as e:
+                if is_lock_timeout(e) and attempt < self.lock_retries:
+                    wait = min(30, 2 ** attempt * 0.1)
+                    logging.warning("Partition maintenance for %s could not lock the table, retrying in %.1fs (%d/%d)",
+                                    self.table, wait, attempt, self.lock_retries)
+                    time.sleep(wait)
+                    continue
+                return self._failed(summary, e)
+            except Exception as e:
+                return self._failed(summary, e)
+
+        for name in summary['created']:
+            logging.info("Created partition %s", name)
+        for name in summary['detached']:
+            logging.info("Detached partition %s (older than %d months)", name, self.retention_months)
+        with self._lock:
+            self._metrics['runs'] += 1
+            self._metrics['created'] += len(summary['created'])
+            self._metrics['detached'] += len(summary['detached'])
+            self._last_run = (time.monotonic(), summary)
+        return summary
+
+    def _failed(self, summary, error):
+        with self._lock:
+            self._metrics['errors'] += 1
+            self._metrics['last_error'] = str(error)
+        logging.error("Partition maintenance for %s failed: %s", self.table, error)
+        summary['error'] = str(error)
+        return summary
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Run maintain() now and then every `interval` seconds on a background thread"""
+        if self.running:
+            return
+        self._app = app
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='partition-maintenance', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        if not self.running:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        from app import db
+
+        while not self._stopping.is_set():
+            with self._app.app_context():
+                self.maintain(db.engine)
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def stats(self):
+        with self._lock:
+            m = dict(self._metrics)
+            last_run = self._last_run
+        m.update({
+            'running': self.running,
+            'months_per_partition': self.months,
+            'premake': self.premake,
+            'retention_months': self.retention_months,
+            'partitioned': last_run[1]['partitioned'] if last_run else None,
+            'last_run_seconds_ago': round(time.monotonic() - last_run[0], 1) if last_run else None,
+        })
+        return m
+
+
+class PartitionTable:
+    """Migration step converting a plain table into the manager's range-partitioned layout (PostgreSQL).
+
+    The partitioned copy is built next to the live table: same columns,
+    indexes and foreign keys, with the partition column added to the primary
+    key as PostgreSQL requires. Rows are copied in throttled batches while
+    scans keep writing to the old table. A trigger records the key of every
+    row updated or deleted from the start of the copy, so one short locked
+    transaction can re-copy those rows, copy the rows written meanwhile and
+    swap the names. The old table is kept as <table>_legacy, minus its
+    foreign keys, until it is dropped by hand.
+    """
+
+    # Rows written this long before the copy's starting point are rechecked at the swap
+    CATCH_UP_MARGIN = '10 minutes'
+
+    def __init__(self, manager, key='id'):
+        self.manager = manager
+        self.key = key
+
+    def describe(self):
+        return f"partition {self.manager.table} by {self.manager.column}"
+
+    def run(self, runner):
+        table, column = self.manager.table, self.manager.column
+        staging, legacy = f"{table}_partitioned", f"{table}_legacy"
+        if not runner.is_postgresql:
+            runner.report(f"Skipping {self.describe()} (PostgreSQL only)")
+            return
+        with runner.engine.connect() as conn:
+            if self.manager.is_partitioned(conn):
+                runner.report(f"✓ {table} is already partitioned")
+                return
+
+        # The partition key joins the primary key, so it cannot be NULL
+        runner.backfill(Backfill(f'missing {table}.{column}', table,
+                                 f"{column} = COALESCE((SELECT MIN({column}) FROM {table}), LOCALTIMESTAMP)",
+                                 f"{column} IS NULL", key=self.key))
+
+        inspector = inspect(runner.engine)
+        columns = ', '.join(f'"{c["name"]}"' for c in inspector.get_columns(table))
+        indexes = self._index_definitions(runner, table)
+        with runner.engine.connect() as conn:
+            staged = conn.execute(text("SELECT to_regclass(:name)"), {'name': staging}).scalar() is not None
+        if not staged:
+            statements = [
+                f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})",
+                f"ALTER TABLE {staging} ALTER COLUMN {column} SET NOT NULL",
+                f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_pkey PRIMARY KEY ({self.key}, {column})",
+            ]
+            statements += [definition.replace(f"{name} ON ", f"{name}_new ON ", 1)
+                           .replace(f" ON {table} ", f" ON {staging} ", 1) for name, definition in indexes]
+            for fk in inspector.get_foreign_keys(table):
+                statements.append(
+                    f"ALTER TABLE {staging} ADD CONSTRAINT {fk['name']} "
+                    f"FOREIGN KEY ({', '.join(fk['constrained_columns'])}) "
+                    f"REFERENCES {fk['referred_table']} ({', '.join(fk['referred_columns'])})"
+                )
+            runner.execute_ddl(*statements)
+            runner.report(f"✓ Created {staging} with {len(indexes)} indexes")
+
+        # Changes to rows already copied are recorded from here on and replayed at the swap
+        changes, track = f"{table}_partition_changes", f"{table}_partition_track"
+        with runner.engine.connect() as conn:
+            key_type = conn.execute(text(
+                "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+                "WHERE attrelid = CAST(:table AS regclass) AND attname = :key"
+            ), {'table': table, 'key': self.key}).scalar()
+        runner.execute_ddl(
+            f"CREATE UNLOGGED TABLE IF NOT EXISTS {changes} ({self.key} {key_type} PRIMARY KEY)",
+            f"""CREATE OR REPLACE FUNCTION {track}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO {changes} VALUES (OLD.{self.key}) ON CONFLICT DO NOTHING;
+                IF TG_OP = 'UPDATE' THEN
+                    INSERT INTO {changes} VALUES (NEW.{self.key}) ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END $$""",
+            f"DROP TRIGGER IF EXISTS {track} ON {table}",
+            f"CREATE TRIGGER {track} AFTER UPDATE OR DELETE ON {table} FOR EACH ROW EXECUTE FUNCTION {track}()",
+        )
+
+        with runner.engine.begin() as conn:
+            oldest, newest = conn.execute(text(f"SELECT MIN({column}), MAX({column}) FROM {table}")).one()
+            created = self.manager.ensure(conn, first=oldest.date() if oldest else None, parent=staging)
+        runner.report(f"✓ {len(created)} partitions ready")
+
+        runner.backfill(Backfill(
+            f'copy {table}', table, None, 'true', key=self.key,
+            statement=f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table} "
+                      f"WHERE {self.key} IN :batch_ids ON CONFLICT DO NOTHING",
+        ))
+
+        # Rows scanned in while the copy ran are picked up under the lock, then the names swap
+        since = f"WHERE o.{column} >= :since - INTERVAL '{self.CATCH_UP_MARGIN}' AND" if newest else "WHERE"
+        swap = [
+            f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE",
+            f"DELETE FROM {staging} WHERE {self.key} IN (SELECT {self.key} FROM {changes})",
+            f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table} "
+            f"WHERE {self.key} IN (SELECT {self.key} FROM {changes})",
+            text(f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table} o {since} NOT EXISTS "
+                 f"(SELECT 1 FROM {staging} n WHERE n.{self.key} = o.{self.key} AND n.{column} = o.{column})")
+            .bindparams(**({'since': newest} if newest else {})),
+            f"DROP TRIGGER {track} ON {table}",
+            f"DROP FUNCTION {track}()",
+            f"DROP TABLE {changes}",
+            f"ALTER TABLE {table} RENAME TO {legacy}",
+        ]
+        # The partitioned table now holds the foreign keys; left on the legacy copy they
+        # would block deleting any user it still references
+        for fk in inspector.get_foreign_keys(table):
+            swap.append(f"ALTER TABLE {legacy} DROP CONSTRAINT {fk['name']}")
+        pkey = inspector.get_pk_constraint(table).get('name')
+        if pkey:
+            swap.append(f"ALTER INDEX {pkey} RENAME TO {legacy}_pkey")
+        for name, _ in indexes:
+            swap.append(f"ALTER INDEX {name} RENAME TO {name}_legacy")
+        swap.append(f"ALTER TABLE {staging} RENAME TO {table}")
+        swap.append(f"ALTER INDEX {staging}_pkey RENAME TO {table}_pkey")
+        for name, _ in indexes:
+            swap.append(f"ALTER INDEX {name}_new RENAME TO {name}")
+        runner.execute_ddl(*swap)
+        runner.report(f"✓ {table} is now partitioned by {column}; the old table is kept as {legacy} "
+                      f"(DROP TABLE {legacy} once reports are verified)")
+
+    @staticmethod
+    def _index_definitions(runner, table):
+        """(name, CREATE INDEX statement) for the table's non-unique indexes"""
+        with runner.engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT c.relname, pg_get_indexdef(i.indexrelid)
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                WHERE t.relname = :table AND pg_table_is_visible(t.oid) AND NOT i.indisunique AND i.indisvalid
+            """), {'table': table}).all()
+        # pg_get_indexdef schema-qualifies the table; the swap works on unqualified names
+        return [(name, re.sub(r" ON (?:\w+\.)?" + table + " ", f" ON {table} ", definition, count=1))
+                for name, definition in rows]
+
+
+# Global manager for the activity log, configured from app.config in app.py
+activity_partitions = PartitionManager('activity_logs', 'timestamp')
@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# Derived sizes we serve: (filename suffix, bounding box). The gate display shows
+# 120px and the dashboard list 50px, both at up to 2x pixel density.
+PICTURE_SIZES = [
+    ('', 300),        # gate display; keeps the filename stored in picture_filename
+    ('_thumb', 100),  # dashboard list thumbnail
+]
+
+JPEG_QUALITY = 85
+
+
+def variant_filename(filename, suffix):
+    """Filename of a derived size, e.g. abc.jpg -> abc_thumb.jpg"""
+    name, ext = os.path.splitext(filename)
+    return f"{name}{suffix}{ext}"
+
+
+def _decode(data, largest):
+    """Open an upload, decoding JPEGs in draft mode, upright and in RGB"""
+    # Imported here so workers start without loading Pillow
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(data))
+    # Draft keeps at least the requested size, so the final resize still has detail
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGB')
+
+
+def _write_sizes(image, folder, filename, sizes):
+    """Shrink image through sizes, largest first, writing each one; returns the paths"""
+    from PIL import Image
+
+    written = []
+    for suffix, box in sorted(sizes, key=lambda size: -size[1]):
+        image.thumbnail((box, box), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        path = os.path.join(folder, variant_filename(filename, suffix))
+        tmp_path = f"{path}.tmp"
+        image.save(tmp_path, 'JPEG', quality=JPEG_QUALITY)
+        os.replace(tmp_path, path)
+        written.append(path)
+    return written
+
+
+def render_picture(data, folder, filename, sizes=PICTURE_SIZES):
+    """Decode an upload once and write every derived size.
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale down by 1/2, 1/4
+    or 1/8 while decoding, so a 12 MP photo is never fully materialised.
+    Sizes are produced largest first, each from the previous one.
+    """
+    image = _decode(data, max(box for _, box in sizes))
+    return _write_sizes(image, folder, filename, sizes)
+
+
+class PictureProcessor:
+    """Writes the gate-size picture during the request and the smaller sizes on a thread pool.
+
+    Draft decoding keeps the gate size cheap, so picture_filename always
+    names a file that exists once save() returns. The remaining sizes are
+    shrunk from that image by a small pool; Pillow releases the GIL while
+    resampling. Pending jobs are tracked per filename so a picture can be
+    deleted without a late job writing its files back.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}  # filename -> Future of its smaller sizes
+
+    def save(self, data, folder, filename, sizes=PICTURE_SIZES):
+        """Write the largest size now and queue the rest; raises if the upload cannot be decoded"""
+        largest, *smaller = sorted(sizes, key=lambda size: -size[1])
+        image = _decode(data, largest[1])
+        _write_sizes(image, folder, filename, [largest])
+        if smaller:
+            with self._lock:
+                future = self._pool().submit(_write_sizes, image, folder, filename, smaller)
+                self._pending[filename] = future
+            future.add_done_callback(lambda done: self._finished(filename, done))
+        return filename
+
+    def _pool(self):
+        """The thread pool, created on first use; call with _lock held"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='picture-worker')
+        return self._executor
+
+    def _finished(self, filename, future):
+        with self._lock:
+            if self._pending.get(filename) is future:
+                del self._pending[filename]
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("Failed to resize picture %s: %s", filename, future.exception())
+
+    def settle(self, filename, timeout=10.0):
+        """Cancel or wait out the pending job of a picture, so its files can be deleted"""
+        with self._lock:
+            future = self._pending.pop(filename, None)
+        if future is not None and not future.cancel():
+            try:
+                future.result(timeout)
+            except Exception:
+                pass  # already logged; whatever was written is deleted with the rest
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+# Global picture processor
+picture_processor = PictureProcessor()
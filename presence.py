@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import namedtuple
+
+Occupant = namedtuple('Occupant', ['id', 'qr_code_id', 'full_name', 'company', 'role', 'since'])
+
+
+def group_roll_call(occupants):
+    """Occupants grouped by company, then role, each sorted by name"""
+    companies = {}
+    for occupant in occupants:
+        companies.setdefault(occupant.company or 'No Company', {}) \
+                 .setdefault(occupant.role or 'No Role', []).append(occupant)
+
+    groups = []
+    for company in sorted(companies):
+        roles = []
+        for role in sorted(companies[company]):
+            people = sorted(companies[company][role], key=lambda o: (o.full_name or '').lower())
+            roles.append({'role': role, 'count': len(people), 'occupants': people})
+        groups.append({'company': company, 'count': sum(r['count'] for r in roles), 'roles': roles})
+
+    return {'total': sum(group['count'] for group in groups), 'companies': groups}
+
+
+class PresenceBoard:
+    """In-memory mirror of who is checked in, grouped for roll-call.
+
+    The access path updates it on every check-in/check-out handled by this
+    worker; it is reloaded from the database every resync_interval seconds to
+    pick up scans handled by other workers. That lag is fine for the presence
+    API but not for a muster, which reads the database instead.
+    """
+
+    def __init__(self, resync_interval=30):
+        self.resync_interval = resync_interval
+        self._occupants = {}  # user id -> Occupant
+        self._loaded_at = None
+        self._roll_call = None  # grouped snapshot, rebuilt after changes
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        with self._lock:
+            return self._loaded_at is None or time.monotonic() - self._loaded_at > self.resync_interval
+
+    def load(self, occupants):
+        """Replace the board with a fresh list of occupants from the database"""
+        with self._lock:
+            self._occupants = {occupant.id: occupant for occupant in occupants}
+            self._loaded_at = time.monotonic()
+            self._roll_call = None
+            self._version += 1
+
+    def check_in(self, occupant):
+        with self._lock:
+            self._occupants[occupant.id] = occupant
+            self._roll_call = None
+            self._version += 1
+
+    def check_out(self, user_id):
+        with self._lock:
+            if self._occupants.pop(user_id, None) is not None:
+                self._roll_call = None
+                self._version += 1
+
+    def invalidate(self):
+        """Force a reload on the next roll-call"""
+        with self._lock:
+            self._loaded_at = None
+
+    def roll_call(self):
+        """Current occupants grouped by company, then role"""
+        with self._lock:
+            if self._roll_call is not None:
+                return self._roll_call
+            occupants = list(self._occupants.values())
+            version = self._version
+
+        roll_call = group_roll_call(occupants)
+        with self._lock:
+            if self._version == version:
+                self._roll_call = roll_call
+        return roll_call
+
+
+# Global presence board
+presence_board = PresenceBoard()
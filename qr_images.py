@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+# Render parameters that go into the image, and therefore into its content hash
+QR_PARAMS = {
+    'version': 1,
+    'error_correction': 'L',
+    'box_size': 10,
+    'border': 4,
+}
+
+
+def _new_qr(box_size, params=QR_PARAMS):
+    """QRCode builder; qrcode (and Pillow under it) is imported on first render, not at startup"""
+    import qrcode
+
+    return qrcode.QRCode(
+        version=params['version'],
+        error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{params['error_correction']}"),
+        box_size=box_size,
+        border=params['border'],
+    )
+
+
+# Formats and named sizes (box size in pixels/units per module) served by /qr/<badge>
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+QR_SIZES = {
+    'sm': 4,
+    'md': 10,
+    'lg': 20,
+}
+
+
+def qr_filename(payload, params=QR_PARAMS):
+    """Content-addressed filename: identical payload and parameters always map to the same file"""
+    key = '|'.join([payload] + [f"{name}={params[name]}" for name in sorted(params)])
+    return f"qr_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.png"
+
+
+def render_qr_png(payload, filepath, params=QR_PARAMS):
+    """Render one QR code PNG. Module-level so it can run in a worker process."""
+    qr = _new_qr(params['box_size'], params)
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    # Write under a temporary name so a concurrent reader never sees a partial file
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    img.save(tmp_path, 'PNG')
+    os.replace(tmp_path, filepath)
+    return filepath
+
+
+class QRImageGenerator:
+    """Renders QR images into a folder, skipping images that already exist.
+
+    Batches larger than parallel_threshold are fanned out across a process
+    pool, since rendering is CPU-bound.
+    """
+
+    def __init__(self, folder, workers=None, parallel_threshold=32):
+        self.folder = folder
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+
+    def generate(self, payload):
+        """Render a single image if needed and return its filename"""
+        filename = qr_filename(payload)
+        filepath = os.path.join(self.folder, filename)
+        if not os.path.exists(filepath):
+            os.makedirs(self.folder, exist_ok=True)
+            render_qr_png(payload, filepath)
+        return filename
+
+    def generate_batch(self, payloads, executor=None):
+        """Render every missing image for a batch of payloads.
+
+        Returns ({payload: filename or None}, {'generated', 'reused', 'failed'}).
+        Pass an executor to reuse one pool across several batches; small
+        batches are still rendered inline.
+        """
+        filenames = {}
+        counts = {'generated': 0, 'reused': 0, 'failed': 0}
+        pending = {}  # payload -> filepath still to render
+        for payload in payloads:
+            if payload in filenames or payload in pending:
+                continue
+            filename = qr_filename(payload)
+            filepath = os.path.join(self.folder, filename)
+            if os.path.exists(filepath):
+                filenames[payload] = filename
+                counts['reused'] += 1
+            else:
+                pending[payload] = filepath
+
+        if not pending:
+            return filenames, counts
+
+        os.makedirs(self.folder, exist_ok=True)
+        if len(pending) < self.parallel_threshold:
+            results = {}
+            for payload, filepath in pending.items():
+                try:
+                    results[payload] = render_qr_png(payload, filepath)
+                except Exception as e:
+                    results[payload] = e
+        elif executor is None:
+            with self.executor() as pool:
+                results = self._render_with(pool, pending)
+        else:
+            results = self._render_with(executor, pending)
+
+        for payload, result in results.items():
+            if isinstance(result, Exception):
+                logging.error("Failed to render QR code for %s: %s", payload, result)
+                filenames[payload] = None
+                counts['failed'] += 1
+            else:
+                filenames[payload] = os.path.basename(result)
+                counts['generated'] += 1
+        return filenames, counts
+
+    def executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    @staticmethod
+    def _render_with(pool, pending):
+        futures = {payload: pool.submit(render_qr_png, payload, filepath)
+                   for payload, filepath in pending.items()}
+        results = {}
+        for payload, future in futures.items():
+            try:
+                results[payload] = future.result()
+            except Exception as e:
+                results[payload] = e
+        return results
+
+
+def qr_cache_key(payload, fmt='png', box_size=QR_PARAMS['box_size']):
+    """Content hash of a rendered image; doubles as its strong ETag"""
+    params = dict(QR_PARAMS, box_size=box_size, format=fmt)
+    key = '|'.join([payload] + [f"{name}={params[name]}" for name in sorted(params)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def render_qr(payload, fmt='png', box_size=QR_PARAMS['box_size']):
+    """Render a QR code to PNG or SVG bytes"""
+    qr = _new_qr(box_size)
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    if fmt == 'svg':
+        return _svg_from_matrix(qr.get_matrix(), box_size)
+
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _svg_from_matrix(matrix, box_size):
+    """Compact SVG: one path, with each horizontal run of dark modules drawn as a single rectangle"""
+    segments = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                segments.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    size = len(matrix)
+    pixels = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(segments)}" fill="#000"/></svg>'
+    ).encode('utf-8')
+
+
+class QRRenderCache:
+    """Bounded two-level LRU of rendered QR images: bytes in memory, files on disk.
+
+    Entries are keyed by qr_cache_key, so they never go stale; the disk level
+    is pruned back to max_files (least recently used first) when it overflows.
+    """
+
+    def __init__(self, folder, max_entries=512, max_files=10000):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self._entries = OrderedDict()  # key -> bytes
+        self._file_count = None
+        self._lock = threading.Lock()
+        self._metrics = {'memory_hits': 0, 'disk_hits': 0, 'renders': 0}
+
+    def get(self, payload, fmt='png', box_size=QR_PARAMS['box_size']):
+        """Return (key, image bytes), rendering the image if neither level has it"""
+        key = qr_cache_key(payload, fmt, box_size)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._metrics['memory_hits'] += 1
+                return key, data
+
+        filepath = os.path.join(self.folder, f"{key}.{fmt}")
+        try:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            os.utime(filepath)  # mark as recently used for pruning
+            metric = 'disk_hits'
+        except FileNotFoundError:
+            data = render_qr(payload, fmt, box_size)
+            self._write_file(filepath, data)
+            metric = 'renders'
+
+        with self._lock:
+            self._metrics[metric] += 1
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return key, data
+
+    def _write_file(self, filepath, data):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+
+        with self._lock:
+            if self._file_count is None:
+                self._file_count = len(os.listdir(self.folder))
+            else:
+                self._file_count += 1
+            # Prune in one go once 10% over the limit rather than on every write
+            if self._file_count <= self.max_files * 1.1:
+                return
+            self._file_count = None
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.folder):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_files)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics, memory_entries=len(self._entries), max_entries=self.max_entries)
@@ -17,13 +17,14 @@ from sqlalchemy.exc import NoResultFound
 from werkzeug.local import LocalProxy
 
 from app import app, db
+from auth import load_user as load_session_user
 from models import AdminUser
 
 login_manager = LoginManager(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return AdminUser.query.get(user_id)
+    return load_session_user(user_id)
 
 class UserSessionStorage(BaseStorage):
     def get(self, blueprint):
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Only the fields the access decision and the gate display need
+RosterEntry = namedtuple('RosterEntry', [
+    'id',
+    'qr_code_id',
+    'full_name',
+    'complete_name',
+    'role',
+    'company',
+    'status',
+    'is_checked_in',
+    'picture_filename',
+    'qr_code_filename',
+])
+
+
+def normalize_badge(qr_code_id):
+    """Normalize a scanned badge ID the same way lookups do"""
+    return (qr_code_id or '').strip().upper()
+
+
+class RosterCache:
+    """Bounded TTL + LRU cache of roster entries keyed by normalized badge ID.
+
+    Entries are per process, so only known badges are cached: a badge
+    registered on another worker must be found on its first scan here.
+    """
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # badge -> (expires_at, entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_size=None, ttl=None):
+        """Apply settings from the app config"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def get(self, qr_code_id, loader):
+        """Return the cached entry for a badge, calling loader(badge) on a miss.
+
+        The loader returns a RosterEntry or None; unknown badges are not
+        cached, so each scan of one asks the database again.
+        """
+        badge = normalize_badge(qr_code_id)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(badge)
+            if cached and cached[0] > now:
+                self._entries.move_to_end(badge)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        entry = loader(badge)
+        self.put(badge, entry)
+        return entry
+
+    def reload(self, qr_code_id, loader):
+        """Load a badge from the database even if it is cached, and store the result"""
+        entry = loader(normalize_badge(qr_code_id))
+        self.put(qr_code_id, entry)
+        return entry
+
+    def put(self, qr_code_id, entry):
+        """Store an entry; None (an unknown badge) drops any cached entry instead"""
+        badge = normalize_badge(qr_code_id)
+        if entry is None:
+            with self._lock:
+                self._entries.pop(badge, None)
+            return
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[badge] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(badge)
+            self._evict()
+
+    def invalidate(self, *qr_code_ids):
+        """Drop the given badges so the next lookup reloads them"""
+        with self._lock:
+            for qr_code_id in qr_code_ids:
+                if self._entries.pop(normalize_badge(qr_code_id), None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters for the metrics endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+# Global cache instance
+roster_cache = RosterCache()
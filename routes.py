@@ -1,18 +1,42 @@
-from flask import render_template, request, redirect, url_for, flash, make_response, session, jsonify
+from flask import render_template, request, redirect, url_for, flash, make_response, session, jsonify, Response, stream_with_context
 from flask_login import current_user
 from datetime import datetime
 import logging
 import csv
 import io
+import json
+import time
+import zlib
+from werkzeug.utils import secure_filename
 
 from app import app, db
 from auth import require_login, require_admin, require_super_admin, create_default_admin
 from security_service import security_service
+from roster_cache import roster_cache
+from activity_writer import activity_writer
+from live_feed import live_feed
+from import_sessions import import_sessions
+from pictures import variant_filename
+from user_index import user_index
+from session_users import session_user_cache
+from log_pipeline import log_pipeline
+from startup import startup_timer
+from partitions import activity_partitions
+from traffic_rollups import traffic_rollups, GROUP_BY
+from qr_images import QR_FORMATS, QR_SIZES, qr_cache_key
 
-# Make session permanent
+# Scan events get their own logger so they can be levelled and sampled separately (LOG_SAMPLE)
+scan_log = logging.getLogger('gateguard.scan')
+
+# Dashboard thumbnails live next to the gate-size picture (see pictures.py)
+app.add_template_filter(variant_filename, 'picture_variant')
+
+# Make session permanent; only the first request needs to set the flag,
+# assigning it again would mark the session modified on every request
 @app.before_request
 def make_session_permanent():
-    session.permanent = True
+    if not session.permanent:
+        session.permanent = True
 
 @app.route('/')
 def index():
@@ -25,15 +49,31 @@ def index():
 @require_admin
 def admin_dashboard():
     """Admin dashboard for user management"""
-    users = security_service.get_all_users()
+    user_page = security_service.page_users(**_user_list_args())
     recent_activity = security_service.get_activity_log(limit=10)
     stats = security_service.get_statistics()
     
     return render_template('admin_dashboard.html', 
                           user=current_user, 
-                          users=users, 
+                          users=user_page['users'], 
+                          user_page=user_page,
+                          companies=security_service.list_companies(),
                           recent_activity=recent_activity,
-                          stats=stats)
+                          stats=stats,
+                          live_last_id=live_feed.last_id)
+
+def _user_list_args():
+    """Filter, sort and paging arguments for the admin user list"""
+    page_size = request.args.get('page_size', type=int) or app.config['USERS_PAGE_SIZE']
+    return {
+        'query': request.args.get('q', '').strip() or None,
+        'status': request.args.get('status') or None,
+        'company': request.args.get('company') or None,
+        'sort': request.args.get('sort', 'created_at'),
+        'descending': request.args.get('dir', 'desc') != 'asc',
+        'page': request.args.get('page', 1, type=int),
+        'page_size': max(1, min(page_size, app.config['USERS_MAX_PAGE_SIZE']))
+    }
 
 @app.route('/admin/add_user', methods=['POST'])
 @require_admin
@@ -52,7 +92,7 @@ def add_user():
     
     if success:
         flash(message, 'success')
-        logging.info(f"User added: {full_name} ({qr_code_id}) by admin {current_user.email}")
+        logging.info("User added: %s (%s) by admin %s", full_name, qr_code_id, current_user.email)
     else:
         flash(message, 'danger')
     
@@ -74,7 +114,7 @@ def update_user(qr_code_id):
     
     if success:
         flash(message, 'success')
-        logging.info(f"User updated: {qr_code_id} by admin {current_user.email}")
+        logging.info("User updated: %s by admin %s", qr_code_id, current_user.email)
     else:
         flash(message, 'danger')
     
@@ -88,7 +128,7 @@ def delete_user(qr_code_id):
     
     if success:
         flash(message, 'success')
-        logging.info(f"User deleted: {qr_code_id} by admin {current_user.email}")
+        logging.info("User deleted: %s by admin %s", qr_code_id, current_user.email)
     else:
         flash(message, 'danger')
     
@@ -106,7 +146,7 @@ def change_user_status(qr_code_id, status):
     
     if success:
         flash(f'User status changed to {status}', 'success')
-        logging.info(f"User status changed: {qr_code_id} -> {status} by admin {current_user.email}")
+        logging.info("User status changed: %s -> %s by admin %s", qr_code_id, status, current_user.email)
     else:
         flash(message, 'danger')
     
@@ -138,10 +178,12 @@ def access_control():
         
         if success:
             flash(message, 'success')
-            logging.info(f"Access granted: {qr_code_id} - Reason: {visit_reason}")
+            scan_log.info("Access granted: %s - Reason: %s", qr_code_id, visit_reason,
+                          extra={'badge': qr_code_id, 'method': 'QR', 'granted': True})
         else:
             flash(message, 'danger')
-            logging.warning(f"Access denied: {qr_code_id} - {message}")
+            scan_log.warning("Access denied: %s - %s", qr_code_id, message,
+                             extra={'badge': qr_code_id, 'method': 'QR', 'granted': False})
         
         # Return user data for display
         return render_template('access_control.html', user=current_user, scanned_user=user_data)
@@ -158,7 +200,7 @@ def api_get_user_info():
         return jsonify({'success': False, 'message': 'QR Code ID required'})
     
     try:
-        user = security_service.get_user_by_qr(qr_code_id)
+        user = security_service.get_badge(qr_code_id)
         if user:
             return jsonify({
                 'success': True,
@@ -173,7 +215,7 @@ def api_get_user_info():
         else:
             return jsonify({'success': False, 'message': 'User not found'})
     except Exception as e:
-        logging.error(f"Error getting user info: {e}")
+        logging.error("Error getting user info: %s", e)
         return jsonify({'success': False, 'message': 'Error retrieving user information'})
 
 @app.route('/api/process_qr', methods=['POST'])
@@ -199,6 +241,9 @@ def api_process_qr():
         operator_name=current_user.full_name if current_user.is_authenticated else 'System',
         operator_role=current_user.role if current_user.is_authenticated else 'system'
     )
+    scan_log.log(logging.INFO if success else logging.WARNING, "Camera scan %s: %s - %s",
+                 'granted' if success else 'denied', qr_code_id, message,
+                 extra={'badge': qr_code_id, 'method': 'Camera', 'granted': success})
     
     response_data = {
         'success': success,
@@ -213,11 +258,42 @@ def api_process_qr():
             'status': user_data.status,
             'is_checked_in': user_data.is_checked_in,
             'picture_url': f"/static/uploads/{user_data.picture_filename}" if user_data.picture_filename else None,
-            'qr_code_url': f"/static/qr_codes/{user_data.qr_code_filename}" if user_data.qr_code_filename else None
+            'qr_code_url': url_for('qr_image', badge=user_data.qr_code_id)
         }
     
     return jsonify(response_data)
 
+@app.route('/qr/<badge>')
+@require_login
+def qr_image(badge):
+    """Render a badge's QR code on demand (?format=png|svg, ?size=sm|md|lg)"""
+    fmt = request.args.get('format', 'png').lower()
+    size = request.args.get('size', 'md').lower()
+    if fmt not in QR_FORMATS or size not in QR_SIZES:
+        return jsonify({'success': False, 'message': 'Unsupported QR format or size'}), 400
+    
+    entry = security_service.get_badge(badge)
+    if entry is None:
+        return jsonify({'success': False, 'message': 'Unknown badge'}), 404
+    
+    # The image is a pure function of badge, format and size, so the ETag is known before rendering
+    etag = qr_cache_key(entry.qr_code_id, fmt, QR_SIZES[size])
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        _, data = security_service.qr_renderer.get(entry.qr_code_id, fmt, QR_SIZES[size])
+        response = Response(data, mimetype=QR_FORMATS[fmt])
+        if request.args.get('download'):
+            response.headers['Content-Disposition'] = f'attachment; filename=qr_{secure_filename(entry.qr_code_id)}.{fmt}'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = app.config['QR_CACHE_CONTROL']
+    return response
+
+def _report_page_size():
+    """Requested report page size, clamped to the configured maximum"""
+    page_size = request.args.get('page_size', type=int) or app.config['REPORTS_PAGE_SIZE']
+    return max(1, min(page_size, app.config['REPORTS_MAX_PAGE_SIZE']))
+
 @app.route('/reports')
 @require_login
 def reports():
@@ -225,6 +301,8 @@ def reports():
     query = request.args.get('query', '').strip()
     start_date_str = request.args.get('start_date', '')
     end_date_str = request.args.get('end_date', '')
+    cursor = request.args.get('cursor', '')
+    show_totals = request.args.get('count') == '1'
     
     start_date = None
     end_date = None
@@ -241,15 +319,70 @@ def reports():
         except ValueError:
             flash('Invalid end date format', 'warning')
     
-    activities = security_service.search_activity(query, start_date, end_date)
+    try:
+        page = security_service.page_activity(query, start_date, end_date, cursor=cursor or None,
+                                              page_size=_report_page_size(), with_total=show_totals)
+    except ValueError:
+        flash('Invalid page link, showing the newest activity', 'warning')
+        cursor = ''
+        page = security_service.page_activity(query, start_date, end_date,
+                                              page_size=_report_page_size(), with_total=show_totals)
+    
+    summary = security_service.activity_summary(query, start_date, end_date) if show_totals else None
     
     return render_template('reports.html', 
                           user=current_user, 
-                          activities=activities,
+                          activities=page['activities'],
+                          next_cursor=page['next_cursor'],
+                          approximate_total=page.get('approximate_total'),
+                          summary=summary,
+                          is_first_page=not cursor,
+                          show_totals=show_totals,
                           query=query,
                           start_date=start_date_str,
                           end_date=end_date_str)
 
+@app.route('/api/reports/activity')
+@require_login
+def api_reports_activity():
+    """Keyset-paginated activity log as JSON"""
+    query = request.args.get('query', '').strip()
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else None
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else None
+        page = security_service.page_activity(query, start_date, end_date,
+                                              cursor=request.args.get('cursor') or None,
+                                              page_size=_report_page_size(),
+                                              with_total=request.args.get('count') == '1')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    response_data = {
+        'success': True,
+        'activities': [activity_to_dict(activity) for activity in page['activities']],
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor']
+    }
+    if 'approximate_total' in page:
+        response_data['approximate_total'] = page['approximate_total']
+    return jsonify(response_data)
+
+def activity_to_dict(activity):
+    """JSON representation of an ActivityLog row"""
+    return {
+        'id': activity.id,
+        'timestamp': activity.timestamp.isoformat(),
+        'user_name': activity.user_name,
+        'qr_code_id': activity.qr_code_id,
+        'action': activity.action,
+        'method': activity.method,
+        'details': activity.details,
+        'visit_reason': activity.visit_reason,
+        'user_role': activity.user_role,
+        'operator_name': activity.operator_name,
+        'operator_role': activity.operator_role
+    }
+
 @app.route('/reports/export')
 @require_login
 def export_reports():
@@ -273,34 +406,56 @@ def export_reports():
         except ValueError:
             pass
     
-    activities = security_service.search_activity(query, start_date, end_date)
-    
-    # Generate CSV data
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Timestamp', 'User Name', 'QR Code ID', 'Action', 'Method', 'Details', 'Visit Reason', 'User Role', 'Operator', 'Operator Role'])
-    
-    for activity in activities:
-        writer.writerow([
-            activity.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            activity.user_name,
-            activity.qr_code_id,
-            activity.action.replace('_', ' ').title(),
-            activity.method,
-            activity.details,
-            activity.visit_reason or '',
-            activity.user_role or '',
-            activity.operator_name or 'System',
-            activity.operator_role or 'system'
-        ])
-    
-    csv_data = output.getvalue()
-    
-    response = make_response(csv_data)
+    use_gzip = (request.args.get('gzip') == '1' or app.config['REPORTS_EXPORT_GZIP']) and \
+        'gzip' in request.headers.get('Accept-Encoding', '')
+    
+    def generate_csv():
+        # Rows come from a server-side cursor in chunks and are written straight
+        # to the response, so memory stays flat however long the report is
+        output = io.StringIO()
+        writer = csv.writer(output)
+        compressor = zlib.compressobj(wbits=31) if use_gzip else None
+        
+        def drain():
+            data = output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+            return compressor.compress(data) if compressor else data
+        
+        writer.writerow(['Timestamp', 'User Name', 'QR Code ID', 'Action', 'Method', 'Details', 'Visit Reason', 'User Role', 'Operator', 'Operator Role'])
+        
+        for timestamp, user_name, qr_code_id, action, method, details, visit_reason, user_role, operator_name, operator_role in \
+                security_service.iter_activity_rows(query, start_date, end_date, app.config['REPORTS_EXPORT_CHUNK_SIZE']):
+            writer.writerow([
+                timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                user_name,
+                qr_code_id,
+                action.replace('_', ' ').title(),
+                method,
+                details,
+                visit_reason or '',
+                user_role or '',
+                operator_name or 'System',
+                operator_role or 'system'
+            ])
+            if output.tell() >= 64 * 1024:
+                chunk = drain()
+                if chunk:
+                    yield chunk
+        
+        chunk = drain()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+    
+    response = Response(stream_with_context(generate_csv()), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename=activity_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    response.headers['Content-Type'] = 'text/csv'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
     
-    logging.info(f"Activity report exported by admin {current_user.email}")
+    logging.info("Activity report exported by admin %s", current_user.email)
     return response
 
 @app.route('/search_users')
@@ -308,15 +463,72 @@ def export_reports():
 def search_users():
     """Search users API endpoint"""
     query = request.args.get('q', '').strip()
-    users = security_service.search_users(query)
+    user_page = security_service.page_users(**_user_list_args())
     recent_activity = security_service.get_activity_log(limit=10)
     stats = security_service.get_statistics()
     return render_template('admin_dashboard.html', 
                           user=current_user, 
-                          users=users, 
+                          users=user_page['users'], 
+                          user_page=user_page,
+                          companies=security_service.list_companies(),
                           recent_activity=recent_activity,
                           stats=stats,
-                          search_query=query)
+                          search_query=query,
+                          live_last_id=live_feed.last_id)
+
+@app.route('/api/users')
+@require_login
+def api_users():
+    """JSON page of the user list (same filters and sorting as the dashboard)"""
+    user_page = security_service.page_users(**_user_list_args())
+    return jsonify({
+        'success': True,
+        'users': [user_to_dict(u) for u in user_page['users']],
+        'total': user_page['total'],
+        'page': user_page['page'],
+        'page_size': user_page['page_size'],
+        'pages': user_page['pages'],
+        'sort': user_page['sort'],
+        'dir': 'desc' if user_page['descending'] else 'asc'
+    })
+
+@app.route('/api/users/typeahead')
+@require_login
+def api_users_typeahead():
+    """Ranked quick-search over names, badges, ID numbers and companies"""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    started = time.perf_counter()
+    users, source = security_service.typeahead_users(query, limit) if query else ([], 'index')
+    return jsonify({
+        'success': True,
+        'query': query,
+        'source': source,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+        'results': [{
+            'id': u.id,
+            'full_name': u.full_name,
+            'qr_code_id': u.qr_code_id,
+            'id_number': u.id_number,
+            'company': u.company,
+            'status': u.status
+        } for u in users]
+    })
+
+def user_to_dict(user):
+    """JSON representation of a user list row"""
+    return {
+        'id': user.id,
+        'full_name': user.full_name,
+        'company': user.company,
+        'contact_number': user.contact_number,
+        'qr_code_id': user.qr_code_id,
+        'status': user.status,
+        'is_checked_in': user.is_checked_in,
+        'picture_url': f"/static/uploads/{user.picture_filename}" if user.picture_filename else None,
+        'qr_code_url': url_for('qr_image', badge=user.qr_code_id) if user.qr_code_id else None,
+        'created_at': user.created_at.isoformat() if user.created_at else None
+    }
 
 @app.route('/admin/download_csv_template')
 @require_login
@@ -331,7 +543,7 @@ def download_csv_template():
     response.headers['Content-Disposition'] = 'attachment; filename=user_import_template.csv'
     response.headers['Content-Type'] = 'text/csv'
     
-    logging.info(f"CSV template downloaded by admin {current_user.email}")
+    logging.info("CSV template downloaded by admin %s", current_user.email)
     return response
 
 @app.route('/admin/analyze_csv', methods=['POST'])
@@ -347,34 +559,261 @@ def analyze_csv():
         result = security_service.analyze_csv(csv_file)
         return jsonify(result)
     except Exception as e:
-        logging.error(f"CSV analysis error: {str(e)}")
+        logging.error("CSV analysis error: %s", e)
         return jsonify({'success': False, 'message': 'Error analyzing CSV file'}), 500
 
 @app.route('/admin/import_csv', methods=['POST'])
 @require_login
 def import_csv():
-    """Import users from CSV file"""
+    """Import users from the analyzed upload (import_token) or from a CSV file"""
+    import_token = request.form.get('import_token')
     csv_file = request.files.get('csv_file')
     
-    if not csv_file or not csv_file.filename.endswith('.csv'):
+    if not import_token and (not csv_file or not csv_file.filename.endswith('.csv')):
         return jsonify({'success': False, 'message': 'Please upload a valid CSV file'}), 400
     
     try:
-        result = security_service.import_csv(csv_file)
+        if app.config['IMPORT_JOBS_ENABLED']:
+            job, error = security_service.create_import_job(
+                csv_file=csv_file if not import_token else None,
+                import_token=import_token,
+                filename=csv_file.filename if csv_file else None,
+                created_by=current_user.id
+            )
+            if job is None:
+                return jsonify({'success': False, 'token_expired': bool(import_token), 'message': error})
+            
+            logging.info("CSV import job %s queued by admin %s", job.id, current_user.email)
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status_url': url_for('import_job_status', job_id=job.id),
+                'message': 'Import queued'
+            }), 202
+        
+        if import_token:
+            result = security_service.import_csv(import_token=import_token)
+        else:
+            result = security_service.import_csv(csv_file)
         
         if result['success']:
-            logging.info(f"CSV import: {result['imported_count']} users imported by admin {current_user.email}")
+            logging.info("CSV import: %s users imported by admin %s", result['imported_count'], current_user.email)
         
         return jsonify(result)
     except Exception as e:
-        logging.error(f"CSV import error: {str(e)}")
+        logging.error("CSV import error: %s", e)
         return jsonify({'success': False, 'message': 'Error importing CSV file'}), 500
 
+def import_job_to_dict(job):
+    """JSON representation of an ImportJob, with throughput since it started"""
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.now()) - job.started_at).total_seconds()
+    return {
+        'id': job.id,
+        'status': job.status,
+        'filename': job.filename,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'imported_count': job.imported_count,
+        'duplicate_count': job.duplicate_count,
+        'error_count': job.error_count,
+        'errors': json.loads(job.errors or '[]'),
+        'message': job.message,
+        'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+        'rows_per_second': round(job.processed_rows / elapsed, 1) if elapsed else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+@app.route('/admin/import_jobs/<job_id>')
+@require_login
+def import_job_status(job_id):
+    """Progress of a background CSV import"""
+    job = security_service.get_import_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Import job not found'}), 404
+    return jsonify({'success': True, 'job': import_job_to_dict(job)})
+
+@app.route('/admin/import_jobs/<job_id>/retry', methods=['POST'])
+@require_login
+def retry_import_job(job_id):
+    """Resume a failed import from its last checkpoint"""
+    if not security_service.retry_import_job(job_id):
+        return jsonify({'success': False, 'message': 'Only failed import jobs can be retried'}), 409
+    return jsonify({'success': True, 'status_url': url_for('import_job_status', job_id=job_id)})
+
+@app.route('/api/presence')
+@require_login
+def api_presence():
+    """Current occupants grouped by company and role"""
+    roll_call = security_service.get_roll_call()
+    return jsonify({
+        'success': True,
+        'generated_at': datetime.now().isoformat(),
+        'total': roll_call['total'],
+        'companies': [{
+            'company': group['company'],
+            'count': group['count'],
+            'roles': [{
+                'role': role['role'],
+                'count': role['count'],
+                'occupants': [{
+                    'full_name': occupant.full_name,
+                    'qr_code_id': occupant.qr_code_id,
+                    'since': occupant.since.isoformat() if occupant.since else None
+                } for occupant in role['occupants']]
+            } for role in group['roles']]
+        } for group in roll_call['companies']]
+    })
+
+@app.route('/admin/muster')
+@require_login
+def muster():
+    """Printable roll-call of everyone currently on site"""
+    return render_template('muster.html',
+                          user=current_user,
+                          roll_call=security_service.get_roll_call(fresh=True),
+                          generated_at=datetime.now())
+
+def _traffic_params():
+    """Date range and breakdown for the traffic report; defaults to this month by company, hourly"""
+    today = datetime.now().date()
+    start = request.args.get('start_date')
+    end = request.args.get('end_date')
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else today.replace(day=1)
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else today
+    if end < start:
+        raise ValueError('end_date is before start_date')
+    group_by = request.args.get('group_by', 'company')
+    return start, end, request.args.get('granularity', 'hour'), None if group_by == 'none' else group_by
+
+@app.route('/admin/traffic')
+@require_admin
+def traffic_dashboard():
+    """Check-ins, check-outs and denials over time from the traffic rollups"""
+    try:
+        start, end, granularity, group_by = _traffic_params()
+        report = traffic_rollups.report(start, end, granularity, group_by)
+    except ValueError as e:
+        flash(f'Invalid traffic filter: {e}', 'warning')
+        start, end, granularity, group_by = datetime.now().date().replace(day=1), datetime.now().date(), 'hour', 'company'
+        report = traffic_rollups.report(start, end, granularity, group_by)
+    
+    # One row per bucket with check-ins for the busiest groups; the rest are summed as "Other"
+    shown = report['groups'][:8]
+    rows = {}
+    for point in report['series']:
+        row = rows.setdefault(point['bucket'], {'groups': {}, 'other': 0, 'check_ins': 0,
+                                                'check_outs': 0, 'denials': 0})
+        if point['group'] in shown or not group_by:
+            row['groups'][point['group']] = row['groups'].get(point['group'], 0) + point['check_ins']
+        else:
+            row['other'] += point['check_ins']
+        for key in ('check_ins', 'check_outs', 'denials'):
+            row[key] += point[key]
+    peak = max((row['check_ins'] for row in rows.values()), default=0)
+    
+    return render_template('traffic.html',
+                          user=current_user,
+                          report=report,
+                          rows=sorted(rows.items()),
+                          groups=shown if group_by else [],
+                          has_other=len(report['groups']) > len(shown),
+                          peak=peak,
+                          start_date=start.isoformat(),
+                          end_date=end.isoformat(),
+                          granularity=granularity,
+                          group_by=group_by or 'none',
+                          group_by_options=GROUP_BY)
+
+@app.route('/api/traffic')
+@require_login
+def api_traffic():
+    """Traffic counts per hour or day, optionally per company, role or operator, as JSON"""
+    try:
+        start, end, granularity, group_by = _traffic_params()
+        report = traffic_rollups.report(start, end, granularity, group_by)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'granularity': granularity,
+        'group_by': group_by,
+        'groups': report['groups'],
+        'totals': report['totals'],
+        'series': [dict(point, bucket=point['bucket'].isoformat()) for point in report['series']],
+        'rolled_up_through': report['rolled_up_through'].isoformat() if report['rolled_up_through'] else None,
+        'elapsed_ms': report['elapsed_ms']
+    })
+
+@app.route('/admin/live')
+@require_admin
+def live_activity_stream():
+    """Server-Sent Events stream of scans handled by this worker"""
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', default=live_feed.last_id, type=int)
+    stream_seconds = app.config['LIVE_FEED_STREAM_SECONDS']
+    
+    # Every open stream pins a worker thread; past the cap, shed the dashboard rather than the scanners
+    if not live_feed.open_stream():
+        retry_seconds = app.config['LIVE_FEED_BUSY_RETRY_SECONDS']
+        response = Response(f'retry: {retry_seconds * 1000}\n\n', status=503, mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(retry_seconds)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    def generate_events(last_id):
+        # Streams are bounded so a worker thread is never held forever; EventSource reconnects
+        deadline = time.monotonic() + stream_seconds
+        yield 'retry: 2000\n\n'
+        while time.monotonic() < deadline:
+            events = live_feed.wait(last_id, timeout=min(15, max(0, deadline - time.monotonic())))
+            if events is None:
+                # The client fell behind the ring buffer; it should reload instead of showing gaps
+                last_id = live_feed.last_id
+                yield f'id: {last_id}\nevent: reset\ndata: {{}}\n\n'
+            elif not events:
+                yield ': keep-alive\n\n'
+            for event_id, event_type, data in events or []:
+                last_id = event_id
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+    
+    response = Response(generate_events(last_id), mimetype='text/event-stream')
+    # Runs when the stream ends or the client disconnects, even if the generator never started
+    response.call_on_close(live_feed.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/admin/metrics')
+@require_admin
+def admin_metrics():
+    """In-process performance counters for this worker"""
+    return jsonify({
+        'roster_cache': roster_cache.stats(),
+        'qr_render_cache': security_service.qr_renderer.stats(),
+        'import_sessions': import_sessions.stats(),
+        'user_index': user_index.stats(),
+        'session_users': session_user_cache.stats(),
+        'logging': log_pipeline.stats(),
+        'startup': startup_timer.stats(),
+        'activity_writer': activity_writer.stats(),
+        'activity_partitions': activity_partitions.stats(),
+        'traffic_rollups': traffic_rollups.stats(),
+        'live_feed': live_feed.stats()
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('403.html', error_message="Page not found"), 404
 
 @app.errorhandler(500)
 def internal_error(error):
-    logging.error(f"Internal server error: {error}")
+    logging.error("Internal server error: %s", error)
     return render_template('403.html', error_message="Internal server error"), 500
@@ -1,196 +1,243 @@
 import os
+import json
+import logging
+import time
 import uuid
-from datetime import datetime
-from werkzeug.utils import secure_filename
-from PIL import Image
+import itertools
+import threading
+from datetime import datetime, timedelta
 from sqlalchemy import text
-from app import db
-from models import SecurityUser, ActivityLog
+from app import app, db
+from models import SecurityUser, ActivityLog, UserCounters, ImportJob
+from roster_cache import roster_cache, RosterEntry
+from activity_writer import activity_writer
+from partitions import activity_partitions
+from traffic_rollups import traffic_rollups
+from presence import presence_board, group_roll_call, Occupant
+from live_feed import live_feed
+from qr_images import QRImageGenerator, QRRenderCache
+from pictures import picture_processor, variant_filename, PICTURE_SIZES
+from user_index import user_index, rebuild_user_index, IndexedUser
+from csv_ingest import read_user_csv, CSVFormatError
+from import_sessions import import_sessions, HashingReader
+from import_jobs import import_job_runner, ImportJobLost
 
-import qrcode
-from io import BytesIO
 import base64
 
+# Check-in/check-out decision for PostgreSQL: status check, toggle and activity
+# insert in a single statement. :now is read before the row lock is granted, so the
+# logged time is kept past the previous toggle's; concurrent scans of one badge then
+# appear in the activity log in the order they were applied
+_ACCESS_TOGGLE_SQL = text("""
+    WITH toggled AS (
+        UPDATE security_users
+        SET is_checked_in = NOT COALESCE(is_checked_in, false),
+            updated_at = GREATEST(:now, updated_at + INTERVAL '1 microsecond')
+        WHERE id = :user_id AND status = 'allowed'
+        RETURNING id, COALESCE(full_name, complete_name) AS full_name, role, status, is_checked_in, updated_at
+    ), logged AS (
+        INSERT INTO activity_logs (id, security_user_id, qr_code_id, user_name, action, method, details,
+                                   visit_reason, user_role, operator_id, operator_name, operator_role, timestamp)
+        SELECT :log_id, id, :qr_code_id, full_name,
+               CASE WHEN is_checked_in THEN 'check_in' ELSE 'check_out' END,
+               :method, 'Success', :visit_reason, role, :operator_id, :operator_name, :operator_role, updated_at
+        FROM toggled
+    ), counted AS (
+        UPDATE user_counters
+        SET checked_in_users = checked_in_users + (SELECT CASE WHEN is_checked_in THEN 1 ELSE -1 END FROM toggled),
+            updated_at = :now
+        WHERE id = 1 AND EXISTS (SELECT 1 FROM toggled)
+    )
+    SELECT id, full_name, role, status, is_checked_in FROM toggled
+""")
+
+def encode_activity_cursor(activity):
+    """Opaque keyset cursor for the position after an activity row"""
+    raw = f"{activity.timestamp.isoformat()}|{activity.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_activity_cursor(cursor):
+    """Decode a cursor from encode_activity_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, activity_id = raw.split('|', 1)
+        return datetime.fromisoformat(timestamp), activity_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid page cursor") from e
+
+# Columns shown in the admin user list, and the columns it can be sorted by
+USER_LIST_COLUMNS = (
+    SecurityUser.id,
+    SecurityUser.full_name,
+    SecurityUser.company,
+    SecurityUser.contact_number,
+    SecurityUser.qr_code_id,
+    SecurityUser.status,
+    SecurityUser.is_checked_in,
+    SecurityUser.picture_filename,
+    SecurityUser.created_at,
+)
+
+USER_LIST_SORTS = {
+    'created_at': SecurityUser.created_at,
+    'name': SecurityUser.full_name,
+    'company': SecurityUser.company,
+    'qr_code_id': SecurityUser.qr_code_id,
+    'status': SecurityUser.status,
+    'checked_in': SecurityUser.is_checked_in,
+}
+
+# Row errors returned by analyze_csv; the error count still covers every row
+MAX_REPORTED_ERRORS = 100
+
 class SecurityService:
     def __init__(self):
         self.upload_folder = 'static/uploads'
         self.qr_folder = 'static/qr_codes'
         self.allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
-        os.makedirs(self.upload_folder, exist_ok=True)
-        os.makedirs(self.qr_folder, exist_ok=True)
+        self._stats_cache = None  # (expires_at, stats)
+        # Folders are created on first write, keeping filesystem work out of worker startup
+        self.qr_generator = QRImageGenerator(self.qr_folder,
+                                             workers=app.config.get("QR_WORKERS"),
+                                             parallel_threshold=app.config.get("QR_PARALLEL_THRESHOLD", 32))
+        self.qr_renderer = QRRenderCache(app.config.get("QR_CACHE_FOLDER", "static/qr_cache"),
+                                         max_entries=app.config.get("QR_CACHE_ENTRIES", 512),
+                                         max_files=app.config.get("QR_CACHE_FILES", 10000))
+        roster_cache.configure(max_size=app.config.get("ROSTER_CACHE_SIZE"),
+                               ttl=app.config.get("ROSTER_CACHE_TTL"))
+        presence_board.resync_interval = app.config.get("PRESENCE_RESYNC_INTERVAL", 30)
+        live_feed.configure(app.config.get("LIVE_FEED_BUFFER_SIZE", 500), app.config.get("LIVE_FEED_MAX_STREAMS", 4))
+        import_sessions.configure(ttl=app.config.get("IMPORT_SESSION_TTL"),
+                                  max_rows=app.config.get("IMPORT_SESSION_MAX_ROWS"))
+        picture_processor.workers = app.config.get("PICTURE_WORKERS", 2)
+        user_index.rebuild_interval = app.config.get("USER_INDEX_REBUILD_INTERVAL", 300)
+        if app.config.get("USER_INDEX_ENABLED"):
+            self._schedule_index_rebuild()
+        self.import_job_folder = app.config.get("IMPORT_JOB_FOLDER", "import_jobs")
+        if app.config.get("IMPORT_JOBS_ENABLED"):
+            import_job_runner.poll_interval = app.config["IMPORT_JOB_POLL_INTERVAL"]
+            import_job_runner.stale_after = app.config["IMPORT_JOB_STALE_SECONDS"]
+            import_job_runner.start(app)
+        if app.config.get("ACTIVITY_PARTITION_MAINTENANCE"):
+            activity_partitions.start(app)
+        if app.config.get("TRAFFIC_ROLLUP_ENABLED"):
+            traffic_rollups.configure(interval=app.config["TRAFFIC_ROLLUP_INTERVAL"],
+                                      lag=app.config["TRAFFIC_ROLLUP_LAG"])
+            traffic_rollups.start(app)
+        if app.config.get("ACTIVITY_LOG_ASYNC"):
+            activity_writer.max_queue = app.config["ACTIVITY_LOG_QUEUE_SIZE"]
+            activity_writer.batch_size = app.config["ACTIVITY_LOG_BATCH_SIZE"]
+            activity_writer.flush_interval = app.config["ACTIVITY_LOG_FLUSH_INTERVAL"]
+            activity_writer.start(app)
     
     def allowed_file(self, filename):
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
     
     def save_picture(self, picture_file):
-        """Save and resize user picture"""
+        """Store an uploaded picture; returns its filename, or None if it is not a usable image.
+        
+        The gate-size file exists when this returns; the thumbnail follows
+        from the picture worker.
+        """
         if not picture_file or not self.allowed_file(picture_file.filename):
             return None
         
-        # Generate unique filename
-        filename = secure_filename(picture_file.filename)
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{uuid.uuid4().hex}{ext}"
-        filepath = os.path.join(self.upload_folder, unique_filename)
-        
-        # Resize and save image
-        image = Image.open(picture_file)
-        image = image.convert('RGB')
-        # Resize to 300x300 while maintaining aspect ratio
-        image.thumbnail((300, 300), Image.Resampling.LANCZOS)
-        image.save(filepath, 'JPEG', quality=85)
-        
-        return unique_filename
+        # Every derived size is stored as JPEG
+        unique_filename = f"{uuid.uuid4().hex}.jpg"
+        os.makedirs(self.upload_folder, exist_ok=True)
+        try:
+            return picture_processor.save(picture_file.read(), self.upload_folder, unique_filename)
+        except Exception as e:
+            logging.warning("Rejected picture upload %s: %s", picture_file.filename, e)
+            self._remove_picture(unique_filename)
+            return None
+    
+    def _remove_picture(self, filename):
+        """Delete a stored picture and its derived sizes"""
+        picture_processor.settle(filename)
+        for suffix, _ in PICTURE_SIZES:
+            path = os.path.join(self.upload_folder, variant_filename(filename, suffix))
+            if os.path.exists(path):
+                os.remove(path)
     
     def generate_qr_code(self, qr_code_id, user_name):
-        """Generate QR code for user"""
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        
-        qr.add_data(qr_code_id)
-        qr.make(fit=True)
-        
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to file
-        filename = f"qr_{qr_code_id}.png"
-        filepath = os.path.join(self.qr_folder, filename)
-        img.save(filepath)
-        
-        return filename
+        """Generate QR code for user, reusing the image if it already exists"""
+        return self.qr_generator.generate(qr_code_id)
     
     def analyze_csv(self, csv_file):
-        """Analyze CSV file and return statistics"""
-        import csv
-        from io import StringIO
-        import chardet
-        
-        # Read CSV content with encoding detection
-        raw_content = csv_file.read()
-        
-        # Detect encoding
-        encoding_result = chardet.detect(raw_content)
-        encoding = encoding_result['encoding'] if encoding_result['encoding'] else 'utf-8'
-        
-        # Fallback encodings to try
-        encodings_to_try = [encoding, 'utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        
-        csv_content = None
-        for enc in encodings_to_try:
-            try:
-                csv_content = raw_content.decode(enc)
-                break
-            except (UnicodeDecodeError, LookupError):
-                continue
+        """Analyze CSV file and return statistics.
         
-        if csv_content is None:
-            return {
-                'success': False,
-                'message': 'Unable to decode CSV file. Please ensure it is saved in UTF-8 format.'
-            }
+        The parsed rows are kept in the import session cache; the returned
+        import_token lets import_csv use them without a second upload.
+        """
+        reader = HashingReader(csv_file)
+        session_rows = []  # parsed rows for the import session; None once the file exceeds the cache cap
         
-        csv_file.seek(0)  # Reset file pointer
+        def remember(rows):
+            nonlocal session_rows
+            for row in rows:
+                if session_rows is not None:
+                    session_rows.append(row)
+                    if len(session_rows) > import_sessions.max_rows:
+                        session_rows = None
+                yield row
         
-        # Parse CSV
-        csv_reader = csv.DictReader(StringIO(csv_content))
-        
-        # Validate headers - more flexible approach
-        headers = csv_reader.fieldnames
-        if not headers:
-            return {
-                'success': False,
-                'message': 'CSV file appears to be empty or invalid'
-            }
-        
-        # Check for Excel-based required fields
-        required_fields = ['first_name', 'last_name']
-        has_required_names = all(field in headers for field in required_fields)
-        has_barcode = 'barcode' in headers or 'id_number' in headers or 'qr_code_id' in headers
-        
-        if not has_required_names or not has_barcode:
+        try:
+            rows = self._flag_duplicates(remember(read_user_csv(reader)))
+            
+            # Analyze records
+            total_records = 0
+            new_records = 0
+            duplicate_records = 0
+            error_records = 0
+            errors = []
+            preview_data = []
+            
+            for row_num, fields, error, is_duplicate in rows:
+                total_records += 1
+                
+                if error:
+                    error_records += 1
+                    # Keep the response bounded on very large files
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(f"Row {row_num}: {error}")
+                    continue
+                
+                # Duplicates of existing users or of earlier rows in the file
+                import_status = 'New'
+                if is_duplicate:
+                    duplicate_records += 1
+                    import_status = 'Duplicate'
+                else:
+                    new_records += 1
+                
+                # Add to preview (first 10 new records only)
+                if len(preview_data) < 10 and import_status == 'New':
+                    preview_data.append({
+                        'complete_name': fields['complete_name'],
+                        'barcode': fields['barcode'],
+                        'first_name': fields['first_name'],
+                        'last_name': fields['last_name'],
+                        'role': fields['role'] or '',
+                        'company': fields['company'] or '',
+                        'status': fields['status'],
+                        'import_status': import_status
+                    })
+        except CSVFormatError as e:
             return {
                 'success': False,
-                'message': 'CSV must contain "first_name", "last_name", and either "barcode", "id_number", or "qr_code_id"'
+                'message': str(e)
             }
         
-        # Get existing QR codes
-        existing_qr_codes = set(user.qr_code_id for user in SecurityUser.query.all())
-        
-        # Analyze records
-        total_records = 0
-        new_records = 0
-        duplicate_records = 0
-        error_records = 0
-        errors = []
-        preview_data = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):  # Start from 2 (after header)
-            total_records += 1
-            
-            # Extract name fields (Excel format)
-            first_name = row.get('first_name', '').strip()
-            last_name = row.get('last_name', '').strip()
-            middle_name = row.get('middle_name', '').strip()
-            
-            if not first_name or not last_name:
-                error_records += 1
-                errors.append(f"Row {row_num}: Missing first_name or last_name")
-                continue
-            
-            # Build complete name
-            complete_name = row.get('complete_name', '').strip()
-            if not complete_name:
-                middle_part = f" {middle_name}" if middle_name else ""
-                complete_name = f"{first_name}{middle_part} {last_name}"
-            
-            # Extract barcode/QR code ID from various possible columns
-            barcode = (row.get('barcode', '') or 
-                      row.get('qr_code_id', '') or 
-                      row.get('id_number', '')).strip()
-            
-            if not barcode:
-                error_records += 1
-                errors.append(f"Row {row_num}: Missing barcode/QR Code ID")
-                continue
-            
-            # Extract other fields (Excel format)
-            status = row.get('status', 'Active').strip()
-            if status.lower() in ['active', 'allowed']:
-                status = 'Active'
-            elif status.lower() in ['inactive', 'banned']:
-                status = 'Inactive'
-            else:
-                status = 'Active'  # Default to Active
-            
-            # Check for duplicates using barcode
-            import_status = 'New'
-            if barcode in existing_qr_codes:
-                duplicate_records += 1
-                import_status = 'Duplicate'
-            else:
-                new_records += 1
-            
-            # Add to preview (first 10 new records only)
-            if len(preview_data) < 10 and import_status == 'New':
-                preview_data.append({
-                    'complete_name': complete_name,
-                    'barcode': barcode,
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'role': row.get('role', ''),
-                    'company': row.get('company', ''),
-                    'status': status,
-                    'import_status': import_status
-                })
+        import_token = None
+        if session_rows is not None and import_sessions.put(reader.hexdigest(), session_rows):
+            import_token = reader.hexdigest()
         
         return {
             'success': True,
+            'import_token': import_token,
             'total_records': total_records,
             'new_records': new_records,
             'duplicate_records': duplicate_records,
@@ -199,130 +246,52 @@ class SecurityService:
             'preview': preview_data
         }
     
-    def import_csv(self, csv_file):
-        """Import users from CSV file"""
-        import csv
-        from io import StringIO
-        import chardet
-        
-        # Read CSV content with encoding detection
-        raw_content = csv_file.read()
-        
-        # Detect encoding
-        encoding_result = chardet.detect(raw_content)
-        encoding = encoding_result['encoding'] if encoding_result['encoding'] else 'utf-8'
-        
-        # Fallback encodings to try
-        encodings_to_try = [encoding, 'utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        
-        csv_content = None
-        for enc in encodings_to_try:
+    def import_csv(self, csv_file=None, import_token=None):
+        """Import users from CSV file, or from the rows cached by analyze_csv under import_token"""
+        if import_token:
+            cached_rows = import_sessions.get(import_token)
+            if cached_rows is None:
+                return {
+                    'success': False,
+                    'token_expired': True,
+                    'message': 'Import session expired, please upload the file again'
+                }
+            # Duplicates are re-checked: the roster may have changed since the analysis
+            rows = self._flag_duplicates(iter(cached_rows))
+        else:
             try:
-                csv_content = raw_content.decode(enc)
-                break
-            except (UnicodeDecodeError, LookupError):
-                continue
-        
-        if csv_content is None:
-            return {
-                'success': False,
-                'message': 'Unable to decode CSV file. Please ensure it is saved in UTF-8 format.'
-            }
-        
-        csv_reader = csv.DictReader(StringIO(csv_content))
-        
-        # Get existing barcodes
-        existing_qr_codes = set(user.barcode or user.qr_code_id for user in SecurityUser.query.all() if user.barcode or user.qr_code_id)
+                rows = self._flag_duplicates(read_user_csv(csv_file))
+            except CSVFormatError as e:
+                return {
+                    'success': False,
+                    'message': str(e)
+                }
         
+        chunk_size = app.config.get("IMPORT_CHUNK_SIZE", 500)
+        started = time.perf_counter()
         imported_count = 0
-        errors = []
+        qr_counts = {'generated': 0, 'reused': 0, 'failed': 0}
+        chunk = []
         
-        # Get next sequential number
-        max_no = db.session.execute(text("SELECT COALESCE(MAX(no), 0) FROM security_users")).scalar() or 0
-        next_no = max_no + 1
+        def new_rows():
+            for _, fields, error, is_duplicate in rows:
+                # Skip invalid or duplicate records, including duplicates within the same file
+                if error or is_duplicate:
+                    continue
+                yield self._user_row(fields)
         
         try:
-            for row_num, row in enumerate(csv_reader, start=2):
-                # Extract name fields (Excel format)
-                first_name = row.get('first_name', '').strip()
-                last_name = row.get('last_name', '').strip()
-                middle_name = row.get('middle_name', '').strip()
-                
-                if not first_name or not last_name:
-                    continue
-                
-                # Build complete name
-                complete_name = row.get('complete_name', '').strip()
-                if not complete_name:
-                    middle_part = f" {middle_name}" if middle_name else ""
-                    complete_name = f"{first_name}{middle_part} {last_name}"
-                
-                # Extract barcode
-                barcode = (row.get('barcode', '') or 
-                          row.get('qr_code_id', '') or 
-                          row.get('id_number', '')).strip()
-                
-                # Skip invalid or duplicate records
-                if not barcode:
-                    continue
-                
-                if barcode in existing_qr_codes:
-                    continue
-                
-                # Validate status
-                status = row.get('status', 'Active').strip()
-                if status.lower() in ['active', 'allowed']:
-                    status = 'Active'
-                elif status.lower() in ['inactive', 'banned']:
-                    status = 'Inactive'
-                else:
-                    status = 'Active'
-                
-                # Parse date registered
-                date_registered = None
-                date_str = row.get('date_registered', '').strip()
-                if date_str:
-                    try:
-                        from datetime import datetime
-                        date_registered = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    except ValueError:
-                        try:
-                            date_registered = datetime.strptime(date_str, '%m/%d/%Y').date()
-                        except ValueError:
-                            pass
-                
-                # Create new user with Excel fields
-                new_user = SecurityUser(
-                    no=next_no,
-                    date_registered=date_registered or datetime.now().date(),
-                    first_name=first_name,
-                    middle_name=middle_name or None,
-                    last_name=last_name,
-                    complete_name=complete_name,
-                    barcode=barcode,
-                    role=row.get('role', '').strip() or None,
-                    company=row.get('company', '').strip() or None,
-                    address=row.get('address', '').strip() or None,
-                    contact_number=row.get('contact_number', '').strip() or None,
-                    id_number=row.get('id_number', '').strip() or None,
-                    status=status,
-                    # Legacy compatibility
-                    full_name=complete_name,
-                    qr_code_id=barcode
-                )
-                
-                # Generate QR code
-                qr_filename = self.generate_qr_code(barcode, complete_name)
-                new_user.qr_code_filename = qr_filename
-                
-                db.session.add(new_user)
-                imported_count += 1
-                next_no += 1
-                
-                # Add to existing set to prevent duplicates within the same file
-                existing_qr_codes.add(barcode)
-            
-            db.session.commit()
+            # One process pool for the whole import; workers only start once a chunk needs them,
+            # which never happens unless QR_PREGENERATE is on
+            with self.qr_generator.executor() as qr_pool:
+                for user_row in new_rows():
+                    chunk.append(user_row)
+                    if len(chunk) >= chunk_size:
+                        imported_count += self._insert_user_chunk(chunk, qr_pool, qr_counts)
+                        chunk = []
+                if chunk:
+                    imported_count += self._insert_user_chunk(chunk, qr_pool, qr_counts)
+                    chunk = []
             
             # Log the bulk import
             activity = ActivityLog(
@@ -334,30 +303,283 @@ class SecurityService:
             )
             db.session.add(activity)
             db.session.commit()
+            if import_token:
+                import_sessions.pop(import_token)
             
+            elapsed = time.perf_counter() - started
             return {
                 'success': True,
                 'imported_count': imported_count,
+                'elapsed_seconds': round(elapsed, 3),
+                'rows_per_second': round(imported_count / elapsed, 1) if elapsed else None,
+                'qr_images': qr_counts,
                 'message': f'Successfully imported {imported_count} users'
             }
             
         except Exception as e:
             db.session.rollback()
+            # Chunks committed before the failure stay imported
             return {
                 'success': False,
-                'message': f'Import failed: {str(e)}'
+                'imported_count': imported_count,
+                'qr_images': qr_counts,
+                'message': f'Import failed after {imported_count} users were imported: {str(e)}'
             }
-        qr.add_data(qr_code_id)
-        qr.make(fit=True)
+    
+    def create_import_job(self, csv_file=None, import_token=None, filename=None, created_by=None):
+        """Spool an upload to disk and queue it as a background ImportJob.
+        
+        Returns (job, None) or (None, error message). Analyzed uploads are
+        spooled as JSON lines of parsed rows; raw uploads are saved as-is and
+        parsed by the job.
+        """
+        job_id = str(uuid.uuid4())
+        os.makedirs(self.import_job_folder, exist_ok=True)
+        total_rows = None
+        
+        if import_token:
+            cached_rows = import_sessions.get(import_token)
+            if cached_rows is None:
+                return None, 'Import session expired, please upload the file again'
+            source_path = os.path.join(self.import_job_folder, f"{job_id}.jsonl")
+            with open(source_path, 'w', encoding='utf-8') as f:
+                for row in cached_rows:
+                    f.write(json.dumps(row) + '\n')
+            total_rows = len(cached_rows)
+        else:
+            source_path = os.path.join(self.import_job_folder, f"{job_id}.csv")
+            csv_file.save(source_path)
+            # Check the header now so a bad file is rejected before it is queued
+            try:
+                with open(source_path, 'rb') as f:
+                    read_user_csv(f)
+            except CSVFormatError as e:
+                os.remove(source_path)
+                return None, str(e)
+        
+        job = ImportJob(id=job_id, filename=filename, source_path=source_path, host=import_job_runner.host,
+                        total_rows=total_rows, created_by=created_by)
+        db.session.add(job)
+        db.session.commit()
+        if import_token:
+            import_sessions.pop(import_token)
+        import_job_runner.wake()
+        return job, None
+    
+    def get_import_job(self, job_id):
+        return db.session.get(ImportJob, job_id)
+    
+    def retry_import_job(self, job_id):
+        """Queue a failed job again; it resumes from its last checkpoint"""
+        result = db.session.execute(
+            db.update(ImportJob)
+            .where(ImportJob.id == job_id, ImportJob.status == 'failed')
+            .values(status='queued', message=None, finished_at=None, worker_id=None)
+        )
+        db.session.commit()
+        if result.rowcount:
+            import_job_runner.wake()
+        return result.rowcount == 1
+    
+    def _import_job_rows(self, job):
+        """Parsed (row number, fields, error) rows of a job's spooled source"""
+        if job.source_path.endswith('.jsonl'):
+            with open(job.source_path, encoding='utf-8') as f:
+                for line in f:
+                    yield tuple(json.loads(line))
+        else:
+            with open(job.source_path, 'rb') as f:
+                yield from read_user_csv(f)
+    
+    def run_import_job(self, job_id, worker_id):
+        """Process a claimed job from its checkpoint, committing each chunk with its checkpoint"""
+        job = db.session.get(ImportJob, job_id)
+        chunk_size = app.config.get("IMPORT_CHUNK_SIZE", 500)
+        errors = json.loads(job.errors or '[]')
+        progress = {'consumed': 0, 'duplicates': 0, 'errors': 0}
+        chunk = []
+        
+        try:
+            rows = itertools.islice(self._import_job_rows(job), job.processed_rows, None)
+            with self.qr_generator.executor() as qr_pool:
+                for row_num, fields, error, is_duplicate in self._flag_duplicates(rows):
+                    progress['consumed'] += 1
+                    if error:
+                        progress['errors'] += 1
+                        if len(errors) < MAX_REPORTED_ERRORS:
+                            errors.append(f"Row {row_num}: {error}")
+                    elif is_duplicate:
+                        progress['duplicates'] += 1
+                    else:
+                        chunk.append(self._user_row(fields))
+                    
+                    if progress['consumed'] >= chunk_size:
+                        self._commit_import_job_chunk(job_id, worker_id, chunk, progress, errors, qr_pool)
+                        chunk = []
+                        progress = dict.fromkeys(progress, 0)
+                self._commit_import_job_chunk(job_id, worker_id, chunk, progress, errors, qr_pool,
+                                              final=True)
+        except ImportJobLost:
+            db.session.rollback()
+            raise
+        except Exception as e:
+            db.session.rollback()
+            logging.error("Import job %s failed: %s", job_id, e)
+            db.session.execute(
+                db.update(ImportJob)
+                .where(ImportJob.id == job_id, ImportJob.worker_id == worker_id)
+                .values(status='failed', message=str(e), finished_at=datetime.now())
+            )
+            db.session.commit()
+            return
+        
+        try:
+            os.remove(job.source_path)
+        except OSError:
+            pass
+    
+    def _commit_import_job_chunk(self, job_id, worker_id, rows, progress, errors, qr_pool, final=False):
+        """Insert a chunk and advance the job checkpoint in the same transaction"""
+        if rows:
+            self._stage_user_chunk(rows, qr_pool)
+        
+        values = {
+            'processed_rows': ImportJob.processed_rows + progress['consumed'],
+            'imported_count': ImportJob.imported_count + len(rows),
+            'duplicate_count': ImportJob.duplicate_count + progress['duplicates'],
+            'error_count': ImportJob.error_count + progress['errors'],
+            'errors': json.dumps(errors),
+            'heartbeat_at': datetime.now(),
+        }
+        if final:
+            values.update(status='completed', finished_at=datetime.now(),
+                          message='Import completed')
+        
+        # Only the worker holding the claim may advance the checkpoint
+        result = db.session.execute(
+            db.update(ImportJob)
+            .where(ImportJob.id == job_id, ImportJob.worker_id == worker_id,
+                   ImportJob.status == 'running')
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            raise ImportJobLost(job_id)
+        
+        if final:
+            imported_count = db.session.execute(
+                db.select(ImportJob.imported_count).where(ImportJob.id == job_id)
+            ).scalar()
+            db.session.add(ActivityLog(
+                qr_code_id='BULK_IMPORT',
+                user_name=f'Admin Import ({imported_count} users)',
+                action='bulk_import',
+                method='CSV',
+                details=f'Imported {imported_count} users via background CSV import'
+            ))
+        db.session.commit()
+        roster_cache.invalidate(*(user_row['barcode'] for user_row in rows))
+        self._index_users(rows)
+    
+    def _flag_duplicates(self, rows):
+        """Add an is_duplicate flag to parsed CSV rows.
+        
+        Rows are checked a chunk at a time with one narrow barcode/qr_code_id
+        IN query, so the cost follows the upload rather than the roster.
+        """
+        chunk_size = app.config.get("IMPORT_CHUNK_SIZE", 500)
+        seen = set()  # badges earlier in this file
+        chunk = []
+        
+        def flagged(chunk):
+            badges = {fields['barcode'] for _, fields, error in chunk if not error}
+            existing = self._existing_badges(badges) if badges else set()
+            for row_num, fields, error in chunk:
+                if error:
+                    yield row_num, fields, error, False
+                    continue
+                badge = fields['barcode']
+                is_duplicate = badge in existing or badge in seen
+                seen.add(badge)
+                yield row_num, fields, error, is_duplicate
+        
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield from flagged(chunk)
+                chunk = []
+        if chunk:
+            yield from flagged(chunk)
+    
+    def _existing_badges(self, badges):
+        """Which of the given badges already belong to a user, as barcode or legacy qr_code_id"""
+        badges = list(badges)
+        existing = set()
+        for column in (SecurityUser.barcode, SecurityUser.qr_code_id):
+            existing.update(db.session.execute(
+                db.select(column).where(column.in_(badges))
+            ).scalars())
+        return existing
+    
+    def _user_row(self, fields):
+        """Complete normalized CSV fields into security_users column values"""
+        # Parse date registered
+        date_registered = None
+        date_str = fields['date_registered']
+        if date_str:
+            try:
+                date_registered = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                try:
+                    date_registered = datetime.strptime(date_str, '%m/%d/%Y').date()
+                except ValueError:
+                    pass
+        
+        now = datetime.now()
+        return dict(
+            fields,
+            id=str(uuid.uuid4()),
+            date_registered=date_registered or now.date(),
+            # Legacy compatibility
+            full_name=fields['complete_name'],
+            qr_code_id=fields['barcode'],
+            is_checked_in=False,
+            created_at=now,
+            updated_at=now
+        )
+    
+    def _insert_user_chunk(self, rows, qr_pool=None, qr_counts=None):
+        """Insert one chunk of imported users with a single executemany and commit it"""
+        self._stage_user_chunk(rows, qr_pool, qr_counts)
+        db.session.commit()
+        roster_cache.invalidate(*(user_row['barcode'] for user_row in rows))
+        self._index_users(rows)
+        return len(rows)
+    
+    def _stage_user_chunk(self, rows, qr_pool=None, qr_counts=None):
+        """Insert a chunk of imported users and adjust the counters, leaving the commit to the caller"""
+        # Continue the sequential numbering from the current maximum
+        max_no = db.session.execute(text("SELECT COALESCE(MAX(no), 0) FROM security_users")).scalar() or 0
+        for offset, user_row in enumerate(rows, start=1):
+            user_row['no'] = max_no + offset
         
-        qr_img = qr.make_image(fill_color="black", back_color="white")
+        if app.config.get("QR_PREGENERATE"):
+            qr_filenames, counts = self.qr_generator.generate_batch(
+                [user_row['barcode'] for user_row in rows], executor=qr_pool)
+            if qr_counts is not None:
+                for key, count in counts.items():
+                    qr_counts[key] += count
+        else:
+            qr_filenames = {}
+        for user_row in rows:
+            user_row['qr_code_filename'] = qr_filenames.get(user_row['barcode'])
         
-        # Save QR code
-        qr_filename = f"qr_{qr_code_id}.png"
-        qr_path = os.path.join(self.qr_folder, qr_filename)
-        qr_img.save(qr_path)
+        status_deltas = {'allowed': 0, 'banned': 0}
+        for user_row in rows:
+            for key, delta in self._status_deltas(None, user_row['status']).items():
+                status_deltas[key] += delta
         
-        return qr_filename
+        db.session.execute(db.insert(SecurityUser), rows)
+        self._adjust_counters(total=len(rows), **status_deltas)
     
     def add_user(self, full_name, qr_code_id, status="allowed", picture_file=None):
         """Add a new security user"""
@@ -371,8 +593,10 @@ class SecurityService:
         if picture_file:
             picture_filename = self.save_picture(picture_file)
         
-        # Generate QR code
-        qr_filename = self.generate_qr_code(qr_code_id.upper(), full_name)
+        # QR images are served by /qr/<badge>; only write a file when pre-generation is on
+        qr_filename = None
+        if app.config.get("QR_PREGENERATE"):
+            qr_filename = self.generate_qr_code(qr_code_id.upper(), full_name)
         
         # Create new user
         user = SecurityUser(
@@ -385,7 +609,10 @@ class SecurityService:
         
         try:
             db.session.add(user)
+            self._adjust_counters(total=1, **self._status_deltas(None, status))
             db.session.commit()
+            roster_cache.invalidate(qr_code_id)
+            self._index_users([user])
             return True, "User added successfully"
         except Exception as e:
             db.session.rollback()
@@ -395,10 +622,129 @@ class SecurityService:
         """Get user by QR code ID"""
         return SecurityUser.query.filter_by(qr_code_id=qr_code_id.upper()).first()
     
+    def get_badge(self, qr_code_id):
+        """Get the cached roster entry for a badge (None if unknown)"""
+        return roster_cache.get(qr_code_id, self._load_roster_entry)
+    
+    def _load_roster_entry(self, badge):
+        """Load only the columns the access decision needs"""
+        row = db.session.execute(
+            db.select(*[getattr(SecurityUser, field) for field in RosterEntry._fields])
+            .where(SecurityUser.qr_code_id == badge)
+            .limit(1)
+        ).first()
+        return RosterEntry(*row) if row else None
+    
     def get_all_users(self):
         """Get all security users"""
         return SecurityUser.query.order_by(SecurityUser.created_at.desc()).all()
     
+    def page_users(self, query=None, status=None, company=None, sort='created_at', descending=True,
+                   page=1, page_size=50):
+        """One page of the admin user list, filtered and sorted in SQL.
+        
+        Only the listed columns are loaded; everything else (address,
+        biometric_template, ...) stays deferred.
+        """
+        sort_column = USER_LIST_SORTS.get(sort, SecurityUser.created_at)
+        order = sort_column.desc() if descending else sort_column.asc()
+        
+        users = SecurityUser.query.options(db.load_only(*USER_LIST_COLUMNS))
+        filtered = False
+        if query:
+            search_term = f"%{query.lower()}%"
+            users = users.filter(db.or_(
+                SecurityUser.full_name.ilike(search_term),
+                SecurityUser.qr_code_id.ilike(search_term)
+            ))
+            filtered = True
+        if status:
+            users = users.filter(SecurityUser.status == status)
+            filtered = True
+        if company:
+            users = users.filter(SecurityUser.company == company)
+            filtered = True
+        
+        # The unfiltered total comes from the counters row instead of a COUNT(*)
+        if filtered:
+            total = users.order_by(None).count()
+        else:
+            total = self.get_statistics()['total_users']
+        
+        page = max(1, page)
+        items = users.order_by(order, SecurityUser.id) \
+                     .offset((page - 1) * page_size) \
+                     .limit(page_size) \
+                     .all()
+        return {
+            'users': items,
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'pages': max(1, -(-total // page_size)),
+            'sort': sort if sort in USER_LIST_SORTS else 'created_at',
+            'descending': descending
+        }
+    
+    def typeahead_users(self, query, limit=10):
+        """Ranked quick-search matches from the in-memory index.
+        
+        Falls back to a SQL search while the index is still being built.
+        Returns (list of IndexedUser, source).
+        """
+        if app.config.get("USER_INDEX_ENABLED"):
+            if user_index.is_stale():
+                self._schedule_index_rebuild()
+            if user_index.ready:
+                return user_index.search(query, limit), 'index'
+        
+        users = SecurityUser.query.options(db.load_only(*[getattr(SecurityUser, f) for f in IndexedUser._fields])) \
+            .filter(db.or_(
+                SecurityUser.full_name.ilike(f"%{query}%"),
+                SecurityUser.qr_code_id.ilike(f"%{query}%"),
+                SecurityUser.id_number.ilike(f"%{query}%"),
+                SecurityUser.company.ilike(f"%{query}%")
+            )) \
+            .order_by(SecurityUser.full_name) \
+            .limit(limit) \
+            .all()
+        return [self._index_entry(user) for user in users], 'database'
+    
+    def _schedule_index_rebuild(self):
+        """Rebuild the search index on a background thread"""
+        threading.Thread(target=rebuild_user_index, args=(app, self._load_index_users),
+                         name='user-index-rebuild', daemon=True).start()
+    
+    def _load_index_users(self):
+        """Stream the indexed columns of every user"""
+        result = db.session.execute(
+            db.select(*[getattr(SecurityUser, field) for field in IndexedUser._fields])
+            .execution_options(yield_per=5000)
+        )
+        for row in result:
+            yield IndexedUser(*row)
+    
+    @staticmethod
+    def _index_entry(user):
+        """IndexedUser from a SecurityUser or an imported row dict"""
+        if isinstance(user, dict):
+            return IndexedUser(*[user.get(field) for field in IndexedUser._fields])
+        return IndexedUser(*[getattr(user, field) for field in IndexedUser._fields])
+    
+    def _index_users(self, users):
+        """Push committed user changes into the search index"""
+        if not app.config.get("USER_INDEX_ENABLED"):
+            return
+        for user in users:
+            user_index.upsert(self._index_entry(user))
+    
+    def list_companies(self):
+        """Distinct companies, for the user list filter"""
+        return db.session.execute(
+            db.select(SecurityUser.company).where(SecurityUser.company.isnot(None))
+            .distinct().order_by(SecurityUser.company)
+        ).scalars().all()
+    
     def update_user(self, qr_code_id, full_name=None, status=None, picture_file=None):
         """Update user information"""
         user = self.get_user_by_qr(qr_code_id)
@@ -408,18 +754,21 @@ class SecurityService:
         try:
             if full_name:
                 user.full_name = full_name
-            if status:
+            if status and status != user.status:
+                self._adjust_counters(**self._status_deltas(user.status, status))
                 user.status = status
             if picture_file:
                 # Delete old picture if exists
                 if user.picture_filename:
-                    old_path = os.path.join(self.upload_folder, user.picture_filename)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+                    self._remove_picture(user.picture_filename)
                 user.picture_filename = self.save_picture(picture_file)
             
             user.updated_at = datetime.now()
             db.session.commit()
+            roster_cache.invalidate(qr_code_id)
+            self._index_users([user])
+            if user.is_checked_in:
+                presence_board.invalidate()
             return True, "User updated successfully"
         except Exception as e:
             db.session.rollback()
@@ -434,12 +783,15 @@ class SecurityService:
         try:
             # Delete picture file if exists
             if user.picture_filename:
-                picture_path = os.path.join(self.upload_folder, user.picture_filename)
-                if os.path.exists(picture_path):
-                    os.remove(picture_path)
+                self._remove_picture(user.picture_filename)
             
             db.session.delete(user)
+            self._adjust_counters(total=-1, checked_in=-1 if user.is_checked_in else 0,
+                                  **self._status_deltas(user.status, None))
             db.session.commit()
+            roster_cache.invalidate(qr_code_id)
+            presence_board.check_out(user.id)
+            user_index.remove(user.id)
             return True, "User deleted successfully"
         except Exception as e:
             db.session.rollback()
@@ -452,56 +804,147 @@ class SecurityService:
     def process_access_attempt(self, qr_code_id, method="QR", visit_reason=None, operator_id=None, operator_name=None, operator_role=None):
         """Process access attempt and log activity"""
         qr_code_id = qr_code_id.upper()
-        user = self.get_user_by_qr(qr_code_id)
+        entry = self.get_badge(qr_code_id)
+        if entry and entry.status != 'allowed':
+            # The cached status may predate an unban on another worker; confirm before refusing
+            entry = roster_cache.reload(qr_code_id, self._load_roster_entry)
         
-        if not user:
+        if entry and entry.status == 'allowed':
+            # Status check, toggle and activity insert happen in one transaction
+            try:
+                row = self._toggle_check_in(entry.id, qr_code_id, method, visit_reason=visit_reason,
+                                            operator_id=operator_id, operator_name=operator_name,
+                                            operator_role=operator_role)
+            except Exception as e:
+                db.session.rollback()
+                roster_cache.invalidate(qr_code_id)
+                return False, f"Database error: {str(e)}", entry
+            
+            if row is not None:
+                entry = entry._replace(full_name=row.full_name, role=row.role, status=row.status,
+                                       is_checked_in=row.is_checked_in)
+                roster_cache.put(qr_code_id, entry)
+                if row.is_checked_in:
+                    presence_board.check_in(Occupant(entry.id, qr_code_id, entry.full_name, entry.company,
+                                                     entry.role, datetime.now()))
+                else:
+                    presence_board.check_out(entry.id)
+                live_feed.publish('activity', {
+                    'timestamp': datetime.now().isoformat(),
+                    'user_name': entry.full_name,
+                    'qr_code_id': qr_code_id,
+                    'action': "check_in" if row.is_checked_in else "check_out",
+                    'method': method,
+                    'details': "Success",
+                    'user_role': entry.role,
+                    'checked_in_delta': 1 if row.is_checked_in else -1
+                })
+                action_text = "Check In" if row.is_checked_in else "Check Out"
+                return True, f"Access Granted: {action_text} successful for {entry.full_name}", entry
+            
+            # The cached entry is stale: the user was deleted or their status changed elsewhere
+            entry = roster_cache.reload(qr_code_id, self._load_roster_entry)
+        
+        if not entry:
             self._log_activity(None, qr_code_id, "Unknown", "access_denied", method, "User not found", 
                              visit_reason=visit_reason, operator_id=operator_id, 
                              operator_name=operator_name, operator_role=operator_role)
             return False, "Access Denied: Invalid QR Code", None
         
-        if user.status != 'allowed':
-            self._log_activity(user.id, qr_code_id, user.full_name, "access_denied", method, f"User status: {user.status}", 
-                             visit_reason=visit_reason, user_role=user.role, operator_id=operator_id,
-                             operator_name=operator_name, operator_role=operator_role)
-            return False, f"Access Denied: User is {user.status}", user
+        self._log_activity(entry.id, qr_code_id, entry.full_name, "access_denied", method, f"User status: {entry.status}", 
+                         visit_reason=visit_reason, user_role=entry.role, operator_id=operator_id,
+                         operator_name=operator_name, operator_role=operator_role)
+        return False, f"Access Denied: User is {entry.status}", entry
+    
+    def _toggle_check_in(self, user_id, qr_code_id, method, visit_reason=None, operator_id=None,
+                         operator_name=None, operator_role=None):
+        """Atomically flip is_checked_in for an allowed user and log the check-in/check-out.
         
-        # Determine action based on current check-in status
-        action = "check_out" if user.is_checked_in else "check_in"
+        Returns the updated (id, full_name, role, status, is_checked_in) row, or None
+        if the user no longer exists or is not allowed. The UPDATE takes a row lock,
+        so concurrent scans of the same badge are serialized and alternate cleanly.
+        """
+        params = {
+            'user_id': user_id,
+            'log_id': str(uuid.uuid4()),
+            'qr_code_id': qr_code_id,
+            'method': method,
+            'visit_reason': visit_reason,
+            'operator_id': operator_id,
+            'operator_name': operator_name,
+            'operator_role': operator_role,
+            'now': datetime.now(),
+        }
         
-        # Update check-in status
-        user.is_checked_in = not user.is_checked_in
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # One round trip: UPDATE ... RETURNING feeds the INSERT in the same statement
+            row = db.session.execute(_ACCESS_TOGGLE_SQL, params).first()
+        else:
+            row = db.session.execute(
+                db.update(SecurityUser)
+                .where(SecurityUser.id == user_id, SecurityUser.status == 'allowed')
+                .values(is_checked_in=db.not_(db.func.coalesce(SecurityUser.is_checked_in, False)),
+                        updated_at=params['now'])
+                .returning(SecurityUser.id,
+                           db.func.coalesce(SecurityUser.full_name, SecurityUser.complete_name).label('full_name'),
+                           SecurityUser.role, SecurityUser.status, SecurityUser.is_checked_in)
+            ).first()
+            if row is not None:
+                db.session.execute(db.insert(ActivityLog).values(
+                    id=params['log_id'],
+                    security_user_id=user_id,
+                    qr_code_id=qr_code_id,
+                    user_name=row.full_name,
+                    action="check_in" if row.is_checked_in else "check_out",
+                    method=method,
+                    details="Success",
+                    visit_reason=visit_reason,
+                    user_role=row.role,
+                    operator_id=operator_id,
+                    operator_name=operator_name,
+                    operator_role=operator_role,
+                    timestamp=params['now']
+                ))
+                self._adjust_counters(checked_in=1 if row.is_checked_in else -1)
         
-        try:
-            db.session.commit()
-            # Log the activity
-            self._log_activity(user.id, qr_code_id, user.full_name, action, method, "Success", 
-                             visit_reason=visit_reason, user_role=user.role, operator_id=operator_id,
-                             operator_name=operator_name, operator_role=operator_role)
-            
-            action_text = action.replace('_', ' ').title()
-            return True, f"Access Granted: {action_text} successful for {user.full_name}", user
-        except Exception as e:
-            db.session.rollback()
-            return False, f"Database error: {str(e)}", user
+        db.session.commit()
+        if row is not None:
+            self._stats_cache = None
+        return row
     
     def _log_activity(self, user_id, qr_code_id, user_name, action, method, details, visit_reason=None, 
                      user_role=None, operator_id=None, operator_name=None, operator_role=None):
-        """Log activity to the database"""
-        activity = ActivityLog(
-            security_user_id=user_id,
-            qr_code_id=qr_code_id,
-            user_name=user_name,
-            action=action,
-            method=method,
-            details=details,
-            visit_reason=visit_reason,
-            user_role=user_role,
-            operator_id=operator_id,
-            operator_name=operator_name,
-            operator_role=operator_role
-        )
+        """Log activity to the database (through the batched writer when enabled)"""
+        row = {
+            'id': str(uuid.uuid4()),
+            'security_user_id': user_id,
+            'qr_code_id': qr_code_id,
+            'user_name': user_name,
+            'action': action,
+            'method': method,
+            'details': details,
+            'visit_reason': visit_reason,
+            'user_role': user_role,
+            'operator_id': operator_id,
+            'operator_name': operator_name,
+            'operator_role': operator_role,
+            'timestamp': datetime.now()
+        }
+        live_feed.publish('activity', {
+            'timestamp': row['timestamp'].isoformat(),
+            'user_name': user_name,
+            'qr_code_id': qr_code_id,
+            'action': action,
+            'method': method,
+            'details': details,
+            'user_role': user_role,
+            'checked_in_delta': 0
+        })
+        if activity_writer.submit(row):
+            return
         
+        # Writer disabled or queue full: write synchronously
+        activity = ActivityLog(**row)
         try:
             db.session.add(activity)
             db.session.commit()
@@ -531,6 +974,83 @@ class SecurityService:
     
     def search_activity(self, query=None, start_date=None, end_date=None):
         """Search activity log with filters"""
+        return self.activity_query(query, start_date, end_date).order_by(ActivityLog.timestamp.desc()).all()
+    
+    def page_activity(self, query=None, start_date=None, end_date=None, cursor=None, page_size=50, with_total=False):
+        """Fetch one keyset page of the activity log, newest first.
+        
+        Pages are ordered by (timestamp, id) and continue strictly after the cursor,
+        so every page costs the same regardless of how deep it is.
+        """
+        query_obj = self.activity_query(query, start_date, end_date)
+        page_query = query_obj
+        if cursor:
+            cursor_timestamp, cursor_id = decode_activity_cursor(cursor)
+            page_query = page_query.filter(
+                db.tuple_(ActivityLog.timestamp, ActivityLog.id) < db.tuple_(cursor_timestamp, cursor_id)
+            )
+        
+        rows = page_query.order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        page = {
+            'activities': rows,
+            'has_more': has_more,
+            'next_cursor': encode_activity_cursor(rows[-1]) if has_more else None,
+        }
+        if with_total:
+            page['approximate_total'] = self._estimate_count(query_obj)
+        return page
+    
+    def _estimate_count(self, query_obj):
+        """Planner row estimate on PostgreSQL, exact count elsewhere"""
+        if db.session.get_bind().dialect.name != 'postgresql':
+            return query_obj.count()
+        compiled = query_obj.statement.compile(dialect=db.session.get_bind().dialect)
+        plan = db.session.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    
+    def iter_activity_rows(self, query=None, start_date=None, end_date=None, chunk_size=1000):
+        """Stream export columns for a report filter, newest first, without building ORM objects.
+        
+        Rows are fetched from a server-side cursor chunk_size at a time.
+        """
+        statement = self.activity_query(query, start_date, end_date).with_entities(
+            ActivityLog.timestamp,
+            ActivityLog.user_name,
+            ActivityLog.qr_code_id,
+            ActivityLog.action,
+            ActivityLog.method,
+            ActivityLog.details,
+            ActivityLog.visit_reason,
+            ActivityLog.user_role,
+            ActivityLog.operator_name,
+            ActivityLog.operator_role,
+        ).order_by(ActivityLog.timestamp.desc()).statement
+        
+        result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+        try:
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            result.close()
+    
+    def activity_summary(self, query=None, start_date=None, end_date=None):
+        """Action counts and time range for a report filter in a single aggregate query"""
+        statement = self.activity_query(query, start_date, end_date).with_entities(
+            db.func.count().filter(ActivityLog.action == 'check_in').label('check_ins'),
+            db.func.count().filter(ActivityLog.action == 'check_out').label('check_outs'),
+            db.func.count().filter(ActivityLog.action.notin_(['check_in', 'check_out'])).label('denials'),
+            db.func.min(ActivityLog.timestamp).label('first_timestamp'),
+            db.func.max(ActivityLog.timestamp).label('last_timestamp'),
+        )
+        return statement.one()._asdict()
+    
+    def activity_query(self, query=None, start_date=None, end_date=None):
+        """Build the filtered activity log query used by reports and exports"""
         query_obj = ActivityLog.query
         
         if query:
@@ -542,28 +1062,106 @@ class SecurityService:
                 )
             )
         
+        # Bounds are timestamps, not dates, so PostgreSQL prunes the activity_logs
+        # partitions outside the range when planning the query
         if start_date:
-            query_obj = query_obj.filter(ActivityLog.timestamp >= start_date)
+            query_obj = query_obj.filter(ActivityLog.timestamp >= datetime.combine(start_date, datetime.min.time()))
         
         if end_date:
-            # Add one day to include the end date
-            end_date_plus_one = datetime.combine(end_date, datetime.max.time())
-            query_obj = query_obj.filter(ActivityLog.timestamp <= end_date_plus_one)
+            # Up to the start of the next day, to include the whole end date
+            query_obj = query_obj.filter(ActivityLog.timestamp < datetime.combine(end_date + timedelta(days=1),
+                                                                                  datetime.min.time()))
+        
+        return query_obj
+    
+    def _load_occupants(self):
+        rows = db.session.execute(
+            db.select(SecurityUser.id, SecurityUser.qr_code_id,
+                      db.func.coalesce(SecurityUser.full_name, SecurityUser.complete_name),
+                      SecurityUser.company, SecurityUser.role, SecurityUser.updated_at)
+            .where(SecurityUser.is_checked_in == True)  # noqa: E712 - matches the partial index predicate
+        ).all()
+        return [Occupant(*row) for row in rows]
+    
+    def get_roll_call(self, fresh=False):
+        """Who is on site right now, grouped by company and role.
         
-        return query_obj.order_by(ActivityLog.timestamp.desc()).all()
+        By default this is served from the per-worker mirror, which can miss
+        scans other workers handled in the last PRESENCE_RESYNC_INTERVAL;
+        fresh reads the on-site rows from the database, as a muster must.
+        """
+        if fresh:
+            occupants = self._load_occupants()
+            presence_board.load(occupants)
+            return group_roll_call(occupants)
+        if presence_board.is_stale():
+            presence_board.load(self._load_occupants())
+        return presence_board.roll_call()
     
     def get_statistics(self):
-        """Get system statistics"""
-        total_users = SecurityUser.query.count()
-        allowed_users = SecurityUser.query.filter_by(status='allowed').count()
-        banned_users = SecurityUser.query.filter_by(status='banned').count()
-        checked_in_users = SecurityUser.query.filter_by(is_checked_in=True).count()
+        """Get system statistics from the short-lived cache or the counters row"""
+        cached = self._stats_cache
+        if cached and cached[0] > time.monotonic():
+            return dict(cached[1])
         
+        counters = db.session.get(UserCounters, 1)
+        if counters is None:
+            stats = self.refresh_statistics()
+        else:
+            stats = {
+                'total_users': counters.total_users,
+                'allowed_users': counters.allowed_users,
+                'banned_users': counters.banned_users,
+                'checked_in_users': counters.checked_in_users
+            }
+        
+        self._stats_cache = (time.monotonic() + app.config.get("STATS_CACHE_TTL", 5), stats)
+        return dict(stats)
+    
+    def refresh_statistics(self):
+        """Recount security_users in a single pass and rewrite the counters row"""
+        row = db.session.execute(db.select(
+            db.func.count().label('total_users'),
+            db.func.count().filter(SecurityUser.status == 'allowed').label('allowed_users'),
+            db.func.count().filter(SecurityUser.status == 'banned').label('banned_users'),
+            db.func.count().filter(SecurityUser.is_checked_in.is_(True)).label('checked_in_users'),
+        )).one()
+        stats = row._asdict()
+        
+        try:
+            counters = db.session.get(UserCounters, 1) or UserCounters(id=1)
+            for key, value in stats.items():
+                setattr(counters, key, value)
+            db.session.add(counters)
+            db.session.commit()
+        except Exception as e:
+            # Another worker seeded the row first; its numbers are just as fresh
+            db.session.rollback()
+            logging.warning("Could not store user counters: %s", e)
+        
+        self._stats_cache = None
+        return stats
+    
+    def _adjust_counters(self, total=0, allowed=0, banned=0, checked_in=0):
+        """Apply counter deltas inside the caller's transaction"""
+        if not (total or allowed or banned or checked_in):
+            return
+        db.session.execute(
+            db.update(UserCounters)
+            .where(UserCounters.id == 1)
+            .values(total_users=UserCounters.total_users + total,
+                    allowed_users=UserCounters.allowed_users + allowed,
+                    banned_users=UserCounters.banned_users + banned,
+                    checked_in_users=UserCounters.checked_in_users + checked_in)
+        )
+        self._stats_cache = None
+    
+    @staticmethod
+    def _status_deltas(old_status, new_status):
+        """Counter deltas for a status change (None means the user does not exist)"""
         return {
-            'total_users': total_users,
-            'allowed_users': allowed_users,
-            'banned_users': banned_users,
-            'checked_in_users': checked_in_users
+            'allowed': (new_status == 'allowed') - (old_status == 'allowed'),
+            'banned': (new_status == 'banned') - (old_status == 'banned'),
         }
 
 # Global service instance
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+from models import AdminRoles
+
+# Columns current_user needs on every request; passwords stay in the database
+SESSION_USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'active')
+
+
+class SessionUser(AdminRoles, UserMixin):
+    """Read-only snapshot of an AdminUser's identity and role, used as current_user.
+
+    Code that changes the account (passwords, profile) loads the AdminUser row
+    itself and invalidates the cache afterwards.
+    """
+
+    def __init__(self, **fields):
+        for field in SESSION_USER_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    def __repr__(self):
+        return f"<SessionUser {self.id} {self.username} ({self.role})>"
+
+
+class SessionUserCache:
+    """Bounded TTL + LRU cache of SessionUser snapshots keyed by admin id.
+
+    Every authenticated request resolves current_user, so each worker keeps
+    the identity for ttl seconds instead of reading admin_users each time.
+    Account changes made by this worker invalidate the entry at once; other
+    workers pick them up when it expires.
+    """
+
+    def __init__(self, max_size=1000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # admin id -> (expires_at, SessionUser)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def configure(self, max_size=None, ttl=None):
+        """Apply settings from the app config"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def get(self, user_id, loader):
+        """Return the cached user, calling loader(user_id) on a miss.
+
+        The loader returns a SessionUser or None; unknown ids are not cached,
+        Flask-Login logs those sessions out.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached and cached[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        user = loader(user_id)
+        if user is not None and self.max_size > 0 and self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (time.monotonic() + self.ttl, user)
+                self._entries.move_to_end(user_id)
+                self._evict()
+        return user
+
+    def invalidate(self, *user_ids):
+        """Drop the given admins so their next request reloads them"""
+        with self._lock:
+            for user_id in user_ids:
+                if self._entries.pop(user_id, None) is not None:
+                    self.invalidations += 1
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters for the metrics endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
+# Global cache instance
+session_user_cache = SessionUserCache()
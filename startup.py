@@ -0,0 +1,89 @@
+import logging
+import time
+from datetime import datetime
+
+# Bump when models.py gains tables, so workers in SCHEMA_CHECK=version mode run create_all again
+SCHEMA_VERSION = 2
+
+SCHEMA_CHECK_MODES = ('create', 'version', 'off')
+
+
+class StartupTimer:
+    """Wall-clock time of each worker startup phase, reported once the worker is ready"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []  # (name, milliseconds)
+        self.ready = False
+
+    def mark(self, name):
+        """Close the phase that ran since the previous mark"""
+        now = time.perf_counter()
+        self.phases.append((name, (now - self._last) * 1000))
+        self._last = now
+
+    def finish(self):
+        self.ready = True
+        logging.info("Worker started in %.0f ms (%s)", self.total_ms(),
+                     ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.phases))
+
+    def total_ms(self):
+        return (self._last - self.started) * 1000
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'total_ms': round(self.total_ms(), 1),
+            'phases': {name: round(ms, 1) for name, ms in self.phases},
+        }
+
+
+def ensure_schema(db, mode, initialize):
+    """Make sure the tables exist before serving.
+
+    'create' always runs db.create_all() and initialize() (the default admin);
+    'version' reads the recorded schema version with one query and only does
+    that work when it is missing or older than SCHEMA_VERSION; 'off' trusts
+    the deployment to have prepared the database. Returns what was done.
+    """
+    from models import SchemaVersion
+
+    if mode == 'off':
+        return 'skipped'
+    if mode == 'version':
+        try:
+            current = db.session.execute(
+                db.select(SchemaVersion.version).where(SchemaVersion.id == 1)
+            ).scalar()
+        except Exception:
+            db.session.rollback()  # table not created yet
+            current = None
+        if current is not None and current >= SCHEMA_VERSION:
+            return 'current'
+
+    db.create_all()
+    initialize()
+    db.session.merge(SchemaVersion(id=1, version=SCHEMA_VERSION, updated_at=datetime.now()))
+    db.session.commit()
+    return 'created'
+
+
+def precompile_templates(app):
+    """Compile every Jinja template into the environment's cache.
+
+    Run after the routes are imported, since templates may use filters they
+    register. Returns the number of templates compiled.
+    """
+    env = app.jinja_env
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        try:
+            env.get_template(name)
+        except Exception as e:
+            logging.warning("Could not precompile template %s: %s", name, e)
+    return len(names)
+
+
+# Global timer, started when app.py is imported
+startup_timer = StartupTimer()
@@ -93,14 +93,10 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Auto-refresh activity data every 30 seconds on dashboard
-    if (window.location.pathname.includes('/admin')) {
-        setInterval(function() {
-            // Only refresh if tab is visible
-            if (!document.hidden) {
-                refreshActivityData();
-            }
-        }, 30000);
+    // Follow new scans on the dashboard as they happen
+    var liveActivityList = document.querySelector('.activity-list[data-live-feed]');
+    if (liveActivityList) {
+        startLiveFeed(liveActivityList);
     }
 
     // Smooth scrolling for anchor links
@@ -181,21 +177,81 @@ function simulateQRScan() {
     });
 }
 
-// Refresh activity data
-function refreshActivityData() {
-    var activityContainer = document.querySelector('.activity-list');
-    if (activityContainer) {
-        // Add loading indicator
-        var loadingHTML = '<div class="text-center"><i class="fas fa-spinner fa-spin"></i> Refreshing...</div>';
-        var originalHTML = activityContainer.innerHTML;
-        
-        // You could implement AJAX refresh here if needed
-        // For now, just show a brief loading state
-        activityContainer.innerHTML = loadingHTML;
-        
-        setTimeout(function() {
-            activityContainer.innerHTML = originalHTML;
-        }, 1000);
+// Live activity feed (Server-Sent Events)
+var MAX_LIVE_ACTIVITY_ITEMS = 10;
+var LIVE_FEED_BUSY_RETRY_MS = 15000;
+
+function startLiveFeed(activityList) {
+    if (!window.EventSource) {
+        return null;
+    }
+
+    var source = new EventSource(activityList.dataset.liveFeed);
+
+    source.addEventListener('activity', function(e) {
+        var activity = JSON.parse(e.data);
+        prependActivityItem(activityList, activity);
+        if (activity.checked_in_delta) {
+            adjustStat('statCheckedInUsers', activity.checked_in_delta);
+        }
+    });
+
+    // The server dropped events we never saw; reload to get a consistent view
+    source.addEventListener('reset', function() {
+        source.close();
+        window.location.reload();
+    });
+
+    // EventSource gives up on a 503 (too many open streams); try again later
+    source.addEventListener('error', function() {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(function() {
+                startLiveFeed(activityList);
+            }, LIVE_FEED_BUSY_RETRY_MS + Math.random() * 5000);
+        }
+    });
+
+    return source;
+}
+
+function prependActivityItem(activityList, activity) {
+    var placeholder = activityList.querySelector('.activity-empty');
+    if (placeholder) {
+        placeholder.remove();
+    }
+
+    var iconClass = activity.action === 'check_in' ? 'fa-sign-in-alt text-success' :
+                    activity.action === 'check_out' ? 'fa-sign-out-alt text-info' :
+                    'fa-exclamation-triangle text-danger';
+    var actionText = activity.action.split('_').map(function(word) {
+        return word.charAt(0).toUpperCase() + word.slice(1);
+    }).join(' ');
+
+    var item = document.createElement('div');
+    item.className = 'activity-item d-flex align-items-center mb-3';
+    item.innerHTML = `
+        <div class="activity-icon me-3"><i class="fas ${iconClass}"></i></div>
+        <div class="activity-details flex-grow-1">
+            <div class="fw-bold"></div>
+            <div class="text-muted small"></div>
+        </div>
+        <div class="activity-time text-muted small"></div>
+    `;
+    item.querySelector('.fw-bold').textContent = activity.user_name;
+    item.querySelector('.small').textContent = `${actionText} via ${activity.method} - ${activity.details}`;
+    item.querySelector('.activity-time').textContent = activity.timestamp.substring(11, 16);
+
+    activityList.insertBefore(item, activityList.firstChild);
+    var items = activityList.querySelectorAll('.activity-item');
+    for (var i = MAX_LIVE_ACTIVITY_ITEMS; i < items.length; i++) {
+        items[i].remove();
+    }
+}
+
+function adjustStat(elementId, delta) {
+    var element = document.getElementById(elementId);
+    if (element) {
+        element.textContent = Math.max(0, parseInt(element.textContent, 10) + delta);
     }
 }
 
@@ -243,6 +299,64 @@ function showToast(message, type = 'info') {
 // CSV Upload Functions
 let csvAnalysisData = null;
 
+// Import from the analyzed upload, re-sending the file only if the server no longer has it
+function postCSVImport(file) {
+    const send = (importToken) => {
+        const formData = new FormData();
+        if (importToken) {
+            formData.append('import_token', importToken);
+        } else {
+            formData.append('csv_file', file);
+        }
+        return fetch('/admin/import_csv', {
+            method: 'POST',
+            body: formData
+        }).then(response => response.json());
+    };
+    
+    const importToken = csvAnalysisData && csvAnalysisData.import_token;
+    if (!importToken) {
+        return send(null);
+    }
+    // The server hands the rows out once; a second attempt re-sends the file
+    csvAnalysisData.import_token = null;
+    return send(importToken).then(data => data.token_expired ? send(null) : data);
+}
+
+// Poll a background import job until it finishes; resolves to {success, imported_count, message}
+function waitForImportJob(statusUrl, onProgress) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    resolve(data);
+                    return;
+                }
+                const job = data.job;
+                if (onProgress) {
+                    onProgress(job);
+                }
+                if (job.status === 'completed') {
+                    resolve({ success: true, imported_count: job.imported_count, message: job.message });
+                } else if (job.status === 'failed') {
+                    resolve({ success: false, imported_count: job.imported_count, message: job.message });
+                } else {
+                    setTimeout(poll, 1000);
+                }
+            })
+            .catch(reject);
+        };
+        poll();
+    });
+}
+
+function importProgressText(job) {
+    const total = job.total_rows ? `/${job.total_rows}` : '';
+    return `<i class="fas fa-spinner fa-spin me-2"></i>Importing... ${job.processed_rows}${total} rows`;
+}
+
 function analyzeCSV() {
     const fileInput = document.getElementById('csv_file');
     const file = fileInput.files[0];
@@ -254,6 +368,7 @@ function analyzeCSV() {
     
     const formData = new FormData();
     formData.append('csv_file', file);
+    csvAnalysisData = null;
     
     // Show loading
     document.getElementById('csvAnalytics').style.display = 'none';
@@ -342,19 +457,14 @@ function importCSV() {
     const fileInput = document.getElementById('csv_file');
     const file = fileInput.files[0];
     
-    const formData = new FormData();
-    formData.append('csv_file', file);
-    
     // Disable import button
     const importBtn = document.getElementById('importBtn');
     importBtn.disabled = true;
     importBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Importing...';
     
-    fetch('/admin/import_csv', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    postCSVImport(file)
+    .then(data => data.job_id ?
+        waitForImportJob(data.status_url, job => { importBtn.innerHTML = importProgressText(job); }) : data)
     .then(data => {
         if (data.success) {
             showToast(`Successfully imported ${data.imported_count} records`, 'success');
@@ -383,7 +493,7 @@ function importCSV() {
 // Export functions for global access
 window.SecurityApp = {
     simulateQRScan: simulateQRScan,
-    refreshActivityData: refreshActivityData,
+    startLiveFeed: startLiveFeed,
     showToast: showToast,
     formatTimestamp: formatTimestamp,
     analyzeCSV: analyzeCSV,
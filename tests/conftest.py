@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+# The app connects to DATABASE_URL as soon as it is imported, so the tests only run
+# against a scratch PostgreSQL database named explicitly in TEST_DATABASE_URL
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ.setdefault("SCHEMA_CHECK", "create")
+    # Background workers would only add noise to the tables under test
+    for flag in ("IMPORT_JOBS_ENABLED", "USER_INDEX_ENABLED", "TRAFFIC_ROLLUP_ENABLED"):
+        os.environ.setdefault(flag, "false")
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("set TEST_DATABASE_URL to a scratch PostgreSQL database to run these tests")
+    from app import app
+    import security_service  # noqa: F401 - configures the caches from app.config
+    return app
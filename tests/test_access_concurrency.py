@@ -0,0 +1,69 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Odd, so the badge ends up checked in and the counter has something to agree with
+SCANS = 41
+THREADS = 8
+
+
+@pytest.fixture
+def badge(app):
+    """An allowed, checked-out user; removed again with its activity after the test"""
+    from app import db
+    from models import SecurityUser, ActivityLog
+    from security_service import security_service
+
+    qr_code_id = f"RACE-{uuid.uuid4().hex[:8].upper()}"
+    with app.app_context():
+        user = SecurityUser(first_name='Race', last_name='Test', complete_name='Race Test', full_name='Race Test',
+                            barcode=qr_code_id, qr_code_id=qr_code_id, status='allowed', is_checked_in=False)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        security_service.refresh_statistics()
+
+    yield qr_code_id, user_id
+
+    with app.app_context():
+        db.session.execute(db.delete(ActivityLog).where(ActivityLog.security_user_id == user_id))
+        db.session.execute(db.delete(SecurityUser).where(SecurityUser.id == user_id))
+        db.session.commit()
+        security_service.refresh_statistics()
+
+
+def test_concurrent_scans_of_one_badge_alternate(app, badge):
+    from app import db
+    from models import SecurityUser, ActivityLog, UserCounters
+    from security_service import security_service
+
+    qr_code_id, user_id = badge
+
+    def scan(_):
+        with app.app_context():
+            try:
+                return security_service.process_access_attempt(qr_code_id)[0]
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = list(pool.map(scan, range(SCANS)))
+    assert all(results)
+
+    with app.app_context():
+        actions = db.session.execute(
+            db.select(ActivityLog.action)
+            .where(ActivityLog.security_user_id == user_id)
+            .order_by(ActivityLog.timestamp)
+        ).scalars().all()
+        assert len(actions) == SCANS
+        assert actions == [('check_in', 'check_out')[i % 2] for i in range(SCANS)]
+
+        user = db.session.get(SecurityUser, user_id)
+        assert user.is_checked_in is True
+
+        checked_in = db.session.execute(
+            db.select(db.func.count()).where(SecurityUser.is_checked_in.is_(True))
+        ).scalar()
+        assert db.session.get(UserCounters, 1).checked_in_users == checked_in
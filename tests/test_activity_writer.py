@@ -0,0 +1,51 @@
+from activity_writer import ActivityLogWriter
+
+
+class FlakyWriter(ActivityLogWriter):
+    """Writer whose inserts go to a list, failing while fail_inserts is positive or a row is bad"""
+
+    def __init__(self, fail_inserts=0, **kwargs):
+        super().__init__(retry_backoff=0, flush_interval=0.05, **kwargs)
+        self.fail_inserts = fail_inserts
+        self.rows = []
+
+    def _insert(self, rows):
+        if self.fail_inserts > 0:
+            self.fail_inserts -= 1
+            raise RuntimeError('database unavailable')
+        if any(row.get('bad') for row in rows):
+            raise ValueError('bad row')
+        self.rows.extend(rows)
+
+
+def run_writer(writer, rows):
+    writer.start(app=None)
+    for row in rows:
+        assert writer.submit(row)
+    assert writer.flush()
+    writer.stop()
+    return writer.stats()
+
+
+def test_failed_batch_is_retried_until_written():
+    writer = FlakyWriter(fail_inserts=2, batch_size=50)
+    rows = [{'qr_code_id': f'B{i}', 'action': 'denied'} for i in range(20)]
+
+    stats = run_writer(writer, rows)
+
+    assert writer.rows == rows
+    assert stats['written'] == 20
+    assert stats['failed'] == 0
+    assert stats['retries'] == 2
+
+
+def test_batch_that_keeps_failing_is_written_row_by_row():
+    writer = FlakyWriter(batch_size=50)
+    rows = [{'qr_code_id': f'B{i}', 'action': 'denied', 'bad': i == 7} for i in range(20)]
+
+    stats = run_writer(writer, rows)
+
+    assert writer.rows == [row for row in rows if not row['bad']]
+    assert stats['written'] == 19
+    assert stats['failed'] == 1
+    assert stats['row_fallbacks'] == 1
@@ -0,0 +1,37 @@
+import io
+
+from csv_ingest import ENCODING_SAMPLE_SIZE, read_user_csv
+
+HEADER = 'first_name,last_name,barcode\n'
+
+
+def read_names(data):
+    return [fields['complete_name'] for _, fields, error in read_user_csv(io.BytesIO(data)) if not error]
+
+
+def test_non_utf8_byte_after_the_sample_falls_back_to_cp1252():
+    body = ''.join(f'First{i},Last{i},B{i}\n' for i in range(5000))
+    data = (HEADER + body).encode('ascii') + 'José,Peña,B-last\n'.encode('cp1252')
+    assert len(data) - len('José,Peña,B-last\n') > ENCODING_SAMPLE_SIZE
+
+    names = read_names(data)
+
+    assert len(names) == 5001
+    assert names[-1] == 'José Peña'
+
+
+def test_utf8_text_before_the_fallback_is_kept():
+    filler = 'Pat,Doe,B0\n' * (ENCODING_SAMPLE_SIZE // 10)
+    data = (HEADER + 'Zoë,Ünal,B1\n' + filler).encode('utf-8') + 'René,Müller,B2\n'.encode('cp1252')
+
+    names = read_names(data)
+
+    assert names[0] == 'Zoë Ünal'
+    assert names[-1] == 'René Müller'
+
+
+def test_bytes_undefined_in_cp1252_fall_back_to_latin1():
+    filler = 'Pat,Doe,B0\n' * (ENCODING_SAMPLE_SIZE // 10)
+    data = (HEADER + filler).encode('ascii') + b'Ann\x81,Lee,B1\n'
+
+    assert read_names(data)[-1] == 'Ann\x81 Lee'
@@ -0,0 +1,50 @@
+import os
+from io import BytesIO
+
+import pytest
+
+from pictures import PictureProcessor, PICTURE_SIZES, variant_filename
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def make_jpeg(size=(1600, 1200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_gate_size_exists_when_save_returns(tmp_path):
+    processor = PictureProcessor()
+    processor.save(make_jpeg(), tmp_path, 'abc.jpg')
+
+    with Image.open(tmp_path / 'abc.jpg') as image:
+        assert max(image.size) == 300
+
+    processor.settle('abc.jpg')
+    with Image.open(tmp_path / 'abc_thumb.jpg') as image:
+        assert max(image.size) == 100
+    processor.shutdown()
+
+
+def test_settled_picture_can_be_deleted_without_files_coming_back(tmp_path):
+    processor = PictureProcessor(workers=1)
+    for i in range(5):
+        processor.save(make_jpeg(), tmp_path, f'{i}.jpg')
+        processor.settle(f'{i}.jpg')
+        for suffix, _ in PICTURE_SIZES:
+            path = tmp_path / variant_filename(f'{i}.jpg', suffix)
+            if path.exists():
+                os.remove(path)
+    processor.shutdown()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_undecodable_upload_is_rejected_before_anything_is_written(tmp_path):
+    processor = PictureProcessor()
+    with pytest.raises(Exception):
+        processor.save(make_jpeg()[:200], tmp_path, 'broken.jpg')
+    processor.shutdown()
+
+    assert not (tmp_path / 'broken.jpg').exists()
@@ -0,0 +1,36 @@
+import uuid
+
+
+def _names(roll_call):
+    return {occupant.full_name
+            for company in roll_call['companies']
+            for role in company['roles']
+            for occupant in role['occupants']}
+
+
+def test_muster_sees_check_ins_the_mirror_has_not(app):
+    """A check-in handled by another worker shows up in the muster before the next resync"""
+    from app import db
+    from models import SecurityUser
+    from presence import presence_board
+    from security_service import security_service
+
+    name = f"Muster {uuid.uuid4().hex[:8]}"
+    with app.app_context():
+        security_service.get_roll_call(fresh=True)  # mirror freshly loaded, not due for a resync
+        user = SecurityUser(first_name='Muster', last_name='Test', complete_name=name, full_name=name,
+                            barcode=name, qr_code_id=name, status='allowed', is_checked_in=True,
+                            company='Muster Co')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        try:
+            assert not presence_board.is_stale()
+            assert name not in _names(security_service.get_roll_call())
+            muster = security_service.get_roll_call(fresh=True)
+            assert name in _names(muster)
+            assert muster['total'] == sum(company['count'] for company in muster['companies'])
+        finally:
+            db.session.execute(db.delete(SecurityUser).where(SecurityUser.id == user_id))
+            db.session.commit()
+            presence_board.invalidate()
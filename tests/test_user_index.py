@@ -0,0 +1,51 @@
+import random
+
+from user_index import UserSearchIndex, IndexedUser
+
+FIRST_NAMES = ['John', 'Joan', 'Johnny', 'Maria', 'Mark', 'Marco', 'Ana', 'Andrew', 'Achmed']
+LAST_NAMES = ['Santos', 'Cruz', 'Cruzado', 'Smith', 'Smithers', 'Castillo', 'Villanueva']
+COMPANIES = ['Acme Security', 'Acero Builders', 'Pacific Marine', None]
+QUERIES = ['jo', 'ma', 'ac', 'john', 'cruz', 'ill', 'mar cru', 'john sm', 'sm', 'qr-0042']
+
+
+def make_user(i, rng):
+    return IndexedUser(f"u{i:04d}", f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"QR-{i:04d}",
+                       f"ID{rng.randrange(1000):04d}", rng.choice(COMPANIES), 'allowed')
+
+
+def test_cached_tiers_follow_upserts_and_removals():
+    rng = random.Random(7)
+    users = {i: make_user(i, rng) for i in range(2000)}
+    index = UserSearchIndex()
+    index.build(users.values())
+    for query in QUERIES:
+        index.search(query)  # caches the broad tiers
+
+    for _ in range(300):
+        i = rng.randrange(2200)
+        if i in users and rng.random() < 0.3:
+            del users[i]
+            index.remove(f"u{i:04d}")
+        else:
+            users[i] = make_user(i, rng)
+            index.upsert(users[i])
+
+    fresh = UserSearchIndex()
+    fresh.build(users.values())
+    assert index.stats()['cached_tier_entries'] > 0
+    for query in QUERIES:
+        assert index.search(query, limit=25) == fresh.search(query, limit=25), query
+
+
+def test_rebuild_keeps_results_and_cached_tiers():
+    rng = random.Random(3)
+    users = [make_user(i, rng) for i in range(1000)]
+    index = UserSearchIndex()
+    index.build(users)
+    before = {query: index.search(query) for query in QUERIES}
+    cached = index.stats()['cached_tiers']
+
+    index.build(users)
+
+    assert index.stats()['cached_tiers'] == cached
+    assert {query: index.search(query) for query in QUERIES} == before
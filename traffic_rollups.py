@@ -0,0 +1,318 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+# Dimensions a traffic report can be broken down by (TrafficCounts columns)
+GROUP_BY = ('company', 'role', 'operator')
+GRANULARITIES = ('hour', 'day')
+
+# Actions counted by the rollups; bulk imports and other admin entries are not traffic
+COUNTED_ACTIONS = ('check_in', 'check_out', 'access_denied')
+
+# Arbitrary key for the advisory lock that keeps workers from refreshing at the same time
+_ADVISORY_LOCK_KEY = 741_520_025
+
+
+def floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class TrafficRollups:
+    """Hourly and daily scan counts per company, role and operator.
+
+    refresh() re-aggregates activity_logs into traffic_hourly, then sums the
+    touched days into traffic_daily, and records how far it got in
+    traffic_rollup_state. Each run recomputes whole hours starting `lag`
+    seconds before that watermark, so it is idempotent and picks up rows the
+    batched activity writer committed late. A first run over a long history
+    goes chunk_hours at a time, one transaction each.
+
+    report() reads the rollup tables and adds the raw rows logged since the
+    watermark, so answers are current while the work per query follows the
+    number of buckets rather than the number of scans.
+    """
+
+    def __init__(self, interval=60, lag=300, chunk_hours=168):
+        self.interval = interval
+        self.lag = lag
+        self.chunk_hours = chunk_hours
+        self._app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'refreshes': 0,
+            'hours_recomputed': 0,
+            'errors': 0,
+            'last_error': None,
+            'last_refresh_ms': 0.0,
+            'max_refresh_ms': 0.0,
+            'reports': 0,
+            'last_report_ms': 0.0,
+            'max_report_ms': 0.0,
+        }
+
+    def configure(self, interval=None, lag=None, chunk_hours=None):
+        if interval is not None:
+            self.interval = interval
+        if lag is not None:
+            self.lag = lag
+        if chunk_hours is not None:
+            self.chunk_hours = chunk_hours
+
+    @staticmethod
+    def _bucket(db, column, granularity):
+        """SQL expression truncating a timestamp column to its hour or day"""
+        if db.engine.dialect.name == 'postgresql':
+            return db.func.date_trunc('hour', column) if granularity == 'hour' else db.cast(column, db.Date)
+        return db.func.strftime('%Y-%m-%d %H:00:00', column) if granularity == 'hour' else db.func.date(column)
+
+    @staticmethod
+    def _as_bucket(value, granularity):
+        """Normalize a bucket value (SQLite returns strings) to datetime or date"""
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if granularity == 'day' and isinstance(value, datetime):
+            return value.date()
+        return value
+
+    def _activity_counts(self, db, granularity, dimensions, start, end):
+        """SELECT of activity_logs grouped by bucket and the given dimensions, over [start, end)"""
+        from models import ActivityLog, SecurityUser
+
+        columns = {
+            'company': db.func.coalesce(SecurityUser.company, ''),
+            'role': db.func.coalesce(ActivityLog.user_role, ''),
+            'operator': db.func.coalesce(ActivityLog.operator_name, ''),
+        }
+        bucket = self._bucket(db, ActivityLog.timestamp, granularity).label('bucket')
+        groups = [columns[name].label(name) for name in dimensions]
+        statement = db.select(
+            bucket, *groups,
+            db.func.count().filter(ActivityLog.action == 'check_in').label('check_ins'),
+            db.func.count().filter(ActivityLog.action == 'check_out').label('check_outs'),
+            db.func.count().filter(ActivityLog.action == 'access_denied').label('denials'),
+        ).where(
+            ActivityLog.timestamp >= start,
+            ActivityLog.timestamp < end,
+            ActivityLog.action.in_(COUNTED_ACTIONS),
+        ).group_by(bucket, *groups)
+        if 'company' in dimensions:
+            statement = statement.outerjoin(SecurityUser, SecurityUser.id == ActivityLog.security_user_id)
+        return statement
+
+    def _recompute(self, db, conn, start, end):
+        """Replace the hourly rows for [start, end) and the daily rows of the days they touch"""
+        from models import TrafficHourly, TrafficDaily
+
+        conn.execute(db.delete(TrafficHourly).where(TrafficHourly.bucket >= start, TrafficHourly.bucket < end))
+        conn.execute(db.insert(TrafficHourly).from_select(
+            ['bucket', *GROUP_BY, 'check_ins', 'check_outs', 'denials'],
+            self._activity_counts(db, 'hour', GROUP_BY, start, end),
+        ))
+
+        first_day = start.date()
+        last_day = (end - timedelta(microseconds=1)).date() + timedelta(days=1)
+        day = self._bucket(db, TrafficHourly.bucket, 'day').label('bucket')
+        conn.execute(db.delete(TrafficDaily).where(TrafficDaily.bucket >= first_day, TrafficDaily.bucket < last_day))
+        conn.execute(db.insert(TrafficDaily).from_select(
+            ['bucket', *GROUP_BY, 'check_ins', 'check_outs', 'denials'],
+            db.select(
+                day, TrafficHourly.company, TrafficHourly.role, TrafficHourly.operator,
+                db.func.sum(TrafficHourly.check_ins), db.func.sum(TrafficHourly.check_outs),
+                db.func.sum(TrafficHourly.denials),
+            ).where(
+                TrafficHourly.bucket >= datetime.combine(first_day, datetime.min.time()),
+                TrafficHourly.bucket < datetime.combine(last_day, datetime.min.time()),
+            ).group_by(day, TrafficHourly.company, TrafficHourly.role, TrafficHourly.operator),
+        ))
+
+    @staticmethod
+    def _store_watermark(db, conn, through):
+        from models import TrafficRollupState
+
+        updated = conn.execute(db.update(TrafficRollupState).where(TrafficRollupState.id == 1)
+                               .values(rolled_up_through=through, updated_at=datetime.now()))
+        if updated.rowcount == 0:
+            conn.execute(db.insert(TrafficRollupState).values(id=1, rolled_up_through=through,
+                                                              updated_at=datetime.now()))
+
+    def rolled_up_through(self, db, conn=None):
+        from models import TrafficRollupState
+
+        statement = db.select(TrafficRollupState.rolled_up_through).where(TrafficRollupState.id == 1)
+        if conn is not None:
+            return conn.execute(statement).scalar()
+        return db.session.execute(statement).scalar()
+
+    def refresh(self, now=None, rebuild_from=None):
+        """Bring the rollups up to now; returns the number of hours recomputed.
+
+        rebuild_from (a datetime) recomputes everything from that moment, e.g.
+        after correcting old activity rows.
+        """
+        from app import db
+        from models import ActivityLog
+
+        now = now or datetime.now()
+        started = time.perf_counter()
+        hours = 0
+        try:
+            while True:
+                with db.engine.begin() as conn:
+                    if db.engine.dialect.name == 'postgresql' and not conn.execute(
+                            text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': _ADVISORY_LOCK_KEY}).scalar():
+                        return hours  # another worker is refreshing
+                    if rebuild_from is not None:
+                        start, rebuild_from = floor_hour(rebuild_from), None
+                    else:
+                        through = self.rolled_up_through(db, conn)
+                        if through is None:
+                            oldest = conn.execute(db.select(db.func.min(ActivityLog.timestamp))).scalar()
+                            start = floor_hour(oldest or now)
+                        else:
+                            start = floor_hour(through - timedelta(seconds=self.lag))
+                    end = min(floor_hour(now) + timedelta(hours=1), start + timedelta(hours=self.chunk_hours))
+                    through = min(now, end)
+                    self._recompute(db, conn, start, end)
+                    self._store_watermark(db, conn, through)
+                hours += int((end - start).total_seconds() // 3600)
+                if through >= now:
+                    break
+        except Exception as e:
+            with self._lock:
+                self._metrics['errors'] += 1
+                self._metrics['last_error'] = str(e)
+            logging.error("Traffic rollup refresh failed: %s", e)
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            m = self._metrics
+            m['refreshes'] += 1
+            m['hours_recomputed'] += hours
+            m['last_refresh_ms'] = round(elapsed_ms, 2)
+            m['max_refresh_ms'] = round(max(m['max_refresh_ms'], elapsed_ms), 2)
+        return hours
+
+    def report(self, start, end, granularity='hour', group_by=None):
+        """Check-ins, check-outs and denials per bucket (and group) for the days start..end inclusive.
+
+        Returns {'series': [...], 'groups': [...], 'totals': {...}, 'rolled_up_through': ...};
+        groups are ordered by check-ins, the busiest first. An unknown group value is None.
+        """
+        from app import db
+        from models import TrafficHourly, TrafficDaily
+
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+
+        started = time.perf_counter()
+        dimensions = (group_by,) if group_by else ()
+        start_at = datetime.combine(start, datetime.min.time())
+        end_at = datetime.combine(end + timedelta(days=1), datetime.min.time())
+        table = TrafficHourly if granularity == 'hour' else TrafficDaily
+        lower, upper = (start_at, end_at) if granularity == 'hour' else (start, end + timedelta(days=1))
+
+        groups = [getattr(table, name) for name in dimensions]
+        rollup_rows = db.session.execute(
+            db.select(table.bucket, *groups, db.func.sum(table.check_ins), db.func.sum(table.check_outs),
+                      db.func.sum(table.denials))
+            .where(table.bucket >= lower, table.bucket < upper)
+            .group_by(table.bucket, *groups)
+        ).all()
+
+        # Scans logged since the last refresh are counted straight from activity_logs
+        through = self.rolled_up_through(db)
+        tail_rows = []
+        if through is None or through < end_at:
+            tail_rows = db.session.execute(
+                self._activity_counts(db, granularity, dimensions, max(through or start_at, start_at), end_at)
+            ).all()
+
+        counts = {}
+        for row in (*rollup_rows, *tail_rows):
+            key = (self._as_bucket(row[0], granularity), row[1] if group_by else None)
+            entry = counts.setdefault(key, [0, 0, 0])
+            for i, value in enumerate(row[-3:]):
+                entry[i] += int(value or 0)
+
+        group_check_ins = {}
+        totals = {'check_ins': 0, 'check_outs': 0, 'denials': 0}
+        series = []
+        for (bucket, group), (check_ins, check_outs, denials) in sorted(
+                counts.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            group_check_ins[group] = group_check_ins.get(group, 0) + check_ins
+            totals['check_ins'] += check_ins
+            totals['check_outs'] += check_outs
+            totals['denials'] += denials
+            series.append({'bucket': bucket, 'group': group or None, 'check_ins': check_ins,
+                           'check_outs': check_outs, 'denials': denials})
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            m = self._metrics
+            m['reports'] += 1
+            m['last_report_ms'] = round(elapsed_ms, 2)
+            m['max_report_ms'] = round(max(m['max_report_ms'], elapsed_ms), 2)
+        return {
+            'series': series,
+            'groups': [group or None for group, _ in sorted(group_check_ins.items(), key=lambda item: -item[1])]
+                      if group_by else [],
+            'totals': totals,
+            'rolled_up_through': through,
+            'elapsed_ms': round(elapsed_ms, 2),
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Refresh now and then every `interval` seconds on a background thread"""
+        if self.running:
+            return
+        self._app = app
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='traffic-rollups', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        if not self.running:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._app.app_context():
+                try:
+                    self.refresh()
+                except Exception:
+                    pass  # counted and logged by refresh(); try again next interval
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def stats(self):
+        with self._lock:
+            m = dict(self._metrics)
+        m.update({
+            'running': self.running,
+            'interval_seconds': self.interval,
+            'lag_seconds': self.lag,
+        })
+        return m
+
+
+# Global rollup instance
+traffic_rollups = TrafficRollups()
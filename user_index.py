@@ -0,0 +1,417 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+
+# What a typeahead result shows; status changes are pushed in by the service
+IndexedUser = namedtuple('IndexedUser', ['id', 'full_name', 'qr_code_id', 'id_number', 'company', 'status'])
+
+_WORD = re.compile(r'[^\W_]+')
+MIN_QUERY_LENGTH = 2
+TERM_CACHE_SIZE = 256
+# Terms whose matches are worth caching; narrower ones are cheap to recompute per query
+CACHE_MIN_MATCHES = 32
+# Upper bound on the users held by all cached tiers together (list slots, not copies)
+TIER_CACHE_ENTRIES = 2_000_000
+# Another query term held by at most this many times the users of the first term is collected
+# into a set to skip candidates early; a broader term matches most candidates anyway
+FILTER_RATIO = 4
+
+# Match quality of a query term against a token
+_EXACT, _PREFIX, _SUBSTRING = 3, 2, 1
+
+
+def _grams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _tokens(user):
+    """Searchable tokens: words of the name, company, badge and ID number, plus whole codes.
+
+    Whole codes only serve exact lookups of a badge or ID number typed with its
+    punctuation; they stay out of the trigram and prefix postings.
+    """
+    tokens = set()
+    for text in (user.full_name, user.company, user.qr_code_id, user.id_number):
+        if text:
+            tokens.update(_WORD.findall(text.lower()))
+    for code in (user.qr_code_id, user.id_number):
+        if code:
+            tokens.add(code.lower())
+    return tokens
+
+
+def _token_quality(term, token):
+    """Match quality of a query term against one token (0 if none)"""
+    if token == term:
+        return _EXACT
+    if token.startswith(term):
+        return _PREFIX
+    if len(term) >= 3 and term in token:
+        return _SUBSTRING
+    return 0
+
+
+def _discard_sorted(ordered, key):
+    index = bisect.bisect_left(ordered, key)
+    if index < len(ordered) and ordered[index] == key:
+        del ordered[index]
+        return True
+    return False
+
+
+def _term_quality(term, tokens):
+    """Best match quality of a query term against a user's tokens (0 if none)"""
+    best = 0
+    for token in tokens:
+        if token == term:
+            return _EXACT
+        if token.startswith(term):
+            best = _PREFIX
+        elif best < _SUBSTRING and len(term) >= 3 and term in token:
+            best = _SUBSTRING
+    return best
+
+
+class UserSearchIndex:
+    """In-memory trigram/prefix index over names, badges, ID numbers and companies.
+
+    Postings go trigram -> tokens -> users, so each distinct token is indexed
+    once no matter how many people share it. Terms of three or more characters
+    are matched as substrings through their trigrams; shorter terms as token
+    prefixes. The index is per worker: the service updates it on every user
+    mutation it handles and rebuilds it every rebuild_interval seconds to pick
+    up changes made by other workers.
+
+    Broad terms keep their matching users sorted by name per match quality.
+    Mutations update those lists in place (a bisect per cached list), so a
+    short prefix stays fast between upserts instead of being re-sorted.
+    """
+
+    def __init__(self, rebuild_interval=300):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._reset()
+        self._built_at = None
+        self._rebuilding = False
+        self._pending = None  # mutations made while a rebuild is running
+
+    def _reset(self):
+        self._users = {}        # user id -> IndexedUser
+        self._sort_keys = {}    # user id -> (lowercased name, user id), the order within a tier
+        self._user_tokens = {}  # user id -> set of tokens
+        self._token_users = {}  # token -> set of user ids
+        self._tier_order = {}   # query term -> {quality: sorted sort keys}, kept current by _add/_remove
+        self._tier_entries = 0  # total length of the lists in _tier_order
+        self._term_tokens = {}  # query term -> ({quality: tokens}, users), for broad terms
+        self._gram_tokens = {}  # trigram -> set of tokens
+        self._prefix_tokens = {}  # 1-2 character prefix -> set of tokens
+
+    @property
+    def ready(self):
+        return self._built_at is not None
+
+    def is_stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.rebuild_interval
+
+    def build(self, users):
+        """Replace the index with users (an iterable of IndexedUser)"""
+        with self._lock:
+            warm = [(term, list(tiers)) for term, tiers in self._tier_order.items()]
+        fresh = UserSearchIndex.__new__(UserSearchIndex)
+        fresh._reset()
+        for user in users:
+            fresh._add(user)
+        # Sort the tiers in use now, so the first searches after a rebuild are not the slow ones
+        for term, qualities in warm:
+            tiers, _ = fresh._matching_tokens(term)
+            for quality in qualities:
+                if quality in tiers:
+                    fresh._ordered_tier(term, quality, tiers[quality])
+
+        with self._lock:
+            pending, self._pending = self._pending or [], None
+            self._users, self._user_tokens = fresh._users, fresh._user_tokens
+            self._sort_keys = fresh._sort_keys
+            self._token_users, self._gram_tokens = fresh._token_users, fresh._gram_tokens
+            self._tier_order, self._tier_entries = fresh._tier_order, fresh._tier_entries
+            self._term_tokens = fresh._term_tokens
+            self._prefix_tokens = fresh._prefix_tokens
+            # Re-apply changes that raced with the rebuild
+            for action, value in pending:
+                if action == 'upsert':
+                    self._add(value)
+                else:
+                    self._remove(value)
+            self._built_at = time.monotonic()
+            self._rebuilding = False
+
+    def start_rebuild(self):
+        """Claim the rebuild; returns False if one is already running"""
+        with self._lock:
+            if self._rebuilding:
+                return False
+            self._rebuilding = True
+            self._pending = []
+            return True
+
+    def abort_rebuild(self):
+        with self._lock:
+            self._rebuilding = False
+            self._pending = None
+
+    def upsert(self, user):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(('upsert', user))
+            self._add(user)
+
+    def remove(self, user_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(('remove', user_id))
+            self._remove(user_id)
+
+    def _add(self, user):
+        """Index a user, replacing what was indexed under its id before"""
+        self._set_user(user.id, user)
+
+    def _remove(self, user_id):
+        self._set_user(user_id, None)
+
+    def _set_user(self, user_id, user):
+        # Only the tokens that changed touch the postings, so re-indexing a user whose
+        # badge and name are unchanged leaves every cached term intact
+        old_key = self._sort_keys.pop(user_id, None)
+        old_tokens = self._user_tokens.pop(user_id, set())
+        self._users.pop(user_id, None)
+        new_key, new_tokens = None, set()
+        if user is not None:
+            new_key = ((user.full_name or '').lower(), user_id)
+            new_tokens = _tokens(user)
+            self._users[user_id] = user
+            self._sort_keys[user_id] = new_key
+            self._user_tokens[user_id] = new_tokens
+        if old_key != new_key or old_tokens != new_tokens:
+            self._update_tiers(old_key, old_tokens, new_key, new_tokens)
+        for token in old_tokens - new_tokens:
+            self._unlink(user_id, token)
+        for token in new_tokens - old_tokens:
+            self._link(user_id, token)
+
+    def _link(self, user_id, token):
+        holders = self._token_users.get(token)
+        if holders is None:
+            holders = self._token_users[token] = set()
+            # Whole codes only serve exact lookups
+            if _WORD.fullmatch(token):
+                for gram in _grams(token):
+                    self._gram_tokens.setdefault(gram, set()).add(token)
+                for length in (1, 2):
+                    self._prefix_tokens.setdefault(token[:length], set()).add(token)
+                self._forget_terms(token)
+        holders.add(user_id)
+
+    def _unlink(self, user_id, token):
+        holders = self._token_users.get(token)
+        if holders is None:
+            return
+        holders.discard(user_id)
+        if holders:
+            return
+        # Last holder gone: drop the token from the gram and prefix postings
+        del self._token_users[token]
+        for gram in _grams(token):
+            self._discard(self._gram_tokens, gram, token)
+        for length in (1, 2):
+            self._discard(self._prefix_tokens, token[:length], token)
+        self._forget_terms(token)
+
+    def _update_tiers(self, old_key, old_tokens, new_key, new_tokens):
+        """Move a user's sort key between the cached tiers its old and new tokens fall in"""
+        if not self._tier_order:
+            return
+        old_words = [token for token in old_tokens if _WORD.fullmatch(token)]
+        new_words = [token for token in new_tokens if _WORD.fullmatch(token)]
+        moved = old_key != new_key
+        for term, tiers in self._tier_order.items():
+            was = {_token_quality(term, token) for token in old_words}
+            now = {_token_quality(term, token) for token in new_words}
+            for quality, ordered in tiers.items():
+                if quality in was and (moved or quality not in now):
+                    if _discard_sorted(ordered, old_key):
+                        self._tier_entries -= 1
+                if quality in now and (moved or quality not in was):
+                    bisect.insort(ordered, new_key)
+                    self._tier_entries += 1
+
+    def _forget_terms(self, token):
+        """Drop cached token matches of terms that a token just appeared in or disappeared from"""
+        for term in [term for term in self._term_tokens if _token_quality(term, token)]:
+            del self._term_tokens[term]
+
+    @staticmethod
+    def _discard(postings, key, token):
+        tokens = postings.get(key)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del postings[key]
+
+    def _matching_tokens(self, term):
+        """Tokens matching one query term grouped by match quality, and how many users hold them"""
+        cached = self._term_tokens.get(term)
+        if cached is not None:
+            return cached
+        tiers = {}
+        for token, quality in self._find_tokens(term).items():
+            tiers.setdefault(quality, []).append(token)
+        matches = (tiers, sum(len(self._token_users[token]) for tokens in tiers.values() for token in tokens))
+        # Only broad terms are worth keeping; narrow ones are cheap to redo
+        if sum(map(len, tiers.values())) > CACHE_MIN_MATCHES:
+            if len(self._term_tokens) >= TERM_CACHE_SIZE:
+                del self._term_tokens[next(iter(self._term_tokens))]
+            self._term_tokens[term] = matches
+        return matches
+
+    def _find_tokens(self, term):
+        if len(term) < 3:
+            candidates = self._prefix_tokens.get(term[:2], ())
+            return {token: _EXACT if token == term else _PREFIX
+                    for token in candidates if token.startswith(term)}
+
+        postings = sorted((self._gram_tokens.get(gram, set()) for gram in _grams(term)), key=len)
+        if not postings or not postings[0]:
+            return {}
+        candidates = postings[0].intersection(*postings[1:])
+        matches = {}
+        for token in candidates:
+            if token == term:
+                matches[token] = _EXACT
+            elif token.startswith(term):
+                matches[token] = _PREFIX
+            elif term in token:
+                matches[token] = _SUBSTRING
+        return matches
+
+    def search(self, query, limit=10):
+        """Ranked users matching every word of the query"""
+        terms = list(dict.fromkeys(_WORD.findall((query or '').lower())))
+        if not terms or len(''.join(terms)) < MIN_QUERY_LENGTH:
+            return []
+        # A badge is often typed whole, punctuation included; a single-word
+        # query already ranks its exact token first
+        whole = (query or '').strip().lower()
+        code = whole if whole not in terms else None
+
+        with self._lock:
+            # Expand only the most selective term through the postings; the
+            # other terms are checked against that term's candidates directly
+            matches = [(term, self._matching_tokens(term)) for term in terms]
+            matches.sort(key=lambda match: match[1][1])
+            if not all(term_tiers for _, (term_tiers, _) in matches):
+                return []
+            first_term, (tiers, first_users) = matches[0]
+
+            others = [term for term, _ in matches[1:]]
+            # Best total the other terms can add to a first-term match
+            headroom = sum(max(term_tiers) for _, (term_tiers, _) in matches[1:])
+            # Users holding the narrow other terms; a first-term candidate outside them cannot match
+            allowed = None
+            for _, (term_tiers, users) in matches[1:]:
+                if users <= first_users * FILTER_RATIO:
+                    holders = set().union(*(self._token_users[token]
+                                            for tokens in term_tiers.values() for token in tokens))
+                    allowed = holders if allowed is None else allowed & holders
+            best = []  # (-score, name, user id), kept sorted and at most limit long
+            seen = set()
+
+            def consider(user_id, score):
+                seen.add(user_id)
+                tokens = self._user_tokens[user_id]
+                for term in others:
+                    term_quality = _term_quality(term, tokens)
+                    if not term_quality:
+                        return
+                    score += term_quality
+                if code in tokens:
+                    score += 10
+                bisect.insort(best, (-score, self._sort_keys[user_id][0], user_id))
+                del best[limit:]
+
+            # Exact badge or ID number matches rank first; score them up front
+            # so the walk below never has to allow for the bonus
+            for user_id in self._token_users.get(code, ()):
+                quality = _term_quality(first_term, self._user_tokens[user_id])
+                if quality:
+                    consider(user_id, quality)
+
+            # Walk the first term's tokens best tier first, each tier in name
+            # order, so the page usually fills without scoring every candidate
+            for quality in sorted(tiers, reverse=True):
+                ceiling = quality + headroom
+                for name, user_id in self._ordered_tier(first_term, quality, tiers[quality]):
+                    if len(best) == limit and (-best[-1][0], name) >= (ceiling, best[-1][1]):
+                        break
+                    if user_id not in seen and (allowed is None or user_id in allowed):
+                        consider(user_id, quality)
+            return [self._users[user_id] for _, _, user_id in best]
+
+    def _ordered_tier(self, term, quality, tokens):
+        """Sort keys of the users holding any of a term's tokens of one match quality, in name order.
+
+        Broad tiers are cached and kept current by _add/_remove; the most
+        recently used stay cached within TERM_CACHE_SIZE and TIER_CACHE_ENTRIES.
+        """
+        tiers = self._tier_order.get(term)
+        if tiers is not None:
+            # Move the term to the end so eviction takes the least recently used
+            self._tier_order[term] = self._tier_order.pop(term)
+            ordered = tiers.get(quality)
+            if ordered is not None:
+                return ordered
+
+        holders = set().union(*(self._token_users[token] for token in tokens))
+        ordered = sorted(map(self._sort_keys.__getitem__, holders))
+        if CACHE_MIN_MATCHES < len(ordered) <= TIER_CACHE_ENTRIES:
+            while self._tier_order and (len(self._tier_order) >= TERM_CACHE_SIZE and term not in self._tier_order
+                                        or self._tier_entries + len(ordered) > TIER_CACHE_ENTRIES):
+                evicted = self._tier_order.pop(next(iter(self._tier_order)))
+                self._tier_entries -= sum(map(len, evicted.values()))
+            self._tier_order.setdefault(term, {})[quality] = ordered
+            self._tier_entries += len(ordered)
+        return ordered
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self._built_at is not None,
+                'users': len(self._users),
+                'tokens': len(self._token_users),
+                'trigrams': len(self._gram_tokens),
+                'cached_tiers': sum(map(len, self._tier_order.values())),
+                'cached_tier_entries': self._tier_entries,
+                'age_seconds': round(time.monotonic() - self._built_at, 1) if self._built_at else None,
+            }
+
+
+# Global search index
+user_index = UserSearchIndex()
+
+
+def rebuild_user_index(app, load_users):
+    """Rebuild the index from the database; safe to call from a background thread"""
+    if not user_index.start_rebuild():
+        return False
+    started = time.perf_counter()
+    try:
+        with app.app_context():
+            user_index.build(load_users())
+    except Exception as e:
+        user_index.abort_rebuild()
+        logging.error("User search index rebuild failed: %s", e)
+        return False
+    logging.info("User search index rebuilt in %.2fs", time.perf_counter() - started)
+    return True